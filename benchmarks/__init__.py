@@ -0,0 +1,4 @@
+"""Benchmarks of zipapp-utils, run with `python -m benchmarks --help`.
+
+Everything runs offline on synthetic source trees (see trees.py), the
+results are written as JSON so runs can be compared over time."""
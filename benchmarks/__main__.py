@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Run the benchmarks: python -m benchmarks --help"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+from .suite import PAYLOAD_BENCHMARKS, TREE_BENCHMARKS, environment, make_payload
+from .trees import PRESETS, cached_tree
+
+
+def default_workdir() -> Path:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_home) / 'zipapp-utils' / 'benchmarks'
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmark zipapp-utils on synthetic source trees',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        '--trees',
+        default='tiny,small',
+        help=f'Comma separated tree presets, of {", ".join(PRESETS)}',
+    )
+    parser.add_argument(
+        '--benchmarks',
+        default=','.join([*TREE_BENCHMARKS, *PAYLOAD_BENCHMARKS]),
+        help='Comma separated benchmarks to run',
+    )
+    parser.add_argument(
+        '--repeat', '-n', type=int, default=3, help='Runs of every benchmark'
+    )
+    parser.add_argument(
+        '--payload-size',
+        type=int,
+        default=64,
+        metavar='MB',
+        help='Size of the payload of the encode benchmark',
+    )
+    parser.add_argument(
+        '--workdir',
+        type=Path,
+        default=default_workdir(),
+        help='Where trees are generated (and kept) and archives are built',
+    )
+    parser.add_argument(
+        '--output', '-o', type=Path, help='Write the results here (default: stdout)'
+    )
+    parser.add_argument(
+        '--compare',
+        type=Path,
+        metavar='BASELINE',
+        help='Print the ratio of every median to the one in BASELINE, '
+        'the output of an earlier run',
+    )
+    return parser.parse_args()
+
+
+def result_key(record: dict) -> str:
+    return json.dumps(
+        [record.get('tree'), record['benchmark'], record['params']], sort_keys=True
+    )
+
+
+def compare(results: list[dict], baseline: list[dict]) -> str:
+    before = {result_key(record): record['median'] for record in baseline}
+    lines = [f'{"baseline":>9} {"now":>9} {"ratio":>6}  benchmark']
+    for record in results:
+        old = before.get(result_key(record))
+        if old is None:
+            continue
+        params = ' '.join(f'{key}={value}' for key, value in record['params'].items())
+        lines.append(
+            f'{old:9.4f} {record["median"]:9.4f} {record["median"] / old:6.2f}  '
+            f'{record.get("tree") or "-"} {record["benchmark"]} {params}'
+        )
+    return '\n'.join(lines)
+
+
+def main() -> None:
+    args = get_args()
+    selected = args.benchmarks.split(',')
+    unknown = set(selected) - {*TREE_BENCHMARKS, *PAYLOAD_BENCHMARKS}
+    if unknown:
+        raise SystemExit(f'Unknown benchmarks: {", ".join(sorted(unknown))}')
+    build_dir = args.workdir / 'build'
+    build_dir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    for preset in args.trees.split(','):
+        tree, stats = cached_tree(args.workdir, PRESETS[preset])
+        for name in selected:
+            if name not in TREE_BENCHMARKS:
+                continue
+            print(f'{name} on {preset} ({stats["files"]} files)', file=sys.stderr)
+            for record in TREE_BENCHMARKS[name](tree, build_dir, args.repeat):
+                results.append({'tree': preset, **stats, **record})
+    if any(name in PAYLOAD_BENCHMARKS for name in selected):
+        payload = build_dir / f'payload-{args.payload_size}.bin'
+        if not payload.is_file():
+            make_payload(payload, args.payload_size * 1024 * 1024)
+        for name in selected:
+            if name in PAYLOAD_BENCHMARKS:
+                print(f'{name} ({args.payload_size} MB)', file=sys.stderr)
+                results.extend(
+                    PAYLOAD_BENCHMARKS[name](payload, build_dir, args.repeat)
+                )
+
+    report = json.dumps({'environment': environment(), 'results': results}, indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        args.output.write_text(report)
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text())['results']
+        print(compare(results, baseline), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
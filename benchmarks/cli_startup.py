@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Startup budget of the command line: python -m benchmarks.cli_startup
+
+Runs zau with the arguments of every case in a new interpreter, checks the
+modules it imported against what the case may import, and its median time
+against the budget of the case, a multiple of the median time of an
+interpreter that only imports argparse (BASELINE), so the budgets hold on
+slower and faster machines alike. Exits with status 1 if a case is over
+budget or imported more than it may.
+
+The imports alone are checked by tests/test_cli_startup.py."""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+
+# runs zau, then writes the names of the imported modules to stderr
+RUNNER = '''\
+import sys
+from zipapp_utils.cli import main
+sys.argv = ['zau', *sys.argv[1:]]
+try:
+    main()
+except SystemExit:
+    pass
+sys.stderr.write('\\n'.join(sys.modules))
+'''
+
+# what every case does at least: start python and import argparse
+BASELINE = 'import argparse'
+
+# modules that are expensive to import, or pull in much more
+HEAVY_MODULES = [
+    'concurrent.futures',
+    'jinja2',
+    'json',
+    'logging',
+    'pathlib',
+    'subprocess',
+    'tempfile',
+    'zipfile',
+]
+
+
+@dataclass(frozen=True)
+class Case:
+    """A command line, how many times as long as BASELINE it may take, and
+    the modules of zipapp_utils and of HEAVY_MODULES it may import."""
+
+    args: tuple[str, ...]
+    budget: float
+    allowed: frozenset[str] = frozenset()
+
+
+CASES = [
+    Case(('--help',), budget=2.5),
+    Case(('--version',), budget=2.5),
+    Case(
+        ('create-archive', '--help'),
+        budget=4.0,
+        allowed=frozenset(
+            [
+                'zipapp_utils.arg_handlers',
+                'zipapp_utils.config',
+                'zipapp_utils.filters',
+                'zipapp_utils.layout',
+                'json',
+                'pathlib',
+                'zipfile',
+            ]
+        ),
+    ),
+]
+ALWAYS_ALLOWED = {'zipapp_utils', 'zipapp_utils.cli', 'zipapp_utils.parsers_util'}
+
+
+def median_ms(argv: list[str], repeat: int) -> float:
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds) * 1000
+
+
+def imported_modules(args: tuple[str, ...]) -> set[str]:
+    process = subprocess.run(
+        [sys.executable, '-c', RUNNER, *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    return set(process.stderr.splitlines())
+
+
+def unexpected_modules(case: Case, modules: set[str]) -> list[str]:
+    imported = {name for name in modules if name.split('.')[0] == 'zipapp_utils'}
+    imported.update(module for module in HEAVY_MODULES if module in modules)
+    return sorted(imported - ALWAYS_ALLOWED - case.allowed)
+
+
+def check(case: Case, baseline: float, repeat: int) -> dict:
+    modules = imported_modules(case.args)
+    ms = median_ms([sys.executable, '-c', RUNNER, *case.args], repeat)
+    unexpected = unexpected_modules(case, modules)
+    return {
+        'args': ' '.join(case.args),
+        'ms': round(ms, 1),
+        'ratio': round(ms / baseline, 2),
+        'budget': case.budget,
+        'modules': len(modules),
+        'unexpected': unexpected,
+        'ok': ms / baseline <= case.budget and not unexpected,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.cli_startup',
+        description='Check the startup time and imports of the command line',
+    )
+    parser.add_argument(
+        '--repeat', '-n', type=int, default=15, help='Runs of every case'
+    )
+    parser.add_argument(
+        '--scale',
+        type=float,
+        default=1.0,
+        help='Multiply the budgets, for noisy machines',
+    )
+    parser.add_argument('--json', action='store_true', help='Report as JSON')
+    args = parser.parse_args()
+
+    baseline = median_ms([sys.executable, '-c', BASELINE], args.repeat)
+    results = []
+    for case in CASES:
+        case = Case(case.args, case.budget * args.scale, case.allowed)
+        results.append(check(case, baseline, args.repeat))
+    if args.json:
+        print(json.dumps({'baseline_ms': baseline, 'results': results}, indent=2))
+    else:
+        print(f'baseline (python -c {BASELINE!r}): {baseline:.1f} ms')
+        for record in results:
+            status = 'ok' if record['ok'] else 'FAIL'
+            print(
+                f'{status:<4} zau {record["args"]:<24} {record["ms"]:6.1f} ms, '
+                f'{record["ratio"]:.2f}x (budget {record["budget"]:.1f}x), '
+                f'{record["modules"]} modules'
+            )
+            if record['unexpected']:
+                print(f'     imports {", ".join(record["unexpected"])}')
+    if not all(record['ok'] for record in results):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
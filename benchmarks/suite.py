@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""The benchmarks, and how their results are collected.
+
+Every benchmark runs a stage `repeat` times and records the wall time of
+every run. Tree benchmarks run once per tree (see trees.py), payload
+benchmarks once on a generated payload of mixed compressibility."""
+
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from zipapp_utils import __version__
+from zipapp_utils.api import create_archive_zau, create_shell_script
+from zipapp_utils.archive import _accept_and_descend, iter_entries
+from zipapp_utils.filters import make_filter_function
+from zipapp_utils.utils import encode_file
+
+# a .gitignore a project like the generated ones could have
+EXCLUDE_PATTERNS = [
+    '__pycache__/',
+    '*.py[cod]',
+    '.git/',
+    '.venv/',
+    '*.egg-info/',
+    '/build/',
+    '/dist/',
+    '**/tests/**',
+    '*.bin',
+    '!keep.bin',
+    'data1*.json',
+]
+INCLUDE_PATTERNS = ['pkg1/**/*.bin']
+
+
+def time_runs(run: Callable[[], object], repeat: int) -> list[float]:
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def result(benchmark: str, params: dict, seconds: list[float]) -> dict:
+    return {
+        'benchmark': benchmark,
+        'params': params,
+        'seconds': seconds,
+        'median': statistics.median(seconds),
+        'min': min(seconds),
+    }
+
+
+def bench_create_archive(tree: Path, workdir: Path, repeat: int) -> list[dict]:
+    results = []
+    for compress in (False, True):
+        for jobs in (1, 0):
+            output = workdir / f'{tree.name}.pyz'
+            seconds = time_runs(
+                lambda: create_archive_zau(tree, output, compress=compress, jobs=jobs),
+                repeat,
+            )
+            params = {'compress': compress, 'jobs': jobs}
+            results.append(result('create_archive', params, seconds))
+    return results
+
+
+def bench_filter(tree: Path, workdir: Path, repeat: int) -> list[dict]:
+    def walk(filter):
+        accept, descend = _accept_and_descend(filter)
+        return sum(1 for _ in iter_entries([tree], accept, descend))
+
+    def filtered_walk():
+        walk(make_filter_function(tree, INCLUDE_PATTERNS, EXCLUDE_PATTERNS))
+
+    return [
+        result('walk', {}, time_runs(lambda: walk(None), repeat)),
+        result(
+            'filter',
+            {'patterns': len(INCLUDE_PATTERNS) + len(EXCLUDE_PATTERNS)},
+            time_runs(filtered_walk, repeat),
+        ),
+    ]
+
+
+def bench_startup(tree: Path, workdir: Path, repeat: int) -> list[dict]:
+    """Run the archives of the tree in a new interpreter every time."""
+    results = []
+    for compress in (False, True):
+        output = workdir / f'{tree.name}-startup.pyz'
+        create_archive_zau(tree, output, compress=compress, jobs=0)
+        seconds = time_runs(
+            lambda: subprocess.run([sys.executable, str(output)], check=True),
+            repeat,
+        )
+        results.append(result('startup', {'compress': compress}, seconds))
+    return results
+
+
+def make_payload(path: Path, size: int) -> None:
+    """A file of size bytes, half random, half text."""
+    rng = random.Random(0)
+    chunk = 1024 * 1024
+    with open(path, 'wb') as f:
+        for offset in range(0, size, chunk):
+            length = min(chunk, size - offset)
+            if offset // chunk % 2:
+                f.write(rng.randbytes(length))
+            else:
+                f.write((b'print("hello world")\n' * (length // 21 + 1))[:length])
+
+
+def bench_encode(payload: Path, workdir: Path, repeat: int) -> list[dict]:
+    params = {'bytes': payload.stat().st_size}
+    results = [
+        result('encode_file', params, time_runs(lambda: encode_file(payload), repeat))
+    ]
+    output = workdir / 'payload.sh'
+    for format, codec in [('base64', 'none'), ('base64', 'gzip'), ('polyglot', 'none')]:
+        seconds = time_runs(
+            lambda: create_shell_script(payload, output, format=format, codec=codec),
+            repeat,
+        )
+        results.append(
+            result(
+                'create_shell_script',
+                {**params, 'format': format, 'codec': codec},
+                seconds,
+            )
+        )
+    return results
+
+
+TREE_BENCHMARKS = {
+    'create_archive': bench_create_archive,
+    'filter': bench_filter,
+    'startup': bench_startup,
+}
+PAYLOAD_BENCHMARKS = {
+    'encode': bench_encode,
+}
+
+
+def environment() -> dict:
+    """What the results depend on besides the code."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'zipapp_utils': __version__,
+        'commit': commit or None,
+        'python': sys.version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Synthetic source trees.
+
+A tree is made of python packages of modules, with some data files of mixed
+compressibility in between, and a __main__.py importing a few of the
+modules, so archives built from it can be run. The content only depends on
+the TreeSpec, generated trees are reused from the work directory."""
+
+import json
+import random
+import shutil
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+# bump when the generated content changes, so cached trees are not reused
+GENERATOR_VERSION = 1
+
+SOURCE_HEADER = 'import os\nfrom pathlib import Path\n\n\n'
+# top-level statements of modules, which deflate to about a quarter
+SOURCE_BLOCKS = [
+    'def function_{n}(argument, *args, **kwargs):\n'
+    '    """Docstring of function {n}."""\n'
+    '    value = argument + {n}\n'
+    '    if value > {n}:\n'
+    '        return [item * 2 for item in args if item]\n'
+    '    return dict(kwargs, value=value)\n\n\n',
+    'class Class{n}:\n'
+    '    """Docstring of class {n}."""\n\n'
+    '    attribute = {n}\n\n'
+    '    def method(self, other):\n'
+    '        return self.attribute + other\n\n\n',
+    'CONSTANT_{n} = {{"name": "constant {n}", "values": [{n}, {n}, {n}]}}\n',
+]
+
+
+@dataclass(frozen=True)
+class TreeSpec:
+    """Shape of a tree.
+
+    Args:
+        files: Number of files, modules and data files together.
+        modules_per_package: Modules in every package.
+        depth: Packages are nested this deep.
+        data_ratio: Fraction of the files that are data files.
+        incompressible_ratio: Fraction of the data files that are random
+            bytes, the others are JSON.
+        mean_size: Mean size of a file in bytes.
+        seed: Seed of the random generator."""
+
+    files: int
+    modules_per_package: int = 20
+    depth: int = 2
+    data_ratio: float = 0.1
+    incompressible_ratio: float = 0.5
+    mean_size: int = 4096
+    seed: int = 0
+
+    def key(self) -> str:
+        values = '-'.join(str(value) for value in asdict(self).values())
+        return f'v{GENERATOR_VERSION}-{values}'
+
+
+PRESETS = {
+    'tiny': TreeSpec(files=10, modules_per_package=5),
+    'small': TreeSpec(files=1_000),
+    'medium': TreeSpec(files=10_000),
+    'large': TreeSpec(files=100_000, modules_per_package=50, depth=3),
+}
+
+
+def source_text(rng: random.Random, size: int) -> str:
+    blocks = [SOURCE_HEADER]
+    length = len(SOURCE_HEADER)
+    while length < size:
+        block = rng.choice(SOURCE_BLOCKS).format(n=rng.randrange(1000))
+        blocks.append(block)
+        length += len(block)
+    return ''.join(blocks)
+
+
+def json_text(rng: random.Random, size: int) -> str:
+    records = []
+    length = 0
+    while length < size:
+        record = {'id': rng.randrange(10**6), 'name': f'item-{rng.randrange(1000)}'}
+        records.append(record)
+        length += 40
+    return json.dumps(records, indent=1)
+
+
+def package_path(index: int, depth: int) -> Path:
+    """Path of the index-th package, spread over 10 directories per level."""
+    if depth <= 1:
+        return Path(f'pkg{index}')
+    parts = [f'pkg{index % 10}']
+    parts += [f'sub{index // 10**level % 10}' for level in range(1, depth - 1)]
+    return Path(*parts, f'leaf{index}')
+
+
+def generate_tree(root: Path, spec: TreeSpec) -> dict:
+    """Write the tree of spec into root, which must not exist.
+
+    Returns:
+        Statistics of the tree: its number of files and bytes."""
+    rng = random.Random(spec.seed)
+    root.mkdir(parents=True)
+    modules = []
+    package = None
+    for index in range(spec.files):
+        if index % spec.modules_per_package == 0:
+            package = package_path(index // spec.modules_per_package, spec.depth)
+            directory = root / package
+            directory.mkdir(parents=True, exist_ok=True)
+            for parent in [package, *package.parents][:-1]:
+                init = root / parent / '__init__.py'
+                if not init.exists():
+                    init.write_text('')
+        size = max(1, int(rng.expovariate(1 / spec.mean_size)))
+        assert package is not None
+        if rng.random() < spec.data_ratio:
+            if rng.random() < spec.incompressible_ratio:
+                path = root / package / f'blob{index}.bin'
+                path.write_bytes(rng.randbytes(size))
+            else:
+                path = root / package / f'data{index}.json'
+                path.write_text(json_text(rng, size))
+        else:
+            path = root / package / f'module{index}.py'
+            path.write_text(source_text(rng, size))
+            modules.append('.'.join([*package.parts, f'module{index}']))
+    imported = rng.sample(modules, min(20, len(modules)))
+    main_py = ''.join(f'import {name}\n' for name in imported)
+    (root / '__main__.py').write_text(main_py)
+    sizes = [path.stat().st_size for path in root.rglob('*') if path.is_file()]
+    return {'files': len(sizes), 'bytes': sum(sizes)}
+
+
+def cached_tree(workdir: Path, spec: TreeSpec) -> tuple[Path, dict]:
+    """The tree of spec in workdir, generated on the first use."""
+    root = workdir / 'trees' / spec.key()
+    stats_path = root.with_name(root.name + '.json')
+    if root.is_dir() and stats_path.is_file():
+        return root, json.loads(stats_path.read_text())
+    shutil.rmtree(root, ignore_errors=True)
+    stats = generate_tree(root, spec)
+    stats_path.write_text(json.dumps(stats))
+    return root, stats
@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.fixture
+def source_tree(tmp_path):
+    """A source directory: __main__.py, a package with modules and data."""
+    root = tmp_path / 'src'
+    (root / 'pkg' / 'sub').mkdir(parents=True)
+    (root / '__main__.py').write_text('import pkg\nprint(pkg.VALUE)\n')
+    (root / 'pkg' / '__init__.py').write_text('VALUE = 1\n' * 100)
+    for i in range(20):
+        (root / 'pkg' / f'mod{i}.py').write_text(f'VALUE = {i}\n' * 50)
+    (root / 'pkg' / 'sub' / 'data.bin').write_bytes(bytes(range(256)) * 50)
+    (root / 'pkg' / 'sub' / 'notes.txt').write_text('notes\n')
+    return root
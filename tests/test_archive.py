@@ -0,0 +1,81 @@
+import zipapp
+import zipfile
+
+import pytest
+
+from zipapp_utils.api import create_archive_zau
+from zipapp_utils.archive import create_archive
+
+
+@pytest.mark.parametrize('compressed', [False, True])
+@pytest.mark.parametrize('jobs', [1, 4])
+def test_same_bytes_as_zipapp(tmp_path, compressed, jobs, source_tree):
+    zipapp.create_archive(
+        source_tree, tmp_path / 'zipapp.pyz', '/usr/bin/python3', compressed=compressed
+    )
+    create_archive(
+        source_tree,
+        tmp_path / 'zau.pyz',
+        '/usr/bin/python3',
+        compressed=compressed,
+        jobs=jobs,
+    )
+    assert (tmp_path / 'zau.pyz').read_bytes() == (tmp_path / 'zipapp.pyz').read_bytes()
+
+
+def test_same_bytes_as_zipapp_with_filter(tmp_path, source_tree):
+
+    def no_text(path):
+        return path.suffix != '.txt'
+
+    zipapp.create_archive(source_tree, tmp_path / 'zipapp.pyz', filter=no_text)
+    create_archive(source_tree, tmp_path / 'zau.pyz', filter=no_text, jobs=4)
+    assert (tmp_path / 'zau.pyz').read_bytes() == (tmp_path / 'zipapp.pyz').read_bytes()
+
+
+def test_max_size(tmp_path, source_tree):
+    output = tmp_path / 'app.pyz'
+    create_archive_zau(source_tree, output, max_size=1024**2)
+    with pytest.raises(SystemExit, match='over the limit of 1,024'):
+        create_archive_zau(source_tree, output, max_size=1024)
+    # left for inspection
+    assert output.is_file()
+
+
+def make_wheel(path):
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('dep/__init__.py', 'VALUE = 1\n' * 100, zipfile.ZIP_DEFLATED)
+        zf.writestr('dep/data.bin', bytes(range(256)) * 10, zipfile.ZIP_STORED)
+        zf.writestr('dep-1.0.data/purelib/dep_extra.py', 'EXTRA = 1\n')
+        zf.writestr('dep-1.0.data/scripts/dep', '#!python\n')
+        zf.writestr('dep-1.0.dist-info/METADATA', 'Name: dep\n')
+        # the sources come first
+        zf.writestr('pkg/__init__.py', 'shadowed\n')
+    return path
+
+
+def test_wheel_entries_are_copied_raw(tmp_path, source_tree):
+    wheel = make_wheel(tmp_path / 'dep-1.0-py3-none-any.whl')
+    target = tmp_path / 'app.pyz'
+    create_archive(source_tree, target, compressed=True, wheels=[wheel])
+    with zipfile.ZipFile(wheel) as wheel_zf:
+        wheel_infos = {info.filename: info for info in wheel_zf.infolist()}
+    with zipfile.ZipFile(target) as zf:
+        assert zf.testzip() is None
+        infos = {info.filename: info for info in zf.infolist()}
+        for arcname, name in [
+            ('dep/__init__.py', 'dep/__init__.py'),
+            ('dep/data.bin', 'dep/data.bin'),
+            ('dep_extra.py', 'dep-1.0.data/purelib/dep_extra.py'),
+            ('dep-1.0.dist-info/METADATA', 'dep-1.0.dist-info/METADATA'),
+        ]:
+            info, wheel_info = infos[arcname], wheel_infos[name]
+            assert (info.CRC, info.file_size, info.compress_size) == (
+                wheel_info.CRC,
+                wheel_info.file_size,
+                wheel_info.compress_size,
+            )
+            assert info.compress_type == wheel_info.compress_type
+        assert zf.read('pkg/__init__.py') == b'VALUE = 1\n' * 100
+    assert 'dep/' in infos and 'dep-1.0.dist-info/' in infos
+    assert not any(name.startswith('dep-1.0.data') for name in infos)
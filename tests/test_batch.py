@@ -0,0 +1,98 @@
+import json
+
+from zipapp_utils.batch import command_parsers, load_manifest, run_batch
+
+
+def make_app(root):
+    root.mkdir()
+    (root / '__main__.py').write_text('print("app")\n')
+    return root
+
+
+def test_defaults_only_apply_to_commands_with_the_option(tmp_path):
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(
+        json.dumps(
+            {
+                'defaults': {'jobs': 2, 'py2pyz': {'compress': True}},
+                'build': [
+                    {'command': 'create-archive', 'source': 'app'},
+                    {'command': 'create-shell-script', 'source': 'app.pyz'},
+                ],
+            }
+        )
+    )
+    archive, shell_script = load_manifest(manifest, command_parsers())
+    assert archive['jobs'] == 2
+    assert 'jobs' not in shell_script
+    assert 'compress' not in archive
+
+
+def test_invalid_build_fails_alone(tmp_path):
+    make_app(tmp_path / 'app')
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(
+        json.dumps(
+            [
+                {'command': 'create-archive', 'source': 'app', 'bogus': 1},
+                {'command': 'create-archive', 'source': 'app', 'output': 'a.pyz'},
+            ]
+        )
+    )
+    invalid, valid = run_batch(manifest, jobs=1)
+    assert 'unrecognized arguments: --bogus=1' in invalid['error']
+    assert valid['error'] is None
+    assert (tmp_path / 'a.pyz').is_file()
+
+
+def test_dependent_build_waits_for_its_source(tmp_path):
+    make_app(tmp_path / 'app')
+    make_app(tmp_path / 'other')
+    (tmp_path / 'dist').mkdir()
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(
+        json.dumps(
+            [
+                {'command': 'create-archive', 'source': 'app', 'output': 'dist/a.pyz'},
+                {
+                    'command': 'create-shell-script',
+                    'source': './dist/../dist/a.pyz',
+                    'output': 'dist/a.sh',
+                },
+                {'command': 'create-archive', 'source': 'other'},
+            ]
+        )
+    )
+    results = run_batch(manifest, jobs=2)
+    assert [result['error'] for result in results] == [None, None, None]
+    assert (tmp_path / 'dist' / 'a.sh').is_file()
+
+
+def test_build_waits_for_the_default_output_of_its_source(tmp_path):
+    make_app(tmp_path / 'app')
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(
+        json.dumps(
+            [
+                {'command': 'create-archive', 'source': 'app'},
+                {'command': 'sh', 'source': 'app.pyz'},
+            ]
+        )
+    )
+    results = run_batch(manifest, jobs=2)
+    assert [result['error'] for result in results] == [None, None]
+    assert (tmp_path / 'app.sh').is_file()
+
+
+def test_command_defaults_apply_to_aliases(tmp_path):
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(
+        json.dumps(
+            {
+                'defaults': {'py2pyz': {'compress': True}},
+                'build': [{'command': 'p', 'source': 'tool.py'}],
+            }
+        )
+    )
+    (build,) = load_manifest(manifest)
+    assert build == {'command': 'py2pyz', 'source': 'tool.py', 'compress': True}
@@ -0,0 +1,44 @@
+import zipfile
+
+from zipapp_utils import bytecode
+from zipapp_utils.archive import create_archive
+from zipapp_utils.buildkey import build_key
+
+
+def build(source, target):
+    create_archive(
+        source,
+        target,
+        compile_bytecode=True,
+        sourceless=True,
+        skip_unchanged=True,
+    )
+    return target.stat().st_mtime_ns
+
+
+def test_unchanged_build_is_skipped(tmp_path, source_tree):
+    target = tmp_path / 'app.pyz'
+    first = build(source_tree, target)
+    assert build(source_tree, target) == first
+
+
+def test_other_magic_number_rebuilds(tmp_path, monkeypatch, source_tree):
+    target = tmp_path / 'app.pyz'
+    build(source_tree, target)
+    key = target.read_bytes()[-64:]
+    # like running the same command with another python version
+    monkeypatch.setattr(bytecode, 'magic_number', lambda python=None: '00000000')
+    build(source_tree, target)
+    assert target.read_bytes()[-64:] != key
+
+
+def test_rebuilt_wheel_of_the_same_size_changes_the_key(tmp_path, source_tree):
+    wheel = tmp_path / 'dep-1.0-py3-none-any.whl'
+    with zipfile.ZipFile(wheel, 'w') as zf:
+        zf.writestr('dep.py', 'VALUE = 1\n')
+    key = build_key([source_tree], wheels=[wheel])
+    size = wheel.stat().st_size
+    with zipfile.ZipFile(wheel, 'w') as zf:
+        zf.writestr('dep.py', 'VALUE = 2\n')
+    assert wheel.stat().st_size == size
+    assert build_key([source_tree], wheels=[wheel]) != key
@@ -0,0 +1,41 @@
+import sys
+
+import pytest
+
+from zipapp_utils import cli
+
+
+def parse(monkeypatch, *argv):
+    monkeypatch.setattr(sys, 'argv', ['zau', *argv])
+    return cli.get_args()[1]
+
+
+@pytest.mark.parametrize(
+    'argv, app_args',
+    [
+        (['app.pyz'], []),
+        (['app.pyz', '--json', '-n', '2', '--top', '5'], []),
+        (['-n', '2', 'app.pyz', '--json', '--top', '5'], []),
+        (['app.pyz', '--json', '-n', '2', '--top', '5', '--', '--help'], ['--help']),
+        # after --, options of profile go to the application too
+        (
+            ['--json', '-n', '2', '--top', '5', 'app.pyz', '--', 'x', '-n', '3'],
+            ['x', '-n', '3'],
+        ),
+        (
+            ['app.pyz', 'x', '--verbose', '--json', '-n', '2', '--top', '5'],
+            ['x', '--verbose'],
+        ),
+    ],
+)
+def test_profile_options_go_anywhere(monkeypatch, argv, app_args):
+    args = parse(monkeypatch, 'profile', *argv)
+    assert args.app_args == app_args
+    if len(argv) > 1:
+        assert (args.json, args.trials, args.top) == (True, 2, 5)
+
+
+def test_other_commands_reject_unknown_arguments(monkeypatch, capsys):
+    with pytest.raises(SystemExit):
+        parse(monkeypatch, 'inspect', 'app.pyz', '--bogus')
+    assert 'unrecognized arguments: --bogus' in capsys.readouterr().err
@@ -0,0 +1,14 @@
+import pytest
+
+from benchmarks.cli_startup import CASES, imported_modules, unexpected_modules
+
+
+@pytest.mark.parametrize('case', CASES, ids=lambda case: ' '.join(case.args))
+def test_imports_only_what_the_sub_command_needs(case):
+    assert unexpected_modules(case, imported_modules(case.args)) == []
+
+
+def test_unexpected_modules_are_reported():
+    case = CASES[0]
+    modules = {'zipapp_utils', 'zipapp_utils.api', 'jinja2', 'jinja2.runtime'}
+    assert unexpected_modules(case, modules) == ['jinja2', 'zipapp_utils.api']
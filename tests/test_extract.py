@@ -0,0 +1,77 @@
+import _bisect
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from zipapp_utils.archive import create_archive
+from zipapp_utils.extract import NATIVE_PATTERNS, inject_bootstrap
+
+MAIN_PY = '''"""Runs from the archive."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+from pkg import _bisect
+
+print(_bisect.bisect_right([1, 2, 3], 2))
+# the extraction directory comes last
+print(Path(sys.path[-1], 'pkg', 'data.txt').read_text())
+'''
+
+
+def test_inject_bootstrap_after_docstring_and_future_imports():
+    main_py = (
+        '#!/usr/bin/env python3\n'
+        '"""Doc."""\n'
+        'from __future__ import annotations\n'
+        'import os\n'
+    )
+    lines = inject_bootstrap(main_py, 'BOOTSTRAP\n').splitlines()
+    assert lines == [
+        '#!/usr/bin/env python3',
+        '"""Doc."""',
+        'from __future__ import annotations',
+        'BOOTSTRAP',
+        'import os',
+    ]
+    assert inject_bootstrap('# comment\nimport os', 'BOOTSTRAP\n') == (
+        '# comment\nBOOTSTRAP\nimport os'
+    )
+
+
+@pytest.mark.skipif(
+    not _bisect.__file__.endswith('.so'), reason='needs _bisect as a shared library'
+)
+def test_extension_modules_and_data_are_extracted(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'pkg').mkdir(parents=True)
+    (source / '__main__.py').write_text(MAIN_PY)
+    (source / 'pkg' / '__init__.py').write_text('')
+    (source / 'pkg' / 'data.txt').write_text('data')
+    # an extension module is found by the name of its init function
+    shutil.copy(_bisect.__file__, source / 'pkg' / Path(_bisect.__file__).name)
+    target = tmp_path / 'app.pyz'
+    create_archive(source, target, extract=[*NATIVE_PATTERNS, 'data.txt'])
+
+    env = {**os.environ, 'XDG_CACHE_HOME': str(tmp_path / 'cache')}
+    for _ in range(2):
+        # the second run reuses what the first one extracted
+        result = subprocess.run(
+            [sys.executable, str(target)],
+            capture_output=True,
+            text=True,
+            env=env,
+            check=True,
+        )
+        assert result.stdout.splitlines() == ['2', 'data']
+    (extracted,) = (tmp_path / 'cache' / 'zipapp-utils' / 'extracted').iterdir()
+    assert sorted(
+        path.relative_to(extracted).as_posix()
+        for path in extracted.rglob('*')
+        if path.is_file()
+    ) == sorted(['pkg/data.txt', f'pkg/{Path(_bisect.__file__).name}'])
@@ -0,0 +1,80 @@
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from zipapp_utils.archive import create_archive
+from zipapp_utils.filters import create_pattern_set, make_filter_function
+
+
+@pytest.mark.parametrize(
+    'patterns, path, kept',
+    [
+        (['*.pyc'], 'a.pyc', False),
+        (['*.pyc'], 'pkg/sub/a.pyc', False),
+        (['*.pyc'], 'a.py', True),
+        # a pattern with a slash is anchored to the base directory
+        (['/setup.py'], 'setup.py', False),
+        (['/setup.py'], 'pkg/setup.py', True),
+        (['pkg/*.txt'], 'pkg/a.txt', False),
+        (['pkg/*.txt'], 'pkg/sub/a.txt', True),
+        (['pkg/**/*.txt'], 'pkg/sub/deep/a.txt', False),
+        (['**/tests'], 'pkg/tests/test_a.py', False),
+        # everything below an excluded directory is excluded
+        (['build'], 'build/lib/a.py', False),
+        (['a?.py'], 'ab.py', False),
+        (['a?.py'], 'abc.py', True),
+        (['[!a]*.py'], 'b.py', False),
+        (['[!a]*.py'], 'a.py', True),
+        (['\\#notes'], '#notes', False),
+        (['# comment', ''], '# comment', True),
+        # the last matching rule wins
+        (['*.txt', '!keep.txt'], 'keep.txt', True),
+        (['!keep.txt', '*.txt'], 'keep.txt', False),
+    ],
+)
+def test_patterns(tmp_path, patterns, path, kept):
+    assert make_filter_function(tmp_path, [], patterns)(Path(path)) is kept
+
+
+def test_directory_only_patterns(tmp_path):
+    (tmp_path / 'cache').mkdir()
+    (tmp_path / 'data').write_text('')
+    keep = make_filter_function(tmp_path, [], ['cache/', 'data/'])
+    assert not keep(Path('cache'))
+    assert not keep(Path('cache/a.py'))
+    assert keep(Path('data'))
+
+
+def test_include_patterns_apply_after_all_excludes(tmp_path):
+    keep = make_filter_function(tmp_path, ['*.txt'], ['*.txt', '!a.txt', 'docs/'])
+    assert keep(Path('b.txt'))
+    assert keep(Path('README.md'))
+    # an include does not bring back files below an excluded directory
+    assert not keep(Path('docs/c.txt'))
+
+
+def test_create_pattern_set(tmp_path):
+    pattern_file = tmp_path / 'patterns'
+    pattern_file.write_text('*.log\n*.pyc\n!keep.pyc\n')
+    assert create_pattern_set(['*.pyc', 'build/'], [pattern_file]) == [
+        '*.pyc',
+        'build/',
+        '*.log',
+        '!keep.pyc',
+    ]
+
+
+def test_archive_skips_excluded_directories(tmp_path):
+    source = tmp_path / 'src'
+    (source / 'pkg' / 'tests').mkdir(parents=True)
+    (source / '__main__.py').write_text('import pkg\n')
+    (source / 'pkg' / '__init__.py').write_text('')
+    (source / 'pkg' / 'notes.txt').write_text('')
+    (source / 'pkg' / 'tests' / 'test_pkg.py').write_text('')
+    target = tmp_path / 'app.pyz'
+    create_archive(
+        source, target, filter=make_filter_function(source, [], ['tests/', '*.txt'])
+    )
+    with zipfile.ZipFile(target) as zf:
+        assert sorted(zf.namelist()) == ['__main__.py', 'pkg/', 'pkg/__init__.py']
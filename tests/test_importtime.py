@@ -0,0 +1,71 @@
+import zipfile
+
+from zipapp_utils import importtime
+from zipapp_utils.importtime import (
+    import_order,
+    module_entry,
+    parse_importtime,
+    profile_archive,
+)
+
+STDERR = '''\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:        40 |         40 |     pkg.util
+import time:        60 |        100 |   pkg.core
+import time:       300 |        520 | pkg
+import time:        25 |         25 | json
+Traceback (most recent call last):
+'''
+
+
+def test_parse_importtime():
+    assert parse_importtime(STDERR) == {
+        '_io': (120, 120),
+        'pkg.util': (40, 40),
+        'pkg.core': (60, 100),
+        'pkg': (300, 520),
+        'json': (25, 25),
+    }
+
+
+def test_import_order_puts_parents_before_what_they_import():
+    assert import_order(STDERR) == ['pkg', '_io', 'pkg.core', 'pkg.util', 'json']
+
+
+def test_module_entry():
+    names = dict.fromkeys(['pkg/__init__.py', 'pkg/core.pyc', 'pkg/core.py'])
+    assert module_entry('pkg', names) == 'pkg/__init__.py'
+    assert module_entry('pkg.core', names) == 'pkg/core.pyc'
+    assert module_entry('json', names) is None
+
+
+def test_report_per_module_and_package(tmp_path, monkeypatch):
+    pyz = tmp_path / 'app.pyz'
+    with zipfile.ZipFile(pyz, 'w') as zf:
+        zf.writestr('__main__.py', 'import pkg\n')
+        zf.writestr('pkg/__init__.py', 'from . import core\n')
+        zf.writestr('pkg/core.py', 'VALUE = 1\n' * 1000, zipfile.ZIP_DEFLATED)
+        zf.writestr('pkg/util.py', '')
+    times = {
+        module: (float(self_us), float(cumulative_us))
+        for module, (self_us, cumulative_us) in parse_importtime(STDERR).items()
+    }
+    monkeypatch.setattr(
+        importtime, 'run_trials', lambda *args: (times, import_order(STDERR))
+    )
+    report = profile_archive(pyz, python='python3', trials=3)
+    assert report['import_order'] == ['pkg/__init__.py', 'pkg/core.py', 'pkg/util.py']
+    assert report['total_us'] == 545
+    assert report['archive_us'] == 400
+    modules = {record['module']: record for record in report['modules']}
+    assert modules['pkg.core']['compressed']
+    assert not modules['pkg.util']['compressed']
+    assert modules['pkg.util']['inflate_us'] == 0
+    assert modules['json']['entry'] is None
+    assert report['packages'] == [
+        {'package': 'pkg', 'self_us': 400, 'modules': 3, 'in_archive': True},
+        {'package': '_io', 'self_us': 120, 'modules': 1, 'in_archive': False},
+        {'package': 'json', 'self_us': 25, 'modules': 1, 'in_archive': False},
+    ]
+    assert '_io (not in archive)' in importtime.format_report(report)
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import pytest
+
+from zipapp_utils import incremental
+from zipapp_utils.archive import create_archive
+from zipapp_utils.watch import unchanged_except
+
+CHANGED = {Path('pkg/mod3.py'), Path('pkg/mod7.py'), Path('pkg/new.py')}
+
+
+def change_tree(root):
+    (root / 'pkg' / 'mod3.py').write_text('VALUE = "changed"\n' * 50)
+    (root / 'pkg' / 'mod7.py').unlink()
+    (root / 'pkg' / 'new.py').write_text('NEW = True\n')
+
+
+@pytest.mark.parametrize('in_memory', [True, False])
+def test_incremental_rebuild_equals_full_build(
+    tmp_path, monkeypatch, in_memory, source_tree
+):
+    target = tmp_path / 'app.pyz'
+    create_archive(source_tree, target, compressed=True, jobs=2, incremental=True)
+    assert incremental.manifest_path(target).exists()
+    if not in_memory:
+        # like the next build running in another process
+        monkeypatch.setattr(incremental, '_saved_builds', {})
+    change_tree(source_tree)
+    create_archive(source_tree, target, compressed=True, jobs=2, incremental=True)
+    create_archive(source_tree, tmp_path / 'full.pyz', compressed=True, jobs=2)
+    assert target.read_bytes() == (tmp_path / 'full.pyz').read_bytes()
+
+
+def test_rebuild_told_what_changed_equals_full_build(tmp_path, source_tree):
+    source = source_tree.resolve()
+    target = tmp_path / 'app.pyz'
+    create_archive(source, target, compressed=True, incremental=True)
+    change_tree(source)
+    create_archive(
+        source,
+        target,
+        compressed=True,
+        incremental=True,
+        unchanged=unchanged_except([source], CHANGED),
+    )
+    create_archive(source, tmp_path / 'full.pyz', compressed=True)
+    assert target.read_bytes() == (tmp_path / 'full.pyz').read_bytes()
@@ -0,0 +1,112 @@
+import zipfile
+
+import pytest
+
+from zipapp_utils.inspection import (
+    check_max_size,
+    format_report,
+    inspect_archive,
+    parse_size,
+)
+
+DATA = b'0123456789abcdef' * 1000
+
+
+def make_archive(path, prefix=b'#!/usr/bin/env python3\n', comment=b''):
+    with open(path, 'wb') as f:
+        f.write(prefix)
+        with zipfile.ZipFile(f, 'w') as zf:
+            zf.writestr('__main__.py', 'import pkg\n')
+            zf.writestr('pkg/', '')
+            zf.writestr('pkg/__init__.py', DATA, compress_type=zipfile.ZIP_DEFLATED)
+            zf.writestr('pkg/copy.bin', DATA)
+            zf.writestr('vendor/copy.bin', DATA, compress_type=zipfile.ZIP_DEFLATED)
+            zf.writestr('tool.py', '')
+            zf.comment = comment
+    return path
+
+
+def entries(report):
+    return {
+        entry['name']: (entry['method'], entry['compress_size'], entry['file_size'])
+        for entry in report['largest']
+    }
+
+
+def zipfile_entries(path):
+    methods = {zipfile.ZIP_STORED: 'stored', zipfile.ZIP_DEFLATED: 'deflated'}
+    with zipfile.ZipFile(path) as zf:
+        return {
+            info.filename: (
+                methods[info.compress_type],
+                info.compress_size,
+                info.file_size,
+            )
+            for info in zf.infolist()
+            if not info.is_dir()
+        }
+
+
+def test_report_matches_zipfile(tmp_path):
+    pyz = make_archive(tmp_path / 'app.pyz')
+    report = inspect_archive(pyz)
+    assert entries(report) == zipfile_entries(pyz)
+    assert (report['files'], report['directories']) == (5, 1)
+    assert report['archive_size'] == pyz.stat().st_size
+    assert {package['package'] for package in report['packages']} == {
+        '__main__',
+        'pkg',
+        'vendor',
+        'tool',
+    }
+    (group,) = report['duplicates']
+    assert set(group['names']) == {'pkg/__init__.py', 'pkg/copy.bin', 'vendor/copy.bin'}
+    # all but the largest copy, the stored one
+    assert group['wasted'] == sum(
+        entries(report)[name][1] for name in ('pkg/__init__.py', 'vendor/copy.bin')
+    )
+    assert 'groups of duplicate entries' in format_report(report)
+
+
+def test_end_record_signature_in_the_comment(tmp_path):
+    pyz = make_archive(tmp_path / 'app.pyz')
+    # zipfile itself takes the one in the comment for the end record
+    commented = make_archive(tmp_path / 'commented.pyz', comment=b'PK\x05\x06 ...')
+    assert entries(inspect_archive(commented)) == entries(inspect_archive(pyz))
+
+
+def test_zip64(tmp_path, monkeypatch):
+    pyz = tmp_path / 'app.pyz'
+    with monkeypatch.context() as patched:
+        # like an archive over 4 GiB and 65535 entries: ZIP64 end records,
+        # and sizes and offsets in ZIP64 extra fields
+        patched.setattr(zipfile, 'ZIP64_LIMIT', 100)
+        patched.setattr(zipfile, 'ZIP_FILECOUNT_LIMIT', 2)
+        make_archive(pyz)
+    with open(pyz, 'rb') as f:
+        assert b'PK\x06\x06' in f.read()
+    report = inspect_archive(pyz)
+    assert entries(report) == zipfile_entries(pyz)
+    assert report['entries'] == 6
+
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / 'app.pyz'
+    path.write_bytes(b'')
+    with pytest.raises(zipfile.BadZipFile, match='empty'):
+        inspect_archive(path)
+    path.write_bytes(b'print("hello")\n')
+    with pytest.raises(zipfile.BadZipFile, match='no end of central directory'):
+        inspect_archive(path)
+
+
+def test_max_size(tmp_path):
+    assert parse_size('1.5K') == 1536
+    assert parse_size('20MiB') == 20 * 1024**2
+    with pytest.raises(ValueError):
+        parse_size('lots')
+    report = {'pyz': 'app.pyz', 'archive_size': 2048}
+    assert check_max_size(report, 2048) is None
+    assert check_max_size(report, 1024) == (
+        'app.pyz is 2,048 bytes, 1,024 over the limit of 1,024'
+    )
@@ -0,0 +1,70 @@
+import os
+import zipfile
+
+from zipapp_utils.archive import create_archive
+from zipapp_utils.layout import Layout, load_trace
+
+
+def infos(target):
+    with zipfile.ZipFile(target) as zf:
+        return {info.filename: info for info in zf.infolist()}
+
+
+def test_compresslevel(tmp_path, source_tree):
+    fast, best = tmp_path / 'fast.pyz', tmp_path / 'best.pyz'
+    create_archive(source_tree, fast, compressed=True, compresslevel=1)
+    create_archive(source_tree, best, compressed=True, compresslevel=9)
+    assert best.stat().st_size < fast.stat().st_size
+    with zipfile.ZipFile(best) as zf:
+        assert zf.testzip() is None
+
+
+def test_store_incompressible(tmp_path, source_tree):
+    (source_tree / 'pkg' / 'logo.png').write_bytes(b'\x89PNG' + b'\0' * 1000)
+    (source_tree / 'pkg' / 'random.bin').write_bytes(os.urandom(200 * 1024))
+    target = tmp_path / 'app.pyz'
+    create_archive(source_tree, target, compressed=True, store_incompressible=True)
+    entries = infos(target)
+    # by extension, however well it would deflate
+    assert entries['pkg/logo.png'].compress_type == zipfile.ZIP_STORED
+    # by sampling
+    assert entries['pkg/random.bin'].compress_type == zipfile.ZIP_STORED
+    assert entries['pkg/mod1.py'].compress_type == zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(target) as zf:
+        assert zf.testzip() is None
+
+
+def test_hot_entries_go_first_and_small_ones_are_stored(tmp_path, source_tree):
+    (source_tree / 'pkg' / 'big.py').write_text('VALUE = 1\n' * 10000)
+    trace = ['pkg/mod5.py', 'pkg/big.py', '__main__.py', 'pkg/mod5.py', 'gone.py']
+    target = tmp_path / 'app.pyz'
+    create_archive(
+        source_tree, target, compressed=True, trace=trace, hot_store_limit=1024
+    )
+    with zipfile.ZipFile(target) as zf:
+        names = [name for name in zf.namelist() if not name.endswith('/')]
+    assert names[:3] == ['pkg/mod5.py', 'pkg/big.py', '__main__.py']
+    assert sorted(names) == sorted(set(names))
+    entries = infos(target)
+    assert entries['pkg/mod5.py'].compress_type == zipfile.ZIP_STORED
+    # above hot_store_limit
+    assert entries['pkg/big.py'].compress_type == zipfile.ZIP_DEFLATED
+    assert entries['pkg/mod6.py'].compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_load_trace(tmp_path):
+    text = tmp_path / 'trace.txt'
+    text.write_text('a.py\n\npkg/__init__.py\n')
+    assert load_trace(text) == ['a.py', 'pkg/__init__.py']
+    report = tmp_path / 'trace.json'
+    report.write_text('{"import_order": ["a.py"], "modules": []}')
+    assert load_trace(report) == ['a.py']
+
+
+def test_deterministic_normalizes_metadata():
+    layout = Layout(deterministic=True)
+    zinfo = zipfile.ZipInfo('tool.py', date_time=(2020, 5, 17, 12, 0, 0))
+    zinfo.external_attr = 0o100775 << 16
+    layout.normalize(zinfo)
+    assert zinfo.date_time == layout.date_time
+    assert zinfo.external_attr >> 16 == 0o100755
@@ -0,0 +1,179 @@
+import platform
+
+import pytest
+
+from zipapp_utils.lockfile import (
+    allows,
+    locked_packages,
+    poetry_specifiers,
+    project_config,
+)
+
+
+@pytest.mark.parametrize(
+    'constraint, specifiers',
+    [
+        ('^1.2.3', ['<2,>=1.2.3']),
+        ('^0.2.3', ['<0.3,>=0.2.3']),
+        ('^0.0.3', ['<0.0.4,>=0.0.3']),
+        ('^0', ['<1,>=0']),
+        ('~1.2.3', ['<1.3,>=1.2.3']),
+        ('~1', ['<2,>=1']),
+        ('1.2.3', ['==1.2.3']),
+        ('=1.2.3', ['==1.2.3']),
+        ('1.2.*', ['==1.2.*']),
+        ('*', ['']),
+        ('>=1.2,<2.0', ['<2.0,>=1.2']),
+        ('>=1.2 <2.0', ['<2.0,>=1.2']),
+        ('^1.0 || ^2.0', ['<2,>=1.0', '<3,>=2.0']),
+        ('~=1.4', ['~=1.4']),
+    ],
+)
+def test_poetry_specifiers(constraint, specifiers):
+    assert [str(s) for s in poetry_specifiers(constraint)] == specifiers
+
+
+@pytest.mark.parametrize(
+    'constraint, version, allowed',
+    [
+        ('^1.2', '1.9.0', True),
+        ('^1.2', '2.0.0', False),
+        ('^1.2 || ^3.0', '3.1', True),
+        ('~1.2', '1.3.0', False),
+        ('*', '0.1', True),
+        ('>=1.0', '2.0rc1', True),
+        # unparseable versions are allowed
+        ('^1.2', 'not-a-version', True),
+    ],
+)
+def test_allows(constraint, version, allowed):
+    assert allows(constraint, version) is allowed
+
+
+def package(name, version, dependencies=None, **fields):
+    return {
+        'name': name,
+        'version': version,
+        'dependencies': dependencies or {},
+        **fields,
+    }
+
+
+def names(packages):
+    return [(p['name'], p['version']) for p in packages]
+
+
+def config(dependencies, extras=None):
+    pyproject = {
+        'tool': {
+            'poetry': {
+                'name': 'app',
+                'dependencies': {'python': '^3.8', **dependencies},
+                'extras': extras or {},
+            }
+        }
+    }
+    return project_config(pyproject, 'pyproject.toml')
+
+
+LOCK = {
+    'package': [
+        package('requests', '2.31.0', {'idna': '>=2.5,<4', 'urllib3': '>=1.21.1'}),
+        package('idna', '3.6'),
+        package('urllib3', '1.26.18'),
+        package('urllib3', '2.1.0'),
+        package('colorama', '0.4.6'),
+        package(
+            'rich',
+            '13.7.0',
+            {'pygments': '^2.13.0', 'ipywidgets': {'version': '>=7', 'optional': True}},
+            extras={'jupyter': ['ipywidgets (>=7.5.1,<9)']},
+        ),
+        package('Pygments', '2.17.2'),
+        package('ipywidgets', '8.1.1'),
+        package('tomli', '2.0.1'),
+    ]
+}
+
+
+def test_transitive_dependencies():
+    packages = locked_packages(LOCK, config({'requests': '^2.31'}))
+    assert names(packages) == [
+        ('idna', '3.6'),
+        ('requests', '2.31.0'),
+        ('urllib3', '1.26.18'),
+    ]
+
+
+def test_version_matching_the_constraint():
+    packages = locked_packages(LOCK, config({'urllib3': '^2.0'}))
+    assert names(packages) == [('urllib3', '2.1.0')]
+
+
+def test_no_locked_version_matches():
+    with pytest.raises(SystemExit, match='run poetry lock to update it'):
+        locked_packages(LOCK, config({'idna': '^2.0'}))
+
+
+def test_missing_from_lock():
+    with pytest.raises(SystemExit, match='run poetry lock to update it'):
+        locked_packages(LOCK, config({'attrs': '^23'}))
+
+
+def test_markers_and_python():
+    version = platform.python_version()
+    packages = locked_packages(
+        LOCK,
+        config(
+            {
+                'colorama': {
+                    'version': '*',
+                    'markers': 'sys_platform == "nonexistent"',
+                },
+                'tomli': {'version': '*', 'python': f'<{version}'},
+                'idna': {'version': '*', 'python': f'>={version}'},
+            }
+        ),
+    )
+    assert names(packages) == [('idna', '3.6')]
+
+
+def test_project_extras():
+    project = config(
+        {'colorama': {'version': '*', 'optional': True}}, {'color': ['colorama']}
+    )
+    assert locked_packages(LOCK, project) == []
+    assert names(locked_packages(LOCK, project, ['color'])) == [('colorama', '0.4.6')]
+    with pytest.raises(SystemExit, match='Unknown extras: nope'):
+        locked_packages(LOCK, project, ['nope'])
+
+
+def test_dependency_extras():
+    packages = locked_packages(LOCK, config({'rich': '*'}))
+    assert names(packages) == [('Pygments', '2.17.2'), ('rich', '13.7.0')]
+    packages = locked_packages(
+        LOCK, config({'rich': {'version': '*', 'extras': ['jupyter']}})
+    )
+    assert names(packages) == [
+        ('ipywidgets', '8.1.1'),
+        ('Pygments', '2.17.2'),
+        ('rich', '13.7.0'),
+    ]
+
+
+def test_pep_621_dependencies():
+    pyproject = {
+        'project': {
+            'name': 'app',
+            'dependencies': ['requests>=2.31'],
+            'optional-dependencies': {'color': ['colorama']},
+        }
+    }
+    project = project_config(pyproject, 'pyproject.toml')
+    packages = locked_packages(LOCK, project, ['color'])
+    assert names(packages) == [
+        ('colorama', '0.4.6'),
+        ('idna', '3.6'),
+        ('requests', '2.31.0'),
+        ('urllib3', '1.26.18'),
+    ]
@@ -0,0 +1,119 @@
+import gzip
+import io
+import lzma
+import os
+import shutil
+import subprocess
+import sys
+import zipapp
+from base64 import b64decode, b85decode
+
+import pytest
+
+from zipapp_utils import payload
+from zipapp_utils.api import create_shell_script
+from zipapp_utils.payload import CODECS, ENCODINGS, PAYLOAD_STYLES, write_payload
+
+DECOMPRESS = {'none': bytes, 'gzip': gzip.decompress, 'xz': lzma.decompress}
+DECODE = {'base64': b64decode, 'base85': b85decode}
+
+
+def decode(data, codec, encoding, wrap):
+    if wrap:
+        decoded = b''.join(DECODE[encoding](line) for line in data.splitlines())
+    else:
+        decoded = DECODE[encoding](data)
+    return DECOMPRESS[codec](decoded)
+
+
+@pytest.mark.parametrize('wrap', [False, True])
+@pytest.mark.parametrize('encoding', ENCODINGS)
+@pytest.mark.parametrize('codec', CODECS)
+@pytest.mark.parametrize('size', [0, 1, 1000, 10007])
+def test_payload_round_trip(monkeypatch, codec, encoding, wrap, size):
+    # chunks that do not line up with the encoding groups or the lines
+    monkeypatch.setattr(payload, 'COPY_BUFSIZE', 997)
+    data = os.urandom(size // 2) + bytes(size - size // 2)
+    dst = io.BytesIO()
+    write_payload(io.BytesIO(data), dst, codec, encoding, wrap)
+    encoded = dst.getvalue()
+    if wrap:
+        lines = encoded.splitlines()
+        assert all(len(line) <= payload.LINE_LENGTHS[encoding] for line in lines)
+        assert b'.' not in encoded  # the heredoc delimiter cannot appear
+    assert decode(encoded, codec, encoding, wrap) == data
+
+
+def test_gzip_payload_is_reproducible():
+    data = os.urandom(1000)
+    payloads = []
+    for _ in range(2):
+        dst = io.BytesIO()
+        write_payload(io.BytesIO(data), dst, 'gzip')
+        payloads.append(dst.getvalue())
+    assert payloads[0] == payloads[1]
+
+
+@pytest.fixture
+def pyz(tmp_path):
+    source = tmp_path / 'src'
+    source.mkdir()
+    (source / '__main__.py').write_text('import sys\nprint("args", sys.argv[1:])\n')
+    target = tmp_path / 'app.pyz'
+    zipapp.create_archive(source, target, '/usr/bin/env python3')
+    return target
+
+
+def run(script, tmp_path):
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmp_path / 'cache'))
+    return subprocess.run(
+        [str(script), 'a', 'b c'], env=env, capture_output=True, text=True
+    )
+
+
+def missing(*commands):
+    return [command for command in commands if shutil.which(command) is None]
+
+
+@pytest.mark.parametrize('payload_style', PAYLOAD_STYLES)
+@pytest.mark.parametrize('encoding', ENCODINGS)
+@pytest.mark.parametrize('codec', CODECS)
+def test_shell_script_round_trip(tmp_path, pyz, codec, encoding, payload_style):
+    needed = missing(
+        'bash', 'python3', 'base64', *{'gzip': ['gzip'], 'xz': ['xz']}.get(codec, [])
+    )
+    if needed:
+        pytest.skip(f'needs {", ".join(needed)}')
+    script = create_shell_script(
+        pyz, codec=codec, encoding=encoding, payload=payload_style
+    )
+    for _ in range(2):  # extracting, then from the cache
+        result = run(script, tmp_path)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout == "args ['a', 'b c']\n"
+    (cached,) = (tmp_path / 'cache' / 'zipapp-utils' / 'pyz').iterdir()
+    assert cached.read_bytes() == pyz.read_bytes()
+
+
+def test_shell_script_from_stdin(tmp_path, pyz, monkeypatch):
+    output = tmp_path / 'app.sh'
+    with open(pyz, 'rb') as f:
+        monkeypatch.setattr(sys, 'stdin', io.TextIOWrapper(f))
+        create_shell_script('-', output)
+    result = run(output, tmp_path)
+    assert result.returncode == 0, result.stderr
+    (cached,) = (tmp_path / 'cache' / 'zipapp-utils' / 'pyz').iterdir()
+    assert cached.read_bytes() == pyz.read_bytes()
+
+
+def test_polyglot_script(tmp_path, pyz):
+    if missing('python3'):
+        pytest.skip('needs python3')
+    script = create_shell_script(pyz, format='polyglot')
+    result = run(script, tmp_path)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == "args ['a', 'b c']\n"
+    # the archive follows the stub unchanged, without its shebang
+    archive = pyz.read_bytes().partition(b'\n')[2]
+    assert script.read_bytes().endswith(archive)
+    assert not (tmp_path / 'cache').exists()
@@ -0,0 +1,89 @@
+import zipapp
+import zipfile
+
+import pytest
+
+from zipapp_utils.retarget import retarget
+
+OLD = '/usr/bin/env python3'
+
+
+def make_pyz(tmp_path, interpreter, name='app.pyz'):
+    source = tmp_path / 'src'
+    if not source.exists():
+        (source / 'pkg').mkdir(parents=True)
+        (source / '__main__.py').write_text('import pkg\n')
+        (source / 'pkg' / '__init__.py').write_text('VALUE = 1\n' * 100)
+    target = tmp_path / name
+    zipapp.create_archive(source, target, interpreter, compressed=True)
+    return target
+
+
+def check_archive(pyz, interpreter):
+    data = pyz.read_bytes()
+    if interpreter:
+        assert data.startswith(f'#!{interpreter}'.encode())
+    else:
+        assert data.startswith(b'PK\x03\x04')
+    with zipfile.ZipFile(pyz) as zf:
+        assert zf.testzip() is None
+        assert zf.read('pkg/__init__.py') == b'VALUE = 1\n' * 100
+
+
+@pytest.mark.parametrize(
+    'interpreter, done',
+    [
+        (OLD, 'unchanged'),
+        ('/usr/bin/python3', 'in place'),  # shorter, padded
+        ('/opt/python/3.12/bin/python3', 'rewritten'),  # longer
+        (None, 'rewritten'),  # removed
+    ],
+)
+def test_retarget(tmp_path, interpreter, done):
+    pyz = make_pyz(tmp_path, OLD)
+    assert retarget(pyz, interpreter) == done
+    check_archive(pyz, interpreter)
+
+
+@pytest.mark.parametrize('interpreter', [None, '/usr/bin/python3', '/opt/bin/py'])
+def test_unpadded_retarget_equals_a_build(tmp_path, interpreter):
+    pyz = make_pyz(tmp_path, OLD)
+    retarget(pyz, interpreter, pad=False)
+    built = make_pyz(tmp_path, interpreter, 'built.pyz')
+    assert pyz.read_bytes() == built.read_bytes()
+
+
+def test_add_shebang_and_back(tmp_path):
+    pyz = make_pyz(tmp_path, None)
+    original = pyz.read_bytes()
+    assert retarget(pyz, OLD) == 'rewritten'
+    check_archive(pyz, OLD)
+    retarget(pyz, None)
+    assert pyz.read_bytes() == original
+
+
+def test_retarget_to_output(tmp_path):
+    pyz = make_pyz(tmp_path, OLD)
+    original = pyz.read_bytes()
+    output = tmp_path / 'out.pyz'
+    assert retarget(pyz, '/usr/bin/python3', output) == 'copied'
+    check_archive(output, '/usr/bin/python3')
+    assert pyz.read_bytes() == original
+
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / 'script.py'
+    path.write_text('#!/usr/bin/python3\nprint(1)\n')
+    with pytest.raises(zipfile.BadZipFile):
+        retarget(path, OLD)
+
+
+def test_retarget_zip64(tmp_path, monkeypatch):
+    with monkeypatch.context() as patched:
+        # ZIP64 end records, and sizes and offsets in ZIP64 extra fields
+        patched.setattr(zipfile, 'ZIP64_LIMIT', 100)
+        patched.setattr(zipfile, 'ZIP_FILECOUNT_LIMIT', 2)
+        pyz = make_pyz(tmp_path, OLD)
+    assert b'PK\x06\x06' in pyz.read_bytes()
+    assert retarget(pyz, '/opt/python/3.12/bin/python3') == 'rewritten'
+    check_archive(pyz, '/opt/python/3.12/bin/python3')
@@ -0,0 +1,72 @@
+import os
+import time
+from pathlib import Path
+
+from zipapp_utils.store import STAGING_MAX_AGE, DependencyStore, resolution_key
+
+
+def test_resolution_key_depends_on_the_wheelhouse(tmp_path):
+    wheelhouse = tmp_path / 'wheels'
+    wheelhouse.mkdir()
+    requirements = ['six', 'jinja2>=3']
+    key = resolution_key(requirements, [], wheelhouse)
+    assert resolution_key(reversed(requirements), [], wheelhouse) == key
+    assert resolution_key(requirements, []) != key
+
+    other = tmp_path / 'other'
+    other.mkdir()
+    assert resolution_key(requirements, [], other) != key
+
+    wheel = wheelhouse / 'six-1.16.0-py2.py3-none-any.whl'
+    wheel.write_bytes(b'wheel')
+    with_wheel = resolution_key(requirements, [], wheelhouse)
+    assert with_wheel != key
+    wheel.write_bytes(b'rebuilt wheel')
+    assert resolution_key(requirements, [], wheelhouse) != with_wheel
+
+
+def test_resolution_key_reads_requirement_files(tmp_path):
+    requirements_txt = tmp_path / 'requirements.txt'
+    requirements_txt.write_text('six\n')
+    key = resolution_key([], [requirements_txt])
+    requirements_txt.write_text('six==1.16.0\n')
+    assert resolution_key([], [requirements_txt]) != key
+
+
+def test_unused_staging_directories_are_pruned(tmp_path):
+    store = DependencyStore(tmp_path / 'store')
+    old = time.time() - STAGING_MAX_AGE - 60
+    stale = store.stage({'__main__.py': 'print(1)\n'})
+    used = store.stage({'__main__.py': 'print(2)\n'})
+    for directory in (stale, used):
+        os.utime(directory, (old, old))
+    # reusing a staged directory marks it as used
+    assert store.stage({'__main__.py': 'print(2)\n'}) == used
+    new = store.stage({'__main__.py': 'print(3)\n'})
+    assert not stale.exists()
+    assert (used / '__main__.py').read_text() == 'print(2)\n'
+    assert (new / '__main__.py').read_text() == 'print(3)\n'
+
+
+def test_cached_resolution_checks_the_content_of_its_wheels(tmp_path, monkeypatch):
+    store = DependencyStore(tmp_path / 'store')
+    name = 'six-1.16.0-py2.py3-none-any.whl'
+    builds = []
+
+    def pip_wheel(wheel_dir, args, wheelhouse, offline):
+        builds.append(args)
+        (Path(wheel_dir) / name).write_bytes(b'build %d' % len(builds))
+        return 0
+
+    monkeypatch.setattr(store, '_pip_wheel', pip_wheel)
+    (wheel,) = store.resolve(['six'])
+    assert store.resolve(['six']) == [wheel]
+    assert len(builds) == 1
+
+    # a wheel of the same name and size, built for other requirements
+    rebuilt = tmp_path / name
+    rebuilt.write_bytes(b'build 9')
+    store.add_wheel(rebuilt)
+    assert store.resolve(['six']) == [wheel]
+    assert len(builds) == 2
+    assert wheel.read_bytes() == b'build 2'
@@ -0,0 +1,62 @@
+import os
+
+import jinja2
+import pytest
+
+from zipapp_utils import utils
+from zipapp_utils.utils import TEMPLATES_DIR, precompile_templates, render
+
+
+def test_rendered_templates_are_cached_until_changed(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, '_templates', type(utils._templates)())
+    template = tmp_path / 'hello.jinja.txt'
+    template.write_text('hello {{ name }}')
+    assert render(template, {'name': 'a'}) == 'hello a'
+    cached = utils._cached_template(template, (), False)
+    assert render(template, {'name': 'b'}) == 'hello b'
+    assert utils._cached_template(template, (), False) is cached
+
+    template.write_text('bye {{ name }}')
+    mtime = template.stat().st_mtime_ns + 1_000_000_000
+    os.utime(template, ns=(mtime, mtime))
+    assert render(template, {'name': 'a'}) == 'bye a'
+
+
+def test_least_recently_used_templates_are_dropped(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, '_templates', type(utils._templates)())
+    monkeypatch.setattr(utils, 'TEMPLATE_CACHE_SIZE', 2)
+    templates = []
+    for name in 'abc':
+        templates.append(tmp_path / f'{name}.jinja.txt')
+        templates[-1].write_text(name)
+    first = utils._cached_template(templates[0], (), False)
+    utils._cached_template(templates[1], (), False)
+    # using the first one again makes the second one the oldest
+    utils._cached_template(templates[0], (), False)
+    utils._cached_template(templates[2], (), False)
+    assert [key[0].name for key in utils._templates] == ['a.jinja.txt', 'c.jinja.txt']
+    assert utils._cached_template(templates[0], (), False) is first
+
+
+def test_shipped_compiled_templates_are_up_to_date():
+    if not utils._compiled_templates_manifest():
+        pytest.skip('no compiled templates, run make templates')
+    for template in TEMPLATES_DIR.glob('*.jinja.*'):
+        assert utils._is_precompiled(template), f'run make templates ({template.name})'
+
+
+def test_compiled_templates_render_like_the_sources(tmp_path, monkeypatch):
+    compiled = tmp_path / 'compiled'
+    assert '__main__.jinja.py' in precompile_templates(compiled)
+    monkeypatch.setattr(utils, 'COMPILED_TEMPLATES_DIR', compiled)
+    template = TEMPLATES_DIR / '__main__.jinja.py'
+    loaded = utils._load_template(template, (), False)
+    assert isinstance(loaded.environment.loader, jinja2.ModuleLoader)
+    data = {'script_name': 'tool'}
+    from_source = utils._environment(TEMPLATES_DIR, ()).get_template(template.name)
+    assert loaded.render(data) == from_source.render(data)
+
+    # a template changed since it was compiled is compiled again
+    (compiled / 'manifest.json').write_text('{}')
+    loaded = utils._load_template(template, (), False)
+    assert isinstance(loaded.environment.loader, jinja2.FileSystemLoader)
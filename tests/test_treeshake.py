@@ -0,0 +1,98 @@
+import zipfile
+
+from zipapp_utils.treeshake import ModuleIndex, imported_names, module_name, shake
+
+
+def make_app(root):
+    files = {
+        'tool.py': 'import pkg.cli\nimport importlib\nimportlib.import_module("dep")\n',
+        'pkg/__init__.py': '',
+        'pkg/cli.py': 'from . import helper\n\ndef run():\n    from .lazy import go\n',
+        'pkg/helper.py': 'import json\n',
+        'pkg/lazy.py': '',
+        'pkg/unused.py': 'import other\n',
+        'pkg/templates/page.html': '<html/>',
+        'other/__init__.py': '',
+        'other/settings.json': '{}',
+        'other/readme.txt': '',
+        'plugins/__init__.py': '',
+        'plugins/extra.py': '',
+        'notes.txt': '',
+    }
+    for name, content in files.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(content)
+    return root
+
+
+def make_wheel(path):
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('dep.py', 'import dep_native\n')
+        zf.writestr('dep_native/__init__.py', 'from ._speedups import *\n')
+        zf.writestr('dep_native/_speedups.cpython-311-x86_64-linux-gnu.so', b'')
+        zf.writestr('dep_native/_pure.py', '')
+        zf.writestr('dep-1.0.dist-info/METADATA', '')
+        zf.writestr('unused_dep.py', '')
+    return path
+
+
+def test_module_name():
+    assert module_name('pkg/__init__.py') == ('pkg', False)
+    assert module_name('pkg/mod.py') == ('pkg.mod', False)
+    assert module_name('pkg/_c.cpython-311-x86_64-linux-gnu.so') == ('pkg._c', True)
+    assert module_name('pkg/data.json') is None
+    assert module_name('my-scripts/run.py') is None
+
+
+def test_imported_names_resolves_relative_imports():
+    source = b'from . import a\nfrom ..b import c\nimport d.e\n'
+    assert imported_names(source, 'pkg.sub.mod', False) == {
+        'pkg.sub',
+        'pkg.sub.a',
+        'pkg',
+        'pkg.b',
+        'pkg.b.c',
+        'd',
+        'd.e',
+    }
+
+
+def test_unreached_modules_and_their_data_are_dropped(tmp_path):
+    source = make_app(tmp_path / 'src')
+    wheel = make_wheel(tmp_path / 'dep-1.0-py3-none-any.whl')
+    with ModuleIndex([source], [wheel]) as index:
+        include_set, scope = shake(
+            index,
+            {'__main__', 'tool'},
+            keep_modules=['plugins'],
+            keep_data=['*.json'],
+        )
+    kept = {name for name in scope if name in include_set}
+    dropped = scope - include_set
+    assert {
+        'tool.py',
+        'pkg/__init__.py',
+        'pkg/cli.py',
+        'pkg/helper.py',
+        # imported inside a function
+        'pkg/lazy.py',
+        # data of a reached package
+        'pkg/templates/page.html',
+        # through import_module
+        'dep.py',
+        # next to an extension module, which can import anything
+        'dep_native/_pure.py',
+        # kept as a module with its submodules
+        'plugins/extra.py',
+        # matches a keep pattern
+        'other/settings.json',
+    } <= kept
+    assert {
+        'pkg/unused.py',
+        'other/__init__.py',
+        'other/readme.txt',
+        'unused_dep.py',
+    } <= dropped
+    # outside of any package, never shaken
+    assert 'notes.txt' not in scope
+    assert 'dep-1.0.dist-info/METADATA' not in scope
@@ -0,0 +1,110 @@
+import os
+from pathlib import Path
+
+from zipapp_utils import watch as watch_module
+from zipapp_utils.watch import PollingWatcher, unchanged_except, watch
+
+
+class ScriptedWatcher:
+    """Reports the changes of script, one per wait, then interrupts."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.closed = False
+
+    def wait(self, timeout=None):
+        if not self.script:
+            raise KeyboardInterrupt
+        return self.script.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+def run_watch(monkeypatch, root, script, rebuild, **kwargs):
+    watcher = ScriptedWatcher(script)
+    monkeypatch.setattr(watch_module, 'make_watcher', lambda roots, descend: watcher)
+    watch([root], rebuild, **kwargs)
+    assert watcher.closed
+
+
+def test_burst_of_changes_rebuilds_once(tmp_path, monkeypatch):
+    calls = []
+    # the second change comes within the debounce delay of the first
+    script = [{Path('a.py')}, {Path('b.py')}, None]
+    run_watch(monkeypatch, tmp_path, script, calls.append)
+    first, rebuilt = calls
+    assert first is None
+    assert not rebuilt(tmp_path / 'a.py')
+    assert not rebuilt(tmp_path / 'b.py')
+    assert rebuilt(tmp_path / 'c.py')
+
+
+def test_ignored_and_filtered_changes_dont_rebuild(tmp_path, monkeypatch):
+    calls = []
+    script = [{Path('app.pyz')}, {Path('notes.txt')}]
+    run_watch(
+        monkeypatch,
+        tmp_path,
+        script,
+        calls.append,
+        filter=lambda path: path.suffix != '.txt',
+        ignore=[tmp_path / 'app.pyz'],
+    )
+    assert calls == [None]
+
+
+def test_failed_first_build_keeps_watching(tmp_path, monkeypatch, capsys):
+    calls = []
+
+    def rebuild(unchanged):
+        calls.append(unchanged)
+        if len(calls) == 1:
+            raise SystemExit('syntax error')
+
+    run_watch(monkeypatch, tmp_path, [{Path('a.py')}, None], rebuild)
+    # nothing was built to reuse, the second build is a full one too
+    assert calls == [None, None]
+    assert 'Rebuild failed: syntax error' in capsys.readouterr().err
+
+
+def test_changes_accumulate_until_a_rebuild_succeeds(tmp_path, monkeypatch):
+    calls = []
+
+    def rebuild(unchanged):
+        calls.append(unchanged)
+        if len(calls) == 2:
+            raise SystemExit('syntax error')
+
+    script = [{Path('a.py')}, None, {Path('b.py')}, None]
+    run_watch(monkeypatch, tmp_path, script, rebuild)
+    last = calls[-1]
+    assert not last(tmp_path / 'a.py')
+    assert not last(tmp_path / 'b.py')
+
+
+def test_unchanged_except():
+    root = Path('/src')
+    unchanged = unchanged_except([root], {Path('pkg'), Path('main.py')})
+    assert unchanged(root / 'other.py')
+    assert not unchanged(root / 'main.py')
+    # under a changed directory, like one renamed into the tree
+    assert not unchanged(root / 'pkg' / 'mod.py')
+    # not watched, like compiled files
+    assert not unchanged(Path('/tmp/mod.pyc'))
+    # lost track of what changed
+    assert not unchanged_except([root], {Path()})(root / 'other.py')
+
+
+def test_polling_watcher_reports_changed_paths(tmp_path):
+    (tmp_path / 'pkg').mkdir()
+    module = tmp_path / 'pkg' / 'mod.py'
+    module.write_text('VALUE = 1\n')
+    watcher = PollingWatcher([tmp_path], interval=0.01)
+    assert watcher.wait(0.05) is None
+    module.write_text('VALUE = 22\n')
+    (tmp_path / 'new.py').write_text('')
+    assert watcher.wait(1) == {Path('pkg/mod.py'), Path('new.py')}
+    os.unlink(tmp_path / 'new.py')
+    assert watcher.wait(1) == {Path('new.py')}
+    assert watcher.wait(0.05) is None
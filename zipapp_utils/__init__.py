@@ -2,16 +2,24 @@ __version__ = '0.3.1'
 __description__ = 'zipapp utilities'
 __app_name__ = 'zipapp-utils'
 
-try:
-    from logging_utils_tddschn import get_logger
 
-    logger, _ = get_logger(__app_name__)
-except:
-    import logging
-    from logging import NullHandler
+def __getattr__(name: str):
+    # the logger is set up on first use, so that importing the package (as
+    # the command line does) doesn't import logging
+    if name != 'logger':
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    global logger
+    try:
+        from logging_utils_tddschn import get_logger
 
-    logger = logging.getLogger(__app_name__)
-    logger.addHandler(NullHandler())
+        logger, _ = get_logger(__app_name__)
+    except:
+        import logging
+        from logging import NullHandler
+
+        logger = logging.getLogger(__app_name__)
+        logger.addHandler(NullHandler())
+    return logger
 
 
 class EntryPointNotFoundError(Exception):
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Compile python sources to unchecked-hash .pyc files.
+
+Used by zipapp_utils.bytecode, and run as a script by the interpreter the
+archive is built for, which does not need zipapp-utils installed. It only
+uses the standard library.
+
+Reads a JSON object from stdin:
+
+    {"jobs": 4, "batches": [[wheel, [[source, arcname, output], ...]], ...]}
+
+wheel is a zip file the sources are members of, or null if they are files.
+arcname is the name of the source in the archive, used in tracebacks, and
+output is where the .pyc is written. Prints a JSON object with the outputs
+that were written and the sources that failed to compile."""
+
+import json
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from importlib._bootstrap_external import _code_to_hash_pyc  # type: ignore
+from importlib.util import source_hash
+
+
+def compile_batch(batch):
+    wheel, items = batch
+    compiled, failed = [], []
+    zf = zipfile.ZipFile(wheel) if wheel is not None else None
+    try:
+        for source, arcname, output in items:
+            if zf is None:
+                with open(source, 'rb') as f:
+                    data = f.read()
+            else:
+                data = zf.read(source)
+            try:
+                code = compile(data, arcname, 'exec', dont_inherit=True)
+            except (SyntaxError, ValueError) as e:
+                failed.append([arcname, str(e)])
+                continue
+            pyc = _code_to_hash_pyc(code, source_hash(data), checked=False)
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            with open(output, 'wb') as f:
+                f.write(pyc)
+            compiled.append(output)
+    finally:
+        if zf is not None:
+            zf.close()
+    return compiled, failed
+
+
+def main():
+    request = json.load(sys.stdin)
+    batches = request['batches']
+    if request['jobs'] > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=request['jobs']) as executor:
+            results = list(executor.map(compile_batch, batches))
+    else:
+        results = [compile_batch(batch) for batch in batches]
+    json.dump(
+        {
+            'compiled': [output for compiled, _ in results for output in compiled],
+            'failed': [failure for _, failed in results for failure in failed],
+        },
+        sys.stdout,
+    )
+
+
+if __name__ == '__main__':
+    main()
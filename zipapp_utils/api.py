@@ -1,14 +1,45 @@
 #!/usr/bin/env python3
 
+import logging
+import re
+import shutil
+import sys
+from contextlib import ExitStack
+from collections.abc import Sequence
 from pathlib import Path
+from tempfile import TemporaryFile
+from .extract import NATIVE_PATTERNS
+from .layout import HOT_STORE_LIMIT, load_trace
+from .store import DependencyStore, default_store_dir
 from .utils import (
-    create_main_py,
-    encode_file,
+    render_main_py,
+    hash_stream,
     render,
-    print_or_write_content,
+    render_around,
+    set_executable,
     create_archive_with_logging,
 )
-from . import EntryPointNotFoundError, ProjectNameNotFoundError, logger
+from .payload import (
+    COPY_BUFSIZE,
+    HEREDOC_DELIMITER,
+    decoder_command,
+    write_payload,
+)
+from . import EntryPointNotFoundError, ProjectNameNotFoundError, logger, timings
+
+# library users follow the phases of builds through these, see timings.py
+from .timings import TimingRecorder, subscribe, unsubscribe
+
+
+def default_output(command: str, source: Path) -> Path:
+    """Where a build of command writes its output when none is given:
+    next to source, or for py2pyz next to the directory of the script."""
+    source = source.resolve()
+    if command == 'create-shell-script':
+        return source.with_suffix('.sh')
+    if command == 'py2pyz':
+        return source.parent.with_suffix('.pyz')
+    return source.with_suffix('.pyz')
 
 
 def create_archive_zau(
@@ -17,30 +48,112 @@ def create_archive_zau(
     python: str | None = None,
     main: str | None = None,
     compress: bool = False,
+    jobs: int = 1,
+    incremental: bool = False,
+    extra_sources: Sequence[Path] = (),
+    wheels: Sequence[Path] = (),
+    main_py: str | None = None,
+    compile: bool = False,
+    compile_python: str | None = None,
+    sourceless: bool = False,
+    compress_level: int | None = None,
+    store_incompressible: bool = False,
+    trace: Path | None = None,
+    hot_store_limit: int = HOT_STORE_LIMIT,
+    extract_native: bool = False,
+    extract: list[str] = [],
+    deterministic: bool = False,
+    skip_unchanged: bool = False,
+    watch: bool = False,
+    max_size: int | None = None,
     **kwargs,
 ) -> Path:
 
     # copied from zipapp.py from cpython source
     # Handle `python -m zipapp archive.pyz --info`.
     source = source.resolve()
-    output = output.resolve() if output is not None else source.with_suffix('.pyz')
+    output = (
+        output.resolve()
+        if output is not None
+        else default_output('create-archive', source)
+    )
 
     if source.is_file():
-        if output is None or (output.exists() and source.samefile(output)):
-            raise SystemExit("In-place editing of archives is not supported")
         if main:
             raise SystemExit("Cannot change the main function when copying")
+        if watch:
+            raise SystemExit("Can only watch a source directory")
+        if output.exists() and source.samefile(output):
+            # only the shebang changes, see retarget.py
+            from zipfile import BadZipFile
+            from .retarget import retarget
+
+            try:
+                done = retarget(output, python)
+            except BadZipFile as e:
+                raise SystemExit(f'{output}: {e}')
+            logger.info(f'{output}: {done}')
+            return output
 
-    def do_create_archive():
+    filter = kwargs['filter'] if 'filter' in kwargs else None
+
+    if watch:
+        # like the roots of the watcher, see unchanged below
+        extra_sources = [path.resolve() for path in extra_sources]
+
+    def do_create_archive(unchanged=None):
         create_archive_with_logging(
             logger,
             source,
             output,
             interpreter=python,
             main=main,
-            filter=kwargs['filter'] if 'filter' in kwargs else None,
+            filter=filter,
             compressed=compress,
+            jobs=jobs,
+            # rebuilds of watch mode only compress what changed
+            incremental=incremental or watch,
+            extra_sources=extra_sources,
+            wheels=wheels,
+            main_py=main_py,
+            compile_bytecode=compile,
+            compile_python=compile_python,
+            sourceless=sourceless,
+            compresslevel=compress_level,
+            store_incompressible=store_incompressible,
+            trace=load_trace(trace) if trace is not None else (),
+            hot_store_limit=hot_store_limit,
+            extract=(NATIVE_PATTERNS if extract_native else []) + extract,
+            deterministic=deterministic,
+            skip_unchanged=skip_unchanged,
+            # files the watcher saw no change to since the last rebuild
+            unchanged=unchanged,
+        )
+        if max_size is not None:
+            from .inspection import check_max_size
+
+            # only the size of the file is needed, not a full report
+            report = {'pyz': str(output), 'archive_size': output.stat().st_size}
+            error = check_max_size(report, max_size)
+            if error is not None:
+                raise SystemExit(error)
+
+    if watch:
+        from .incremental import manifest_path
+        from .watch import watch as watch_sources
+
+        # the archive is still built, and keeps being rebuilt until interrupted
+        watch_sources(
+            [source, *extra_sources],
+            do_create_archive,
+            filter=filter,
+            ignore=[
+                output,
+                output.with_name(output.name + '.tmp'),
+                manifest_path(output),
+            ],
         )
+        return output
 
     do_create_archive()
     return output
@@ -64,21 +177,110 @@ def create_archive_zau(
 def create_shell_script(
     pyz: Path,
     output: Path | None = None,
+    format: str = 'base64',
+    codec: str = 'none',
+    encoding: str = 'base64',
+    payload: str = 'variable',
     **kwargs,
-) -> Path:
-    pyz = pyz.resolve()
-    bundle_and_run_pyz_template_path = (
-        Path(__file__).parent / "templates" / "bundle_and_run_pyz.jinja.sh"
-    )
-    data = {'encoded_pyz_file': encode_file(pyz)}
-    shellscript_content = render(bundle_and_run_pyz_template_path, data)
-    output_content = shellscript_content.strip()
-    if output is None:
-        output = pyz.with_suffix('.sh')
-    print_or_write_content(output_content, output, True)
+) -> Path | None:
+    """Create a shell script that runs pyz.
+
+    With the base64 format, pyz is embedded as an encoded payload, which is
+    written in chunks straight into the output file, so memory use does not
+    depend on the size of pyz. The script extracts the archive once into a
+    per-user cache keyed by its sha256, later runs execute the cached archive
+    without decoding. The payload can be compressed (codec), encoded as
+    base64 or base85, and embedded in a shell variable or a heredoc (payload).
+
+    With the polyglot format, the raw archive is appended to a stub that
+    runs the script itself with python, which works because zipimport skips
+    data in front of an archive. Nothing is decoded or extracted.
+
+    If pyz is `-` the archive is read from stdin, and the script is written
+    to stdout unless output is given.
+
+    Returns:
+        The path of the script, or None if it was written to stdout."""
+    read_stdin = str(pyz) == '-'
+    if not read_stdin:
+        pyz = pyz.resolve()
+        if output is None:
+            output = default_output('create-shell-script', pyz)
+    templates_dir = Path(__file__).parent / "templates"
+    with ExitStack() as stack:
+        if read_stdin and format == 'base64':
+            # the hash goes before the payload, so stdin is spooled first
+            src = stack.enter_context(TemporaryFile())
+            pyz_sha256 = hash_stream(sys.stdin.buffer, src)
+            src.seek(0)
+        elif read_stdin:
+            src = sys.stdin.buffer
+        else:
+            src = stack.enter_context(open(pyz, 'rb'))
+        dst = (
+            sys.stdout.buffer
+            if output is None
+            else stack.enter_context(open(output, 'wb'))
+        )
+
+        if format == 'polyglot':
+            # like zipapp._copy_archive, drop the shebang of the archive
+            interpreter = None
+            first_2 = src.read(2)
+            if first_2 == b'#!':
+                interpreter = src.readline().decode('utf-8').strip()
+                first_2 = b''
+            stub = render(
+                templates_dir / "run_appended_pyz.jinja.sh",
+                {'interpreter': interpreter or 'python3'},
+            )
+            dst.write(stub.lstrip().encode())
+            dst.write(first_2)
+            with timings.span('encode'):
+                shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+        else:
+            if not read_stdin:
+                pyz_sha256 = hash_stream(src)
+                src.seek(0)
+            header, footer = render_around(
+                templates_dir / "bundle_and_run_pyz.jinja.sh",
+                {
+                    'pyz_sha256': pyz_sha256,
+                    'payload': payload,
+                    'decoder': decoder_command(codec, encoding),
+                    'heredoc_delimiter': HEREDOC_DELIMITER,
+                },
+                'encoded_pyz_file',
+            )
+            dst.write(header.lstrip().encode())
+            with timings.span('encode'):
+                write_payload(src, dst, codec, encoding, wrap=payload == 'heredoc')
+            dst.write(footer.rstrip().encode())
+    if output is not None:
+        set_executable(output)
     return output
 
 
+def profile_pyz(
+    pyz: Path,
+    python: str | None = None,
+    trials: int = 5,
+    top: int = 20,
+    json: bool = False,
+    app_args: list[str] = [],
+    **kwargs,
+) -> str:
+    """Run pyz under -X importtime and report where its startup time goes,
+    see importtime.profile_archive."""
+    from .importtime import format_report, profile_archive
+
+    pyz = pyz.resolve()
+    if not pyz.is_file():
+        raise SystemExit(f'{str(pyz)} does not exist')
+    report = profile_archive(pyz, python=python, args=app_args, trials=trials)
+    return format_report(report, top=top, as_json=json)
+
+
 def py2pyz(
     source: Path,
     dep: list[str] = [],
@@ -88,128 +290,293 @@ def py2pyz(
     python: str | None = None,
     main: str | None = None,
     compress: bool = False,
+    jobs: int = 1,
+    incremental: bool = False,
+    store: Path | None = None,
+    wheelhouse: Path | None = None,
+    offline: bool = False,
+    refresh: bool = False,
+    compile: bool = False,
+    compile_python: str | None = None,
+    sourceless: bool = False,
+    tree_shake: bool = False,
+    keep_module: list[str] = [],
+    keep_data: list[str] = [],
+    compress_level: int | None = None,
+    store_incompressible: bool = False,
+    trace: Path | None = None,
+    hot_store_limit: int = HOT_STORE_LIMIT,
+    extract_native: bool = False,
+    extract: list[str] = [],
+    deterministic: bool = False,
+    skip_unchanged: bool = False,
+    max_size: int | None = None,
     **kwargs,
 ) -> Path:
-    logger.info(f'Creating pyz from {source}')
-    logger.info(f'args:')
-    logger.info(f'source: {source}')
-    logger.info(f'dep: {dep}')
-    logger.info(f'use_requirements_txt: {use_requirements_txt}')
-    logger.info(f'requirement: {requirement}')
-    logger.info(f'output: {output}')
-    logger.info(f'python: {python}')
-    logger.info(f'main: {main}')
-    logger.info(f'compress: {compress}')
-    logger.info(f'kwargs: {kwargs}')
+    # formatting all of this is not free, skip it unless it is shown
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f'Creating pyz from {source}')
+        logger.info(f'args:')
+        logger.info(f'source: {source}')
+        logger.info(f'dep: {dep}')
+        logger.info(f'use_requirements_txt: {use_requirements_txt}')
+        logger.info(f'requirement: {requirement}')
+        logger.info(f'output: {output}')
+        logger.info(f'python: {python}')
+        logger.info(f'main: {main}')
+        logger.info(f'compress: {compress}')
+        logger.info(f'jobs: {jobs}')
+        logger.info(f'incremental: {incremental}')
+        logger.info(f'store: {store}')
+        logger.info(f'wheelhouse: {wheelhouse}')
+        logger.info(f'offline: {offline}')
+        logger.info(f'compile: {compile}')
+        logger.info(f'compile_python: {compile_python}')
+        logger.info(f'sourceless: {sourceless}')
+        logger.info(f'tree_shake: {tree_shake}')
+        logger.info(f'keep_module: {keep_module}')
+        logger.info(f'keep_data: {keep_data}')
+        logger.info(f'compress_level: {compress_level}')
+        logger.info(f'store_incompressible: {store_incompressible}')
+        logger.info(f'trace: {trace}')
+        logger.info(f'extract_native: {extract_native}')
+        logger.info(f'extract: {extract}')
+        logger.info(f'deterministic: {deterministic}')
+        logger.info(f'skip_unchanged: {skip_unchanged}')
+        logger.info(f'max_size: {max_size}')
+        logger.info(f'kwargs: {kwargs}')
     source = source.resolve()
     source_parent_dir = source.parent
-    source_parent_dir_s = str(source_parent_dir)
     output = (
-        output.resolve()
-        if output is not None
-        else source_parent_dir.with_suffix('.pyz')
+        output.resolve() if output is not None else default_output('py2pyz', source)
     )
+    requirement_files = []
     if use_requirements_txt:
         if requirement is None:
             requirement = source.with_name('requirements.txt')
         if not requirement.exists():
             raise SystemExit(f'Requirements file {str(requirement)} does not exist')
-        from pip._internal.utils.entrypoints import _wrapper
-
-        pip_args = ['install', '-r', str(requirement), '--target', source_parent_dir_s]
         logger.info(f'Using requirements file {str(requirement)}')
-        logger.info(f'Running pip with args: {pip_args}')
-        _wrapper(pip_args)
-    if dep:
-        from pip._internal.utils.entrypoints import _wrapper
-
-        pip_args = ['install', '-U'] + dep + ['--target', source_parent_dir_s]
-        logger.info(f'Running pip with args: {pip_args}')
-        _wrapper(pip_args)
-
-    # for dist_info_dir in Path(source_parent_dir_s).glob('*.dist-info'):
-    #     # rm -rf *.dist-info
-    #     from shutil import rmtree
+        requirement_files.append(requirement)
 
-    #     rmtree(dist_info_dir)
+    # dependencies are resolved once into the store and their wheels copied
+    # into the archive, nothing is installed into the source directory
+    dependency_store = DependencyStore(store or default_store_dir())
+    wheels = dependency_store.resolve(
+        dep, requirement_files, wheelhouse=wheelhouse, offline=offline, refresh=refresh
+    )
 
+    main_py = None
     has_main = (source_parent_dir / '__main__.py').is_file()
     if not has_main:
-        # creates __main__.py if it doesn't exist
-        main_py = create_main_py(source, main)
-        logger.info(f'Created {str(main_py)}')
+        # __main__.py is only generated into the archive
+        main_py = render_main_py(source, main)
+
+    filter = kwargs['filter'] if 'filter' in kwargs else None
+    if tree_shake:
+        from .filters import IncludeSetFilter
+        from .treeshake import ModuleIndex, imported_names, shake
+
+        # the script is imported by __main__.py, which is always kept
+        roots = {'__main__', source.stem}
+        if main_py is not None:
+            roots |= imported_names(main_py.encode(), '__main__', False)
+        with ModuleIndex([source_parent_dir], wheels, filter) as index:
+            with timings.span('tree shake'):
+                include_set, scope = shake(index, roots, keep_module, keep_data)
+        filter = IncludeSetFilter(include_set, scope, filter)
 
     # if 'output' not in args:
     #     output = source.with_suffix('.pyz')
     # if you do this, you'll add the pyz file in that dir and increase the dir size, and might cause issues if you zip that dir
 
-    # from zipapp import create_archive
-
-    # create_archive_with_logging(
-    #     logger,
-    #     source_parent_dir_s,
-    #     target=output,
-    #     interpreter=python,
-    #     main=main,
-    #     filter=kwargs['filter'] if 'filter' in kwargs else None,
-    #     compressed=compress,
-    # )
-    # return source.with_suffix('.pyz') if output is None else output
-
-    create_archive_zau(
+    return create_archive_zau(
         source_parent_dir,
-        target=output,
-        interpreter=python,
-        main=main,
-        filter=kwargs['filter'] if 'filter' in kwargs else None,
-        compressed=compress,
+        output=output,
+        python=python,
+        compress=compress,
+        jobs=jobs,
+        incremental=incremental,
+        wheels=wheels,
+        main_py=main_py,
+        compile=compile,
+        compile_python=compile_python,
+        sourceless=sourceless,
+        compress_level=compress_level,
+        store_incompressible=store_incompressible,
+        trace=trace,
+        hot_store_limit=hot_store_limit,
+        extract_native=extract_native,
+        extract=extract,
+        deterministic=deterministic,
+        skip_unchanged=skip_unchanged,
+        max_size=max_size,
+        filter=filter,
     )
 
 
 def poetry2pyz(
-    poetry_project: Path, output: Path | None = None, bin: str | None = None, **kwargs
+    poetry_project: Path,
+    output: Path | None = None,
+    bin: str | None = None,
+    python: str | None = None,
+    extras: list[str] = [],
+    compress: bool = False,
+    compress_level: int | None = None,
+    jobs: int = 1,
+    store: Path | None = None,
+    wheelhouse: Path | None = None,
+    offline: bool = False,
+    compile: bool = False,
+    compile_python: str | None = None,
+    skip_unchanged: bool = False,
+    max_size: int | None = None,
+    **kwargs,
 ) -> Path:
+    """Build an archive of a poetry project from the versions pinned in its
+    poetry.lock, see lockfile.py. The archive is deterministic, and runs
+    the script bin of the project (named like the project by default).
+
+    Only the packages of the project (its [tool.poetry] packages, or the
+    package named like it) and the wheels of its main dependencies, with
+    extras, go into the archive."""
+    from .filters import IncludeSetFilter, PatternFilter
+    from .lockfile import (
+        PROJECT_EXCLUDE_PATTERNS,
+        entry_point,
+        locked_packages,
+        locked_wheels,
+        project_config,
+        project_sources,
+        read_toml,
+    )
+
     poetry_project = poetry_project.resolve()
     pyproject_toml_path = poetry_project / 'pyproject.toml'
-    from poetry.core.pyproject.toml import PyProjectTOML
+    lock_path = poetry_project / 'poetry.lock'
+    config = project_config(read_toml(pyproject_toml_path), pyproject_toml_path)
+    main = entry_point(config, bin, pyproject_toml_path)
+    output = (
+        output.resolve() if output is not None else poetry_project.with_suffix('.pyz')
+    )
+    logger.info(f'Creating {output} from {lock_path}, running {main}')
 
-    ppt = PyProjectTOML(pyproject_toml_path)
-    try:
-        all_entry_point_commands = set(ppt.poetry_config['scripts'])  # type: ignore
-    except:
-        raise EntryPointNotFoundError(
-            f'No entry point found in {str(pyproject_toml_path)}'
-        )
-    if bin is None:
-        try:
-            project_name = ppt.poetry_config['name']  # type: ignore
-            assert project_name != ''
-        except:
-            raise ProjectNameNotFoundError(
-                f'No project name found in {str(pyproject_toml_path)}. It\'s used as the default entry point if --bin is not specified.'
-            )
-        bin = project_name
-    if bin not in all_entry_point_commands:
-        raise EntryPointNotFoundError(
-            f'No entry point found in {str(pyproject_toml_path)} for {bin}'
-        )
+    lock = read_toml(lock_path) if config['dependencies'] else {}
+    packages = locked_packages(lock, config, extras)
+    wheels = locked_wheels(
+        lock,
+        packages,
+        poetry_project,
+        DependencyStore(store or default_store_dir()),
+        wheelhouse=wheelhouse,
+        offline=offline,
+        jobs=jobs,
+    )
+    sources, names, left_out = project_sources(poetry_project, config)
+    logger.info(f'Packages {sorted(names)} of {[str(s) for s in sources]}')
+    if output.parent in sources:
+        left_out.add(output.name)
+    # everything else at the top of the source directories is left out,
+    # nothing below it is walked
+    filter = IncludeSetFilter(
+        set(), left_out, PatternFilter(poetry_project, PROJECT_EXCLUDE_PATTERNS)
+    )
 
-    return poetry_project.with_suffix('.pyz') if output is None else output
+    return create_archive_zau(
+        sources[0],
+        output=output,
+        python=python,
+        main=main,
+        compress=compress,
+        compress_level=compress_level,
+        jobs=jobs,
+        extra_sources=sources[1:],
+        wheels=wheels,
+        compile=compile,
+        compile_python=compile_python,
+        deterministic=True,
+        skip_unchanged=skip_unchanged,
+        max_size=max_size,
+        filter=filter,
+    )
 
 
 def pip2pyz(
-    pip_package: str, output: Path | None = None, bin: str | None = None, **kwargs
+    pip_package: str,
+    output: Path | None = None,
+    bin: str | None = None,
+    python: str | None = None,
+    compress: bool = False,
+    compress_level: int | None = None,
+    jobs: int = 1,
+    store: Path | None = None,
+    wheelhouse: Path | None = None,
+    offline: bool = False,
+    refresh: bool = False,
+    compile: bool = False,
+    compile_python: str | None = None,
+    deterministic: bool = False,
+    skip_unchanged: bool = False,
+    max_size: int | None = None,
+    **kwargs,
 ) -> Path:
-    from pip._internal.utils.entrypoints import _wrapper
-
-    # make a secure temp dir
-    from tempfile import TemporaryDirectory
-
-    tempdir = TemporaryDirectory()
-    tempdir_path = Path(tempdir.name)
-    _wrapper(['install', pip_package, '--target', str(tempdir_path)])
-    return (
-        Path(f'./{pip_package}').resolve().with_suffix('.pyz')
-        if output is None
-        else output
+    """Build an archive running a console script of a pip package.
+
+    The package and its dependencies are resolved to wheels in the
+    dependency store once (see store.py), and the archive is written from
+    the wheels, nothing is installed. The console script bin (named like
+    the package by default) is looked up in the entry points of the wheel
+    of the package, then of its dependencies, and the __main__.py running
+    it is staged in the store, so repeated builds of the same package
+    reuse both."""
+    from .store import console_scripts, wheel_name_version
+
+    # the name of a requirement like black[d]==22.3.0, None for a path or URL
+    match = re.match(r'[A-Za-z0-9][\w.-]*(?=\s*(?:[\[<>=!~;@]|$))', pip_package)
+    name = match.group() if match is not None else None
+    if bin is None:
+        if name is None:
+            raise EntryPointNotFoundError(f'--bin is required to build {pip_package}')
+        bin = name
+    dependency_store = DependencyStore(store or default_store_dir())
+    wheels = dependency_store.resolve(
+        [pip_package], wheelhouse=wheelhouse, offline=offline, refresh=refresh
+    )
+    normalized_name = name and name.lower().replace('_', '-').replace('.', '-')
+    # the scripts of the package itself win
+    wheels_by_priority = sorted(
+        wheels, key=lambda wheel: wheel_name_version(wheel)[0] != normalized_name
+    )
+    for wheel in wheels_by_priority:
+        scripts = console_scripts(wheel)
+        if bin in scripts:
+            entry_point = scripts[bin]
+            break
+    else:
+        available = sorted(
+            script for wheel in wheels for script in console_scripts(wheel)
+        )
+        raise EntryPointNotFoundError(
+            f'No console script {bin} in {pip_package} or its dependencies'
+            + (f', there are {", ".join(available)}' if available else '')
+        )
+    logger.info(f'Running {bin} = {entry_point} of {wheel.name}')
+    staging = dependency_store.stage(
+        {'__main__.py': render_main_py(Path(bin), entry_point)}
+    )
+
+    return create_archive_zau(
+        staging,
+        output=output if output is not None else Path(f'{bin}.pyz').resolve(),
+        python=python,
+        compress=compress,
+        compress_level=compress_level,
+        jobs=jobs,
+        wheels=wheels,
+        compile=compile,
+        compile_python=compile_python,
+        deterministic=deterministic,
+        skip_unchanged=skip_unchanged,
+        max_size=max_size,
+        filter=kwargs.get('filter'),
     )
@@ -0,0 +1,652 @@
+#!/usr/bin/env python3
+"""Native zipapp archive writer that compresses entries on a thread pool.
+
+The output is byte for byte identical to ``zipapp.create_archive``:
+entries are visited in the same order as ``Path.rglob('*')``, headers are
+built with ``ZipInfo.from_file`` and deflate uses the same zlib settings.
+Only the compression work is moved to worker threads (zlib releases the GIL),
+the archive itself is always written sequentially by the calling thread.
+A Layout (see layout.py) can change the compression and order of entries."""
+
+import os
+import shutil
+import stat
+import struct
+import zlib
+import zipfile
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING
+
+from . import logger, timings
+from .layout import HOT_STORE_LIMIT, Layout
+
+if TYPE_CHECKING:
+    from .incremental import IncrementalBuild
+
+# files larger than this are streamed by the writer thread instead of being
+# read into memory by a worker
+STREAMING_THRESHOLD = 16 * 1024 * 1024
+COPY_BUFSIZE = 1024 * 1024
+
+
+def resolve_jobs(jobs: int | None) -> int:
+    """Turn the --jobs value into a worker count, 0 or None means all cores."""
+    if not jobs:
+        return os.cpu_count() or 1
+    return max(1, jobs)
+
+
+def iter_tree(
+    source: Path,
+    descend: Callable[[Path], bool] | None = None,
+    sort: bool = False,
+) -> Iterator[tuple[Path, Path, bool]]:
+    """Yield (path, path relative to source, is_dir) for everything under
+    source, in the order of source.rglob('*'), or with the entries of every
+    directory sorted by name if sort is set.
+
+    Scans every directory once (rglob scans each one twice). If descend is
+    given, directories for which it returns False are not walked into."""
+
+    def walk(directory: Path, reldir: Path) -> Iterator[tuple[Path, Path, bool]]:
+        try:
+            with os.scandir(directory) as scandir_it:
+                entries = list(scandir_it)
+        except PermissionError:
+            return
+        if sort:
+            entries.sort(key=lambda entry: entry.name)
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            yield directory / entry.name, reldir / entry.name, is_dir
+        for entry in entries:
+            try:
+                entry_is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                entry_is_dir = False
+            if entry_is_dir and (descend is None or descend(reldir / entry.name)):
+                yield from walk(directory / entry.name, reldir / entry.name)
+
+    return walk(source, Path())
+
+
+def compress_file(
+    path: Path, zinfo: zipfile.ZipInfo, layout: Layout
+) -> tuple[int, bytes]:
+    """Read a file and compress it the way ZipFile.write would, or as
+    layout decides.
+
+    Returns:
+        The CRC32 of the uncompressed data and the (compressed) payload."""
+    return layout.compress(path.read_bytes(), zinfo)
+
+
+def write_file(
+    zf: zipfile.ZipFile,
+    path: Path,
+    zinfo: zipfile.ZipInfo,
+    compresslevel: int | None = None,
+) -> None:
+    """ZipFile.write, but with zinfo prepared by the caller, streaming the
+    file instead of reading it at once."""
+    if zinfo.is_dir():
+        write_compressed_entry(zf, zinfo, 0, b'')
+        return
+    zinfo._compresslevel = zf.compresslevel if compresslevel is None else compresslevel
+    with open(path, 'rb') as src, zf.open(zinfo, 'w') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 8)
+
+
+def write_compressed_entry(
+    zf: zipfile.ZipFile,
+    zinfo: zipfile.ZipInfo,
+    crc: int,
+    payload: bytes | Iterable[bytes],
+    compress_size: int | None = None,
+) -> None:
+    """Write an entry whose payload is already compressed.
+
+    Mirrors ZipFile._open_to_write and _ZipWriteFile.close for a seekable
+    target, so the local header is identical to what ZipFile.write produces.
+    The payload can be given as an iterable of chunks if compress_size is set."""
+    zinfo.flag_bits = 0x00
+    if not zinfo.external_attr:
+        zinfo.external_attr = 0o600 << 16
+    zinfo.CRC = crc
+    zinfo.compress_size = len(payload) if compress_size is None else compress_size
+    zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    if zip64 and not zf._allowZip64:
+        raise zipfile.LargeZipFile("Filesize would require ZIP64 extensions")
+    with zf._lock:
+        zf.fp.seek(zf.start_dir)
+        zinfo.header_offset = zf.fp.tell()
+        zf._writecheck(zinfo)
+        zf._didModify = True
+        zf.fp.write(zinfo.FileHeader(zip64))
+        if compress_size is None:
+            zf.fp.write(payload)
+        else:
+            for chunk in payload:
+                zf.fp.write(chunk)
+        zf.start_dir = zf.fp.tell()
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+
+
+def raw_payload_offset(fd: int, info: zipfile.ZipInfo) -> int:
+    """Offset of the (compressed) data of an entry read from an archive."""
+    header = os.pread(fd, zipfile.sizeFileHeader, info.header_offset)
+    fheader = struct.unpack(zipfile.structFileHeader, header)
+    return (
+        info.header_offset
+        + zipfile.sizeFileHeader
+        + fheader[zipfile._FH_FILENAME_LENGTH]
+        + fheader[zipfile._FH_EXTRA_FIELD_LENGTH]
+    )
+
+
+def iter_raw_payload(fd: int, info: zipfile.ZipInfo) -> Iterator[bytes]:
+    """Read the data of an entry as stored in the archive, without
+    decompressing it. Uses pread, so it is safe to share fd between threads."""
+    offset = raw_payload_offset(fd, info)
+    remaining = info.compress_size
+    while remaining:
+        chunk = os.pread(fd, min(COPY_BUFSIZE, remaining), offset)
+        if not chunk:
+            raise zipfile.BadZipFile(f'Truncated entry {info.filename}')
+        offset += len(chunk)
+        remaining -= len(chunk)
+        yield chunk
+
+
+def wheel_arcname(name: str) -> str | None:
+    """Where an entry of a wheel goes in the archive, None to leave it out.
+
+    Like pip install --target, purelib and platlib in the .data directory
+    go to the root, and scripts, headers and data are dropped."""
+    top, _, rest = name.partition('/')
+    if top.endswith('.data'):
+        scheme, _, rest = rest.partition('/')
+        if scheme not in ('purelib', 'platlib') or not rest:
+            return None
+        return rest
+    return name
+
+
+def copy_wheel(
+    zf: zipfile.ZipFile,
+    wheel: Path,
+    accept: Callable[..., bool] | None,
+    seen: set[str],
+    layout: Layout | None = None,
+) -> None:
+    """Copy the entries of a wheel into zf without recompressing them.
+
+    The compressed data is copied as is, only the local headers are written
+    again, with the names the entries have in the archive. Parent directory
+    entries, which wheels don't have, are added like a directory walk would."""
+    with zipfile.ZipFile(wheel) as wheel_zf:
+        infos = wheel_zf.infolist()
+    fd = os.open(wheel, os.O_RDONLY)
+    try:
+        for info in infos:
+            arcname = wheel_arcname(info.filename)
+            if arcname is None or info.is_dir() or info.flag_bits & 0x1:
+                continue
+            if arcname in seen or (
+                accept is not None and not accept(Path(arcname), is_dir=False)
+            ):
+                continue
+            copy_wheel_entry(zf, fd, info, arcname, seen, layout)
+    finally:
+        os.close(fd)
+
+
+def copy_wheel_entry(
+    zf: zipfile.ZipFile,
+    fd: int,
+    info: zipfile.ZipInfo,
+    arcname: str,
+    seen: set[str],
+    layout: Layout | None = None,
+) -> None:
+    """Copy one entry of the wheel open at fd, see copy_wheel."""
+    parent = arcname
+    missing_dirs = []
+    while '/' in parent:
+        parent = parent.rpartition('/')[0]
+        if parent + '/' in seen:
+            break
+        missing_dirs.append(parent + '/')
+    for dirname in reversed(missing_dirs):
+        dir_info = zipfile.ZipInfo(dirname, date_time=info.date_time)
+        dir_info.external_attr = (0o40755 << 16) | 0x10
+        if layout is not None:
+            layout.normalize(dir_info)
+        write_compressed_entry(zf, dir_info, 0, b'')
+        seen.add(dirname)
+    seen.add(arcname)
+    zinfo = zipfile.ZipInfo(arcname, date_time=info.date_time)
+    zinfo.external_attr = info.external_attr
+    zinfo.compress_type = info.compress_type
+    zinfo.file_size = info.file_size
+    if layout is not None:
+        layout.normalize(zinfo)
+    write_compressed_entry(
+        zf,
+        zinfo,
+        info.CRC,
+        iter_raw_payload(fd, info),
+        compress_size=info.compress_size,
+    )
+
+
+def _accept_and_descend(
+    filter: Callable[[Path], bool] | None,
+) -> tuple[Callable[..., bool] | None, Callable[[Path], bool] | None]:
+    """Adapt filter to be called as accept(arcname, is_dir=...), and if it
+    excludes everything below the directories it excludes, make a descend
+    callback for iter_tree so those are not walked at all."""
+    if filter is None:
+        return None, None
+    if getattr(filter, 'prunes_directories', False):
+        return filter, partial(filter, is_dir=True)
+    return lambda arcname, is_dir: filter(arcname), None  # type: ignore
+
+
+def iter_entries(
+    sources: Sequence[Path],
+    accept: Callable[..., bool] | None,
+    descend: Callable[[Path], bool] | None = None,
+    sort: bool = False,
+) -> Iterator[tuple[Path, Path, bool]]:
+    """Yield (path, arcname, is_dir) of the accepted entries of all sources."""
+    for source in sources:
+        for child, arcname, is_dir in iter_tree(source, descend, sort):
+            if accept is None or accept(arcname, is_dir=is_dir):
+                yield child, arcname, is_dir
+
+
+def write_tree(
+    zf: zipfile.ZipFile,
+    sources: Sequence[Path],
+    filter: Callable[[Path], bool] | None = None,
+    jobs: int = 1,
+    incremental: 'IncrementalBuild | None' = None,
+    wheels: Sequence[Path] = (),
+    layout: Layout | None = None,
+) -> None:
+    """Add the filtered content of sources to zf, compressing on jobs threads.
+
+    The sources, then the wheels, are merged into the root of the archive,
+    if several of them contain the same path the first one wins. Entries
+    of wheels are copied without recompressing them. With an incremental build,
+    unchanged entries are copied from the previous archive instead of being
+    compressed again. layout decides how entries are compressed, and which
+    of them are written first (see layout.py)."""
+    if layout is None:
+        layout = Layout(zf.compression, zf.compresslevel)
+
+    accept, descend = _accept_and_descend(filter)
+    if accept is not None:
+        accept = timings.timed('filter', accept)
+    seen: set[str] | None = (
+        set() if len(sources) > 1 or wheels or layout.trace else None
+    )
+
+    def entries() -> Iterator[tuple[Path, zipfile.ZipInfo]]:
+        walk = iter_entries(sources, accept, descend, sort=layout.deterministic)
+        for child, arcname, is_dir in timings.timed_iter('walk', walk):
+            zinfo = zipfile.ZipInfo.from_file(
+                child, arcname.as_posix(), strict_timestamps=True
+            )
+            if seen is not None:
+                if zinfo.filename in seen:
+                    continue
+                seen.add(zinfo.filename)
+            layout.normalize(zinfo)
+            if not is_dir:
+                # directories are always stored, like ZipFile.write does
+                zinfo.compress_type = layout.compress_type(
+                    zinfo.filename, zinfo.file_size
+                )
+            yield child, zinfo
+
+    def build(child: Path, zinfo: zipfile.ZipInfo) -> tuple[int, bytes] | None:
+        if zinfo.is_dir() or zinfo.file_size > STREAMING_THRESHOLD:
+            return None
+        if incremental is not None:
+            return incremental.build_entry(child, zinfo)
+        return compress_file(child, zinfo, layout)
+
+    def write(child: Path, zinfo: zipfile.ZipInfo, result) -> None:
+        if result is not None:
+            write_compressed_entry(zf, zinfo, *result)
+        elif incremental is not None and not zinfo.is_dir():
+            incremental.write_large_entry(zf, child, zinfo)
+        else:
+            write_file(zf, child, zinfo, layout.compresslevel)
+
+    build = timings.timed('compress', build)
+    write = timings.timed('write', write)
+    if layout.trace:
+        assert seen is not None
+        _write_trace(zf, sources, wheels, accept, layout, seen, build, write)
+    if jobs <= 1:
+        for child, zinfo in entries():
+            write(child, zinfo, build(child, zinfo))
+    else:
+        _write_parallel(entries(), build, write, jobs)
+    for wheel in wheels:
+        assert seen is not None
+        copy_wheel(zf, wheel, accept, seen, layout)
+
+
+def _write_trace(
+    zf: zipfile.ZipFile,
+    sources: Sequence[Path],
+    wheels: Sequence[Path],
+    accept: Callable[..., bool] | None,
+    layout: Layout,
+    seen: set[str],
+    build: Callable,
+    write: Callable,
+) -> None:
+    # write the entries of the trace first, each from where the walk would
+    # take it: the first source that has it, else the first wheel
+    wheel_members: dict[str, tuple[Path, zipfile.ZipInfo]] = {}
+    for wheel in wheels:
+        with zipfile.ZipFile(wheel) as wheel_zf:
+            for info in wheel_zf.infolist():
+                arcname = wheel_arcname(info.filename)
+                if arcname in layout.hot and not info.flag_bits & 0x1:
+                    wheel_members.setdefault(arcname, (wheel, info))
+    with ExitStack() as stack:
+        wheel_fds: dict[Path, int] = {}
+        for arcname in layout.trace:
+            if arcname in seen or (
+                accept is not None and not accept(Path(arcname), is_dir=False)
+            ):
+                continue
+            child = next(
+                (
+                    source / arcname
+                    for source in sources
+                    if (source / arcname).is_file()
+                ),
+                None,
+            )
+            if child is not None:
+                zinfo = zipfile.ZipInfo.from_file(
+                    child, arcname, strict_timestamps=True
+                )
+                layout.normalize(zinfo)
+                zinfo.compress_type = layout.compress_type(arcname, zinfo.file_size)
+                seen.add(arcname)
+                write(child, zinfo, build(child, zinfo))
+            elif arcname in wheel_members:
+                wheel, info = wheel_members[arcname]
+                if wheel not in wheel_fds:
+                    wheel_fds[wheel] = os.open(wheel, os.O_RDONLY)
+                    stack.callback(os.close, wheel_fds[wheel])
+                copy_wheel_entry(zf, wheel_fds[wheel], info, arcname, seen, layout)
+
+
+def _write_parallel(
+    entries: Iterable[tuple[Path, zipfile.ZipInfo]],
+    build: Callable,
+    write: Callable,
+    jobs: int,
+) -> None:
+    # keep a bounded window of in-flight entries so memory does not grow
+    # with the size of the tree, and write them back in submission order
+    window = jobs * 4
+    pending: deque[tuple[Path, zipfile.ZipInfo, Future]] = deque()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for child, zinfo in entries:
+            pending.append((child, zinfo, executor.submit(build, child, zinfo)))
+            if len(pending) >= window:
+                _drain_one(pending, write)
+        while pending:
+            _drain_one(pending, write)
+
+
+def _drain_one(pending: deque, write: Callable) -> None:
+    child, zinfo, future = pending.popleft()
+    write(child, zinfo, future.result())
+
+
+def create_archive(
+    source: Path,
+    target: Path | None = None,
+    interpreter: str | None = None,
+    main: str | None = None,
+    filter: Callable[[Path], bool] | None = None,
+    compressed: bool = False,
+    jobs: int = 1,
+    incremental: bool = False,
+    extra_sources: Sequence[Path] = (),
+    wheels: Sequence[Path] = (),
+    main_py: str | None = None,
+    compile_bytecode: bool = False,
+    compile_python: str | None = None,
+    sourceless: bool = False,
+    compresslevel: int | None = None,
+    store_incompressible: bool = False,
+    trace: Sequence[str] = (),
+    hot_store_limit: int = HOT_STORE_LIMIT,
+    extract: Sequence[str] = (),
+    deterministic: bool = False,
+    skip_unchanged: bool = False,
+    unchanged: Callable[[Path], bool] | None = None,
+) -> None:
+    """Drop-in replacement for zipapp.create_archive with parallel compression.
+
+    With incremental, compressed entries of the archive previously built at
+    target are reused for unchanged files (see incremental.py), and for the
+    files unchanged tells did not change since the previous build of this
+    process, without looking at them (see watch.py).
+    extra_sources are directories merged into the archive after source,
+    wheels are dependencies whose entries are copied into the archive as
+    they are, and main_py is the content of a __main__.py to add, as an
+    alternative to main.
+    With compile_bytecode, .pyc files compiled by compile_python are added
+    next to the sources (see bytecode.py), sourceless leaves those sources out.
+    compresslevel, store_incompressible, trace and hot_store_limit set up the
+    Layout of the archive, see layout.py.
+    Entries matching the .gitignore-style patterns of extract are extracted
+    at runtime by a bootstrap injected into __main__.py (see extract.py).
+    deterministic makes the output depend on file contents only, and
+    skip_unchanged, which implies it, does nothing if the archive at target
+    was built from the same inputs (see buildkey.py).
+    Copying an existing archive is delegated to zipapp, since nothing is
+    compressed in that case."""
+    from zipapp import (  # type: ignore
+        MAIN_TEMPLATE,
+        ZipAppError,
+        create_archive as zipapp_create_archive,
+    )
+
+    source = Path(source)
+    if source.is_file():
+        zipapp_create_archive(source, target, interpreter)
+        return
+
+    if not source.exists():
+        raise ZipAppError("Source does not exist")
+    sources = [source, *extra_sources]
+    has_main = any((path / '__main__.py').is_file() for path in sources)
+    if (main or main_py) and has_main:
+        raise ZipAppError("Cannot specify entry point if the source has __main__.py")
+    if not (main or main_py or has_main):
+        raise ZipAppError("Archive has no entry point")
+    if sourceless and not compile_bytecode:
+        raise ZipAppError("Sourceless archives require compiling the sources")
+
+    if main:
+        mod, sep, fn = main.partition(':')
+        mod_ok = all(part.isidentifier() for part in mod.split('.'))
+        fn_ok = all(part.isidentifier() for part in fn.split('.'))
+        if not (sep == ':' and mod_ok and fn_ok):
+            raise ZipAppError("Invalid entry point: " + main)
+        main_py = MAIN_TEMPLATE.format(module=mod, fn=fn)
+
+    if extract and has_main:
+        from .filters import IncludeSetFilter
+
+        # the bootstrap goes into a rewritten copy of __main__.py
+        main_py = next(
+            path / '__main__.py' for path in sources if (path / '__main__.py').is_file()
+        ).read_text()
+        filter = IncludeSetFilter(set(), {'__main__.py'}, filter)
+
+    target = source.with_suffix('.pyz') if target is None else Path(target)
+    deterministic = deterministic or skip_unchanged
+    comment = b''
+    if skip_unchanged:
+        from .buildkey import BUILD_KEY_PREFIX, build_key, recorded_key
+
+        if compile_bytecode:
+            from .bytecode import magic_number
+
+            # the .pyc files only load on the python version that wrote them
+            compile_magic = magic_number(compile_python)
+        else:
+            compile_magic = None
+        key = build_key(
+            sources,
+            filter=filter,
+            wheels=wheels,
+            options=dict(
+                interpreter=interpreter,
+                main_py=main_py,
+                compressed=compressed,
+                compresslevel=compresslevel,
+                store_incompressible=store_incompressible,
+                trace=list(trace),
+                hot_store_limit=hot_store_limit,
+                extract=list(extract),
+                compile_bytecode=compile_bytecode,
+                compile_python=compile_python,
+                compile_magic=compile_magic,
+                sourceless=sourceless,
+                date_time=Layout(deterministic=True).date_time,
+            ),
+        )
+        if target.is_file() and recorded_key(target) == key:
+            logger.info(f'{target} is up to date')
+            return
+        comment = BUILD_KEY_PREFIX + key.encode()
+    options = dict(
+        sources=sources,
+        interpreter=interpreter,
+        main_py=main_py,
+        filter=filter,
+        layout=Layout(
+            zipfile.ZIP_DEFLATED if compressed else zipfile.ZIP_STORED,
+            compresslevel=compresslevel,
+            store_incompressible=store_incompressible,
+            trace=trace,
+            hot_store_limit=hot_store_limit,
+            deterministic=deterministic,
+        ),
+        jobs=resolve_jobs(jobs),
+        wheels=wheels,
+        extract=extract,
+        comment=comment,
+    )
+    with ExitStack() as stack:
+        if compile_bytecode:
+            from .bytecode import compile_sources, make_compiled_filter
+
+            # the .pyc files are added like another source directory
+            pyc_dir = Path(stack.enter_context(TemporaryDirectory()))
+            with timings.span('compile'):
+                compiled = compile_sources(
+                    sources,
+                    pyc_dir,
+                    filter=filter,
+                    wheels=wheels,
+                    python=compile_python,
+                    jobs=options['jobs'],
+                )
+            options['sources'] = [*sources, pyc_dir]
+            options['filter'] = make_compiled_filter(filter, compiled, sourceless)
+        if not incremental:
+            _write_archive(target, **options)
+        else:
+            from .incremental import IncrementalBuild
+
+            # the previous archive is read while the new one is written
+            tmp_target = target.with_name(target.name + '.tmp')
+            with IncrementalBuild(
+                target, options['layout'], unchanged
+            ) as incremental_build:
+                _write_archive(tmp_target, **options, incremental=incremental_build)
+            os.replace(tmp_target, target)
+            incremental_build.save()
+
+    if interpreter:
+        target.chmod(target.stat().st_mode | stat.S_IEXEC)
+
+
+def _write_archive(
+    target: Path,
+    sources: Sequence[Path],
+    interpreter: str | None,
+    main_py: str | None,
+    filter: Callable[[Path], bool] | None,
+    layout: Layout,
+    jobs: int,
+    wheels: Sequence[Path],
+    extract: Sequence[str],
+    comment: bytes = b'',
+    incremental: 'IncrementalBuild | None' = None,
+) -> None:
+    from zipapp import _write_file_prefix  # type: ignore
+
+    with open(target, 'wb') as fd:
+        _write_file_prefix(fd, interpreter)
+        with zipfile.ZipFile(
+            fd, 'w', compression=layout.compression, compresslevel=layout.compresslevel
+        ) as zf:
+            zf.comment = comment
+            write_tree(
+                zf,
+                sources,
+                filter=filter,
+                jobs=jobs,
+                incremental=incremental,
+                wheels=wheels,
+                layout=layout,
+            )
+            if extract:
+                from .extract import inject_bootstrap, render_bootstrap, select_members
+
+                members = select_members(zf.filelist, extract)
+                if members:
+                    main_py = inject_bootstrap(main_py or '', render_bootstrap(members))
+            if main_py and layout.deterministic:
+                # like writestr with a name, but at the fixed time
+                zinfo = zipfile.ZipInfo('__main__.py', date_time=layout.date_time)
+                zinfo.compress_type = zf.compression
+                zinfo.external_attr = 0o644 << 16
+                zf.writestr(
+                    zinfo, main_py.encode('utf-8'), compresslevel=zf.compresslevel
+                )
+            elif main_py:
+                zf.writestr('__main__.py', main_py.encode('utf-8'))
+    if timings.enabled():
+        files = [info for info in zf.filelist if not info.is_dir()]
+        timings.count('files', len(files))
+        timings.count('bytes in', sum(info.file_size for info in files))
+        timings.count('bytes out', target.stat().st_size)
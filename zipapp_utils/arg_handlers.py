@@ -1,9 +1,10 @@
-import argparse
+"""Handlers of the sub commands.
 
-from .api import py2pyz, create_archive_zau, create_shell_script, poetry2pyz, pip2pyz
+Every handler imports the modules it needs itself, so parsing the command
+line (which refers to all handlers) loads none of them."""
 
-# from .config import DEFAULT_ZIPAPP_FILTER, FILTER_ARGS
-from .filters import make_filter_function_from_args
+import argparse
+from pathlib import Path
 
 
 def main_create_archive(args: argparse.Namespace):
@@ -17,29 +18,125 @@ def main_create_archive(args: argparse.Namespace):
         print("Interpreter: {}".format(interpreter or "<none>"))
         sys.exit(0)
 
-    output = create_archive_zau(
+    output = build_create_archive(args)
+    print(f'Created {str(output)}')
+
+
+def build_create_archive(args: argparse.Namespace) -> Path:
+    from .api import create_archive_zau
+    from .filters import make_filter_function_from_args
+
+    return create_archive_zau(
         **vars(args), filter=make_filter_function_from_args(args.source, **vars(args))
     )
-    print(f'Created {str(output)}')
+
+
+def main_profile(args: argparse.Namespace):
+    from .api import profile_pyz
+
+    print(profile_pyz(**vars(args)))
+
+
+def main_inspect(args: argparse.Namespace):
+    from zipfile import BadZipFile
+    from .inspection import check_max_size, format_report, inspect_archive
+
+    if not args.pyz.is_file():
+        raise SystemExit(f'{str(args.pyz)} does not exist')
+    try:
+        report = inspect_archive(args.pyz, top=args.top)
+    except BadZipFile as e:
+        raise SystemExit(f'{str(args.pyz)}: {e}')
+    print(format_report(report, top=args.top, as_json=args.json))
+    error = check_max_size(report, args.max_size)
+    if error is not None:
+        raise SystemExit(error)
+
+
+def main_retarget(args: argparse.Namespace):
+    from .retarget import format_results, retarget_all
+
+    results = retarget_all(
+        args.pyz,
+        args.python,
+        output_dir=args.output_dir,
+        pad=args.pad,
+        jobs=args.jobs,
+    )
+    print(format_results(results))
+    if any(result['error'] is not None for result in results):
+        raise SystemExit(1)
+
+
+def main_batch(args: argparse.Namespace):
+    from .batch import format_results, run_batch
+
+    results = run_batch(args.manifest, jobs=args.jobs)
+    print(format_results(results, as_json=args.json))
+    if any(result['error'] is not None for result in results):
+        raise SystemExit(1)
 
 
 def main_py2pyz(args: argparse.Namespace):
+    output = build_py2pyz(args)
+    print(f'Created {str(output)}')
+
+
+def build_py2pyz(args: argparse.Namespace) -> Path:
+    from .api import py2pyz
+    from .config import DEFAULT_ZIPAPP_FILTER
+
     if hasattr(args, 'requirement'):
         args.use_requirements_txt = True
-    output = py2pyz(**vars(args), filter=DEFAULT_ZIPAPP_FILTER)
-    print(f'Created {str(output)}')
+    return py2pyz(**vars(args), filter=DEFAULT_ZIPAPP_FILTER)
 
 
 def main_create_shell_script(args: argparse.Namespace):
-    output = create_shell_script(**vars(args), filter=DEFAULT_ZIPAPP_FILTER)
-    print(f'Created {str(output)}')
+    output = build_create_shell_script(args)
+    if output is not None:
+        print(f'Created {str(output)}')
+
+
+def build_create_shell_script(args: argparse.Namespace) -> Path | None:
+    from .api import create_shell_script
+    from .config import DEFAULT_ZIPAPP_FILTER
+
+    return create_shell_script(**vars(args), filter=DEFAULT_ZIPAPP_FILTER)
 
 
 def main_poetry2pyz(args: argparse.Namespace):
-    output = poetry2pyz(**vars(args), filter=DEFAULT_ZIPAPP_FILTER)
+    from . import EntryPointNotFoundError, ProjectNameNotFoundError
+    from .api import poetry2pyz
+
+    # what goes into the archive is decided by the packages of the project
+    try:
+        output = poetry2pyz(**vars(args))
+    except (EntryPointNotFoundError, ProjectNameNotFoundError) as e:
+        raise SystemExit(str(e))
     print(f'Created {str(output)}')
 
 
 def main_pip2pyz(args: argparse.Namespace):
-    output = pip2pyz(**vars(args), filter=DEFAULT_ZIPAPP_FILTER)
+    from . import EntryPointNotFoundError
+    from .api import pip2pyz
+    from .config import DEFAULT_ZIPAPP_FILTER
+
+    try:
+        output = pip2pyz(**vars(args), filter=DEFAULT_ZIPAPP_FILTER)
+    except EntryPointNotFoundError as e:
+        raise SystemExit(str(e))
     print(f'Created {str(output)}')
+
+
+def run_with_timings(args: argparse.Namespace):
+    """Run the sub command, then report its timings as --timings asks."""
+    import json
+    import sys
+    from .timings import TimingRecorder
+
+    with TimingRecorder() as recorder:
+        args.func(args)
+    if args.timings == '-':
+        print(recorder.summary(), file=sys.stderr)
+    else:
+        Path(args.timings).write_text(json.dumps(recorder.to_dict(), indent=2))
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""Many builds from one manifest.
+
+A manifest lists builds with the options of their sub command
+(create-archive, py2pyz or create-shell-script), spelled like the long
+option names, with underscores or dashes. In TOML:
+
+    [defaults]
+    jobs = 2
+
+    [defaults.py2pyz]
+    compress = true
+
+    [[build]]
+    command = "py2pyz"
+    source = "tools/report.py"
+    output = "dist/report.pyz"
+    dep = ["jinja2"]
+
+    [[build]]
+    command = "create-shell-script"
+    source = "dist/report.pyz"
+
+or the same structure in JSON, where a plain list of builds is accepted
+too. `true` turns a flag on, lists repeat an option, `source` is the
+positional argument. Defaults apply to every build whose command has the
+option (so `jobs` above goes to the py2pyz build only), the tables in them
+only to the builds of their command. Relative paths are relative to the
+manifest. A build with invalid options fails on its own, the others run.
+
+Builds run on a process pool, so every worker starts once and keeps its
+caches (like compiled filter patterns) between builds. They share one
+dependency store, which resolves the same requirements only once when
+several builds ask for them at the same time. Builds start in the order of
+the manifest, except that a build whose source is the output of an earlier
+build starts when that one is done, without holding up the builds after
+it."""
+
+import io
+import json
+import time
+import traceback
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import redirect_stderr
+from pathlib import Path
+
+from . import logger
+from .archive import resolve_jobs
+
+BATCH_COMMANDS = {
+    'create-archive',
+    'ca',
+    'zipapp',
+    'py2pyz',
+    'p',
+    'create-shell-script',
+    'sh',
+}
+
+
+def load_manifest(
+    manifest: Path, parsers: dict[str, ArgumentParser] | None = None
+) -> list[dict]:
+    """The builds of a manifest, with the defaults applied. With the
+    parsers of the commands, a default only applies to the builds whose
+    command has that option."""
+    if manifest.suffix == '.toml':
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            try:
+                import tomli as tomllib  # type: ignore
+            except ImportError:
+                raise SystemExit('Reading TOML manifests requires Python 3.11 or tomli')
+        data = tomllib.loads(manifest.read_text())
+    else:
+        data = json.loads(manifest.read_text())
+    if isinstance(data, list):
+        data = {'build': data}
+    defaults = data.get('defaults', {})
+    common = {
+        key: value for key, value in defaults.items() if not isinstance(value, dict)
+    }
+    builds = []
+    for build in data.get('build', []):
+        command = command_name(build.get('command', common.get('command')))
+        parser = (parsers or {}).get(command)
+        accepted = {
+            key: value
+            for key, value in common.items()
+            if parser is None or accepts(parser, key)
+        }
+        build = {**accepted, **defaults.get(command, {}), **build}
+        if command is not None:
+            build['command'] = command
+        builds.append(build)
+    return builds
+
+
+def command_name(command: str | None) -> str | None:
+    """The full name of a command given by name or alias."""
+    from . import parsers_util
+
+    for name, (aliases, _, _) in parsers_util.SUB_COMMANDS.items():
+        if command in aliases:
+            return name
+    return command
+
+
+def accepts(parser: ArgumentParser, key: str) -> bool:
+    """Whether the option key of a manifest is an option of parser."""
+    if key in ('command', 'name', 'source'):
+        return True
+    return '--' + key.replace('_', '-') in parser._option_string_actions
+
+
+def command_parsers() -> dict[str, ArgumentParser]:
+    """The parsers of the batch commands, by name and alias."""
+    from . import parsers_util
+
+    subparsers = ArgumentParser(prog='zipapp-utils').add_subparsers()
+    parsers = {}
+    for name, (aliases, _, create) in parsers_util.SUB_COMMANDS.items():
+        if name in BATCH_COMMANDS:
+            parser = create(subparsers)
+            for command in (name, *aliases):
+                parsers[command] = parser
+    return parsers
+
+
+def build_name(build: dict) -> str:
+    return str(build.get('name') or build.get('output') or build.get('source'))
+
+
+def build_argv(build: dict) -> list[str]:
+    """Command line arguments of a build of the manifest."""
+    name = build_name(build)
+    build = dict(build)
+    build.pop('name', None)
+    command = build.pop('command', None)
+    if command not in BATCH_COMMANDS:
+        raise SystemExit(f'Unsupported command for {name}: {command}')
+    if 'source' not in build:
+        raise SystemExit(f'No source for {name}')
+    argv = [command, str(build.pop('source'))]
+    for key, value in build.items():
+        option = '--' + key.replace('_', '-')
+        if value is True:
+            argv.append(option)
+        elif value is False or value is None:
+            continue
+        elif isinstance(value, list):
+            argv.extend(f'{option}={item}' for item in value)
+        else:
+            argv.append(f'{option}={value}')
+    return argv
+
+
+def parse_build(
+    parsers: dict[str, ArgumentParser], build: dict, base_dir: Path
+) -> Namespace:
+    """Parse a build like its command line, and anchor its paths at base_dir.
+
+    Raises:
+        SystemExit: with what is wrong with the options of the build."""
+    command, *argv = build_argv(build)
+    stderr = io.StringIO()
+    try:
+        with redirect_stderr(stderr):
+            args = parsers[command].parse_args(argv)
+    except SystemExit:
+        # the last line argparse printed says what is wrong
+        lines = stderr.getvalue().strip().splitlines() or ['invalid options']
+        raise SystemExit(f'Invalid build {build_name(build)}: {lines[-1]}')
+
+    def anchor(value):
+        if isinstance(value, Path) and str(value) != '-':
+            return base_dir / value
+        if isinstance(value, list):
+            return [anchor(item) for item in value]
+        return value
+
+    for key, value in vars(args).items():
+        setattr(args, key, anchor(value))
+    return args
+
+
+def run_build(name: str, args: Namespace | str) -> dict:
+    """Run one build, never raising, so the others go on. args is the
+    error message if the build could not be parsed."""
+    start = time.perf_counter()
+    output = error = None
+    try:
+        if isinstance(args, str):
+            raise SystemExit(args)
+        output = args.build(args)
+    except (Exception, SystemExit) as e:
+        logger.debug(traceback.format_exc())
+        error = str(e) or type(e).__name__
+    return {
+        'name': name,
+        'output': None if output is None else str(output),
+        'seconds': time.perf_counter() - start,
+        'error': error,
+    }
+
+
+def submit_after(
+    executor: Executor, upstream: Future, name: str, args: Namespace
+) -> Future:
+    """Submit the build once upstream is done, without waiting for it.
+
+    Returns:
+        A future of the result of the build."""
+    result: Future = Future()
+
+    def forward(done: Future) -> None:
+        if done.exception() is not None:
+            result.set_exception(done.exception())  # type: ignore
+        else:
+            result.set_result(done.result())
+
+    def submit(_: Future) -> None:
+        try:
+            executor.submit(run_build, name, args).add_done_callback(forward)
+        except RuntimeError as e:  # the pool is broken
+            result.set_exception(e)
+
+    upstream.add_done_callback(submit)
+    return result
+
+
+def run_batch(manifest: Path, jobs: int = 0) -> list[dict]:
+    """Run the builds of manifest on jobs processes.
+
+    Returns:
+        For every build, in the order of the manifest: its name, output,
+        run time in seconds, and error message or None."""
+    parsers = command_parsers()
+    base_dir = manifest.resolve().parent
+    builds: list[tuple[str, str | None, Namespace | str]] = []
+    for build in load_manifest(manifest, parsers):
+        name, command = build_name(build), build.get('command')
+        try:
+            builds.append((name, command, parse_build(parsers, build, base_dir)))
+        except SystemExit as e:
+            builds.append((name, command, str(e)))
+    jobs = min(resolve_jobs(jobs), len(builds))
+    logger.info(f'Running {len(builds)} builds on {jobs} processes')
+    if jobs <= 1:
+        return [run_build(name, args) for name, _, args in builds]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = []
+        by_output: dict[Path, Future] = {}
+        for name, command, args in builds:
+            if isinstance(args, str):
+                futures.append(executor.submit(run_build, name, args))
+                continue
+            # create-shell-script calls its source pyz
+            source = getattr(args, 'source', None) or getattr(args, 'pyz', None)
+            if source is not None and str(source) == '-':
+                source = None
+            upstream = by_output.get(source.resolve()) if source else None
+            if upstream is not None:
+                future = submit_after(executor, upstream, name, args)
+            else:
+                future = executor.submit(run_build, name, args)
+            futures.append(future)
+            output = build_output(command, source, args.output)
+            if output is not None:
+                by_output[output] = future
+        return [future.result() for future in futures]
+
+
+def build_output(
+    command: str | None, source: Path | None, output: Path | None
+) -> Path | None:
+    """The path a build writes to, with the default of its command if
+    output is None, or None if it writes to stdout."""
+    from .api import default_output
+
+    if output is not None:
+        return output.resolve()
+    if source is None or command is None:
+        return None
+    return default_output(command, source)
+
+
+def format_results(results: list[dict], as_json: bool = False) -> str:
+    """Render the results of run_batch as a table, or as JSON."""
+    if as_json:
+        return json.dumps(results, indent=2)
+    lines = [f'{"seconds":>8}  build']
+    for result in results:
+        if result['error'] is None:
+            outcome = f'-> {result["output"]}'
+        else:
+            outcome = f'FAILED: {result["error"]}'
+        lines.append(f'{result["seconds"]:8.2f}  {result["name"]} {outcome}')
+    failed = sum(result['error'] is not None for result in results)
+    lines.append(f'{len(results) - failed} built, {failed} failed')
+    return '\n'.join(lines)
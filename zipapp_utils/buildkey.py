@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Whole-build cache keys.
+
+A build key is a hash of everything the output of a deterministic build
+depends on: the content of every file the filter accepts, the dependency
+wheels and which of their entries are accepted, and the options of the
+build (interpreter, __main__.py, compression, ...) along with the version of
+zipapp-utils. It is recorded in the comment of the archive, so when the key
+of a new build matches the one of the existing output, the build can be
+skipped without writing anything."""
+
+import json
+import zipfile
+from collections.abc import Callable, Sequence
+from hashlib import sha256
+from pathlib import Path
+
+from . import __version__
+from .archive import _accept_and_descend, iter_entries, wheel_arcname
+from .utils import hash_stream
+
+BUILD_KEY_PREFIX = b'zipapp-utils build key: '
+
+
+def build_key(
+    sources: Sequence[Path],
+    filter: Callable[[Path], bool] | None = None,
+    wheels: Sequence[Path] = (),
+    options: dict | None = None,
+) -> str:
+    """Hash the inputs of a build, options must be JSON serializable."""
+    digest = sha256()
+    digest.update(
+        json.dumps(
+            {'version': __version__, 'options': options}, sort_keys=True
+        ).encode()
+    )
+    accept, descend = _accept_and_descend(filter)
+    for index, source in enumerate(sources):
+        for child, arcname, is_dir in iter_entries(
+            [source], accept, descend, sort=True
+        ):
+            digest.update(f'\0{index}\0{arcname.as_posix()}\0'.encode())
+            if is_dir:
+                continue
+            with open(child, 'rb') as f:
+                digest.update(hash_stream(f).encode())
+            # the executable bit survives normalization
+            digest.update(b'x' if child.stat().st_mode & 0o111 else b'-')
+    for wheel in wheels:
+        # a wheel may be rebuilt under the same name, so its content counts
+        digest.update(f'\0{wheel.name}\0'.encode())
+        with open(wheel, 'rb') as f:
+            digest.update(hash_stream(f).encode())
+        with zipfile.ZipFile(wheel) as wheel_zf:
+            for info in wheel_zf.infolist():
+                arcname = wheel_arcname(info.filename)
+                if arcname is not None and (
+                    accept is None or accept(Path(arcname), is_dir=False)
+                ):
+                    digest.update(f'{arcname}\0'.encode())
+    return digest.hexdigest()
+
+
+def recorded_key(target: Path) -> str | None:
+    """The build key recorded in the archive at target, if any."""
+    try:
+        with zipfile.ZipFile(target) as zf:
+            comment = zf.comment
+    except (OSError, zipfile.BadZipFile):
+        return None
+    if not comment.startswith(BUILD_KEY_PREFIX):
+        return None
+    return comment[len(BUILD_KEY_PREFIX) :].decode('ascii', 'replace')
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Precompile the python sources of an archive.
+
+zipimport never writes .pyc files, so every module imported from an archive
+is compiled from source on every run, unless the archive contains its .pyc.
+The sources the archive will contain are compiled here, by the interpreter
+the archive is meant for (the magic number of a .pyc is specific to the
+python version), on a process pool. The .pyc files are unchecked-hash pycs,
+which zipimport loads without looking at the source, and they go next to
+their source (pkg/mod.pyc), which is where zipimport looks for them.
+
+The compiler runs _compile_worker.py as a script, so the target interpreter
+needs nothing but the standard library."""
+
+import json
+import subprocess
+import sys
+import zipfile
+from collections.abc import Callable, Sequence
+from functools import lru_cache
+from importlib.util import MAGIC_NUMBER
+from pathlib import Path
+
+from . import logger
+from .archive import _accept_and_descend, iter_entries, wheel_arcname
+
+COMPILE_WORKER = Path(__file__).with_name('_compile_worker.py')
+
+# sources per job sent to a worker process
+BATCH_SIZE = 64
+
+# kept as source: runpy runs it, and tools recognize a zipapp by it
+MAIN_PY = '__main__.py'
+
+
+def collect_sources(
+    sources: Sequence[Path],
+    filter: Callable[[Path], bool] | None = None,
+    wheels: Sequence[Path] = (),
+) -> list[tuple[Path | None, list[tuple[str, str]]]]:
+    """Find the .py files write_tree would put into the archive.
+
+    Returns:
+        Batches of up to BATCH_SIZE sources as (wheel, [(source, arcname), ...]),
+        wheel is None if the sources are files, else they are its members."""
+    accept, descend = _accept_and_descend(filter)
+    seen: set[str] = set()
+
+    def wanted(arcname: str) -> bool:
+        if not arcname.endswith('.py') or arcname == MAIN_PY or arcname in seen:
+            return False
+        seen.add(arcname)
+        return True
+
+    files = [
+        (str(child), arcname.as_posix())
+        for child, arcname, is_dir in iter_entries(sources, accept, descend)
+        if not is_dir and wanted(arcname.as_posix())
+    ]
+    batches: list[tuple[Path | None, list[tuple[str, str]]]] = [
+        (None, files[start : start + BATCH_SIZE])
+        for start in range(0, len(files), BATCH_SIZE)
+    ]
+    for wheel in wheels:
+        with zipfile.ZipFile(wheel) as wheel_zf:
+            infos = wheel_zf.infolist()
+        members = []
+        for info in infos:
+            arcname = wheel_arcname(info.filename)
+            if arcname is None or (
+                accept is not None and not accept(Path(arcname), is_dir=False)
+            ):
+                continue
+            if wanted(arcname):
+                members.append((info.filename, arcname))
+        batches.extend(
+            (wheel, members[start : start + BATCH_SIZE])
+            for start in range(0, len(members), BATCH_SIZE)
+        )
+    return batches
+
+
+@lru_cache(maxsize=None)
+def magic_number(python: str | None = None) -> str:
+    """The magic number (hex) of the .pyc files python writes, this
+    interpreter if None. It changes with the python version, and only
+    bytecode with the magic number of the interpreter can be loaded."""
+    if python is None or python == sys.executable:
+        return MAGIC_NUMBER.hex()
+    result = subprocess.run(
+        [python, '-c', 'import importlib.util as u; print(u.MAGIC_NUMBER.hex())'],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise SystemExit(f'Querying {python} failed:\n{result.stderr}')
+    return result.stdout.strip()
+
+
+def compile_sources(
+    sources: Sequence[Path],
+    output_dir: Path,
+    filter: Callable[[Path], bool] | None = None,
+    wheels: Sequence[Path] = (),
+    python: str | None = None,
+    jobs: int = 1,
+) -> set[str]:
+    """Compile the sources the archive will contain into output_dir.
+
+    Args:
+        sources: Directories merged into the archive, like write_tree.
+        output_dir: Where the .pyc files are written, laid out like the
+            archive, so it can be added to it as another source.
+        filter: The filter of the archive.
+        wheels: Wheels whose entries are copied into the archive.
+        python: The interpreter to compile for, defaults to this one.
+        jobs: Number of compiler processes.
+
+    Returns:
+        The names of the .pyc files in the archive."""
+    batches = collect_sources(sources, filter, wheels)
+    request = {
+        'jobs': jobs,
+        'batches': [
+            [
+                None if wheel is None else str(wheel),
+                [
+                    [source, arcname, str(output_dir / f'{arcname}c')]
+                    for source, arcname in items
+                ],
+            ]
+            for wheel, items in batches
+        ],
+    }
+    python = python or sys.executable
+    logger.info(f'Compiling {len(batches)} batches of sources with {python}')
+    result = subprocess.run(
+        [python, str(COMPILE_WORKER)],
+        input=json.dumps(request),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise SystemExit(f'Compiling with {python} failed:\n{result.stderr}')
+    response = json.loads(result.stdout)
+    for arcname, error in response['failed']:
+        logger.warning(f'Not compiling {arcname}: {error}')
+    return {
+        Path(output).relative_to(output_dir).as_posix()
+        for output in response['compiled']
+    }
+
+
+def make_compiled_filter(
+    filter: Callable[[Path], bool] | None,
+    compiled: set[str],
+    sourceless: bool = False,
+) -> Callable[..., bool]:
+    """Wrap the filter of the archive so it accepts the compiled .pyc files,
+    and with sourceless, rejects the sources they were compiled from."""
+    accept, _ = _accept_and_descend(filter)
+
+    def compiled_filter(path: Path, is_dir: bool | None = None) -> bool:
+        name = path.as_posix()
+        if name in compiled:
+            return True
+        if sourceless and not is_dir and f'{name}c' in compiled:
+            return False
+        return accept is None or accept(path, is_dir=bool(is_dir))
+
+    compiled_filter.prunes_directories = getattr(  # type: ignore
+        filter, 'prunes_directories', False
+    )
+    return compiled_filter
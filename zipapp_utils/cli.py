@@ -6,11 +6,25 @@ Purpose: zipapp utilities
 """
 
 import argparse
+import sys
 from . import __version__, __description__, __app_name__, parsers_util
 
 
-def get_args():
-    """Get command-line arguments"""
+def sub_command(argv: list[str]) -> str | None:
+    """The name of the sub command argv runs, if it names one."""
+    for arg in argv:
+        if not arg.startswith('-'):
+            for name, (aliases, _, _) in parsers_util.SUB_COMMANDS.items():
+                if arg == name or arg in aliases:
+                    return name
+            return None
+    return None
+
+
+def make_parser(argv: list[str] | None = None) -> argparse.ArgumentParser:
+    """The parser of the command line. Only the sub command argv runs gets
+    its options, so only its modules are imported, all of them do if argv is
+    None."""
 
     parser = argparse.ArgumentParser(
         prog=__app_name__,
@@ -26,15 +40,37 @@ def get_args():
     )
 
     subparsers = parser.add_subparsers()
-    for func in parsers_util.create_parser_functions:
-        # print(func.__name__)
-        func(subparsers)
-    return parser, parser.parse_args()
+    command = None if argv is None else sub_command(argv)
+    for name, (_, _, create) in parsers_util.SUB_COMMANDS.items():
+        if argv is None or name == command:
+            create(subparsers)
+        else:
+            parsers_util.add_sub_command(subparsers, name)
+    return parser
+
+
+def get_args():
+    """Get command-line arguments"""
+
+    argv = sys.argv[1:]
+    parser = make_parser(argv)
+    if sub_command(argv) != 'profile':
+        return parser, parser.parse_args(argv)
+    # the options of profile go anywhere, the rest is passed on to the
+    # archive it runs, and so is everything after --
+    split = argv.index('--') if '--' in argv else len(argv)
+    args, app_args = parser.parse_known_args(argv[:split])
+    args.app_args = app_args + argv[split + 1 :]
+    return parser, args
 
 
 def main() -> None:
     parser, args = get_args()
-    if hasattr(args, 'func'):
+    if getattr(args, 'timings', None) is not None:
+        from .arg_handlers import run_with_timings
+
+        run_with_timings(args)
+    elif hasattr(args, 'func'):
         args.func(args)
     else:
         parser.print_help()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Runtime extraction of native extensions and data files.
+
+zipimport cannot load extension modules, and shared libraries and some data
+files have to be real files. Such entries are selected with .gitignore-style
+patterns when the archive is built, and a bootstrap
+(templates/extract_bootstrap.jinja.py) is injected into its __main__.py. On
+the first run the bootstrap extracts them, with their paths in the archive,
+into ~/.cache/zipapp-utils/extracted/<key>, next to each other, so relative
+RPATHs like $ORIGIN/../pkg.libs keep working. Extension modules are then
+imported from there by a finder, and the directory is appended to sys.path.
+The key is a hash of the extracted entries, later runs (and rebuilds that
+don't change them) only check that the directory exists."""
+
+import ast
+import zipfile
+from collections.abc import Iterable
+from hashlib import sha256
+from pathlib import Path
+
+from . import __version__
+from .filters import PatternFilter
+from .treeshake import module_name
+from .utils import render
+
+# extension modules, shared libraries, and the directories auditwheel and
+# delvewheel put the libraries wheels depend on in
+NATIVE_PATTERNS = ['*.so', '*.so.*', '*.pyd', '*.dylib', '*.dll', '*.libs/']
+
+BOOTSTRAP_TEMPLATE = Path(__file__).parent / 'templates' / 'extract_bootstrap.jinja.py'
+
+
+def select_members(
+    infos: Iterable[zipfile.ZipInfo], patterns: Iterable[str]
+) -> list[zipfile.ZipInfo]:
+    """The file entries matching patterns."""
+    # a pattern filter rejects what its patterns match
+    matcher = PatternFilter(Path(), patterns)
+    return [
+        info
+        for info in infos
+        if not info.is_dir() and not matcher(Path(info.filename), is_dir=False)
+    ]
+
+
+def extraction_key(members: Iterable[zipfile.ZipInfo]) -> str:
+    digest = sha256(__version__.encode())
+    for info in sorted(members, key=lambda info: info.filename):
+        digest.update(f'\0{info.filename}\0{info.file_size}\0{info.CRC}'.encode())
+    return digest.hexdigest()
+
+
+def render_bootstrap(members: list[zipfile.ZipInfo]) -> str:
+    """The bootstrap code extracting members, to run before anything else."""
+    names = [info.filename for info in members]
+    extensions = {}
+    for name in names:
+        found = module_name(name)
+        if found is not None and found[1]:
+            extensions[found[0]] = name
+    return render(
+        BOOTSTRAP_TEMPLATE,
+        {
+            'key': extraction_key(members),
+            'members': repr(names),
+            'extensions': repr(extensions),
+        },
+    )
+
+
+def inject_bootstrap(main_py: str, bootstrap: str) -> str:
+    """Insert bootstrap into main_py, after its docstring and __future__
+    imports, which have to come first."""
+    lines = main_py.splitlines(keepends=True)
+    insert_at = 0
+    try:
+        body = ast.parse(main_py).body
+    except SyntaxError:
+        body = []
+    for index, node in enumerate(body):
+        is_docstring = (
+            index == 0
+            and isinstance(node, ast.Expr)
+            and isinstance(node.value, ast.Constant)
+            and isinstance(node.value.value, str)
+        )
+        is_future = isinstance(node, ast.ImportFrom) and node.module == '__future__'
+        if not (is_docstring or is_future):
+            break
+        insert_at = node.end_lineno or insert_at
+    if not insert_at:
+        # after a shebang and an encoding declaration
+        while insert_at < len(lines) and lines[insert_at].startswith('#'):
+            insert_at += 1
+    head = ''.join(lines[:insert_at])
+    if head and not head.endswith('\n'):
+        head += '\n'
+    return head + bootstrap + ''.join(lines[insert_at:])
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 """Filter functions for zipapp.create_archive"""
 
-
+import re
 from pathlib import Path
-from collections.abc import Callable, Iterable
+from functools import lru_cache
+from collections.abc import Callable, Iterable, Set
 
 
 def null_filter(path: Path) -> bool:
@@ -24,40 +25,175 @@ def exclude_dist_info_and_pyz(path: Path) -> bool:
 
 def create_pattern_set(
     patterns: Iterable[str], pattern_from: Iterable[Path]
-) -> set[str]:
-    patterns = set(patterns)
-    pattern_from = set(pattern_from)
-    patterns_set = patterns.copy()
+) -> list[str]:
+    """Collect patterns from the command line and from pattern files.
+
+    Order is kept (and duplicates dropped) since negated patterns depend on it."""
+    patterns_list = list(patterns)
     for pattern_file in pattern_from:
-        patterns.update(pattern_file.read_text().splitlines())
-    return patterns_set
+        patterns_list.extend(pattern_file.read_text().splitlines())
+    return list(dict.fromkeys(patterns_list))
+
+
+def translate_pattern(pattern: str) -> str:
+    """Translate a gitignore-style glob (without ! and trailing /) to a regex
+    matching a relative posix path."""
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    i, n = 0, len(pattern)
+    parts = []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i) and (i == 0 or pattern[i - 1] == '/'):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i) and i + 2 == n and i and pattern[i - 1] == '/':
+            parts.append('.*')
+            i += 2
+        elif c == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif c == '?':
+            parts.append('[^/]')
+            i += 1
+        elif c == '[' and (j := pattern.find(']', i + 2)) != -1:
+            body = pattern[i + 1 : j]
+            if body[0] == '!':
+                body = '^' + body[1:]
+            parts.append('[' + body.replace('\\', '\\\\') + ']')
+            i = j + 1
+        elif c == '\\' and i + 1 < n:
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(c))
+            i += 1
+    return ('' if anchored else '(?:.*/)?') + ''.join(parts)
+
+
+@lru_cache(maxsize=64)
+def compile_patterns(
+    patterns: tuple[str, ...],
+) -> tuple[re.Pattern | None, tuple[tuple[re.Pattern, bool, bool], ...]]:
+    """Compile gitignore-style lines into (any-rule regex, rules).
+
+    Each rule is (regex, negated, dir_only); the last matching rule wins."""
+    rules = []
+    for line in patterns:
+        line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        elif line.startswith('\\'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+        rules.append((translate_pattern(line), negated, dir_only))
+    if not rules:
+        return None, ()
+    any_rule = re.compile('|'.join(f'(?:{regex})' for regex, _, _ in rules))
+    return any_rule, tuple(
+        (re.compile(regex), negated, dir_only) for regex, negated, dir_only in rules
+    )
+
+
+class PatternFilter:
+    """Filter function compiled from gitignore-style patterns.
+
+    Paths are matched as relative paths, without touching the filesystem
+    unless a directory-only pattern needs to know if the path is a
+    directory. Everything below an excluded directory is excluded too, so
+    callers walking the tree may skip descending into it
+    (``prunes_directories``). Only a bounded number of directory decisions
+    is cached, so memory does not grow with the tree."""
+
+    prunes_directories = True
+
+    def __init__(self, base_dir: Path, patterns: Iterable[str]):
+        self.base_dir = base_dir
+        self.any_rule, self.rules = compile_patterns(tuple(patterns))
+        self._dir_excluded = lru_cache(maxsize=4096)(self._dir_excluded_uncached)
+
+    def _excluded_by_rules(self, relpath: str, is_dir: bool | None) -> bool:
+        if self.any_rule is None or not self.any_rule.fullmatch(relpath):
+            return False
+        for regex, negated, dir_only in reversed(self.rules):
+            if not regex.fullmatch(relpath):
+                continue
+            if dir_only:
+                if is_dir is None:
+                    is_dir = (self.base_dir / relpath).is_dir()
+                if not is_dir:
+                    continue
+            return not negated
+        return False
+
+    def _dir_excluded_uncached(self, reldir: str) -> bool:
+        parent, _, _ = reldir.rpartition('/')
+        if parent and self._dir_excluded(parent):
+            return True
+        return self._excluded_by_rules(reldir, True)
+
+    def __call__(self, path: Path, is_dir: bool | None = None) -> bool:
+        relpath = path.as_posix()
+        parent, _, _ = relpath.rpartition('/')
+        if parent and self._dir_excluded(parent):
+            return False
+        if is_dir:
+            return not self._dir_excluded(relpath)
+        return not self._excluded_by_rules(relpath, is_dir)
+
+
+class IncludeSetFilter:
+    """Keep only the paths of include_set among the paths of scope.
+
+    Both are sets of relative posix paths, of files and of directories.
+    Paths outside of scope are left to filter. Used for tree shaking, see
+    treeshake.py."""
+
+    def __init__(
+        self,
+        include_set: Set[str],
+        scope: Set[str],
+        filter: Callable[[Path], bool] | None = None,
+    ):
+        self.include_set = include_set
+        self.scope = scope
+        self.filter = filter
+        # a directory out of the include set has nothing to keep below it,
+        # but an inner filter may still accept what is below one it rejects
+        self.prunes_directories = filter is None or getattr(
+            filter, 'prunes_directories', False
+        )
+
+    def __call__(self, path: Path, is_dir: bool | None = None) -> bool:
+        relpath = path.as_posix()
+        if relpath in self.scope and relpath not in self.include_set:
+            return False
+        if self.filter is None:
+            return True
+        if getattr(self.filter, 'prunes_directories', False):
+            return self.filter(path, is_dir=is_dir)  # type: ignore
+        return self.filter(path)
 
 
 def make_filter_function(
-    base_dir: Path, include_patterns: Iterable[str], exclude_patterns: Iterable[str]
+    base_dir: Path,
+    include_patterns: Iterable[str],
+    exclude_patterns: Iterable[str],
 ) -> Callable[[Path], bool]:
     """Create a filter function from include and exclude patterns.
-    exclude glob patterns from exclude_patterns, except those in the include_patterns"""
-    base_dir = base_dir.resolve()
-    include_patterns = set(include_patterns)
-    exclude_patterns = set(exclude_patterns)
-    # all_files: all files in base_dir, recursive, including hidden files
-    all_files = set(base_dir.rglob('*.?*'))
-    excluded_files = set()
-    for pattern in exclude_patterns:
-        excluded_files.update(base_dir.glob(pattern))
-    included_files = set()
-    for pattern in include_patterns:
-        included_files.update(base_dir.glob(pattern))
-    net_excluded_files = excluded_files - included_files
-    all_files_included = all_files - net_excluded_files
-
-    def filter_function(path: Path) -> bool:
-        if path.resolve() in all_files_included:
-            return True
-        return False
 
-    return filter_function
+    Patterns follow .gitignore syntax and are matched against paths relative
+    to base_dir. exclude_patterns may contain !negations, include_patterns
+    act as negations applied after all of them."""
+    patterns = list(exclude_patterns)
+    patterns.extend('!' + pattern for pattern in include_patterns)
+    return PatternFilter(base_dir.resolve(), patterns)
 
 
 def make_filter_function_from_args(
@@ -66,7 +202,7 @@ def make_filter_function_from_args(
     include_from: Iterable[Path],
     exclude: Iterable[str],
     exclude_from: Iterable[Path],
-    **kwargs
+    **kwargs,
 ) -> Callable[[Path], bool]:
     include_set = create_pattern_set(include, include_from)
     exclude_set = create_pattern_set(exclude, exclude_from)
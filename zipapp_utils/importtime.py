@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Per-module import time of an archive.
+
+The archive is run under ``python -X importtime`` a few times, and the
+median times of every module are matched with the archive entry it was
+imported from (a .py or .pyc file, or the __init__ of a package). For
+deflated entries the time to inflate them is measured separately, that is
+the part of the import time compression costs."""
+
+import json
+import os
+import subprocess
+import sys
+import time
+import zipfile
+import zlib
+from collections.abc import Sequence
+from pathlib import Path
+from statistics import median
+
+from . import logger
+from .archive import iter_raw_payload
+
+IMPORTTIME_PREFIX = 'import time:'
+
+# the order zipimport tries them in, after the package __init__
+MODULE_SUFFIXES = ['.pyc', '.py']
+
+
+def parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    """Parse -X importtime output into {module: (self_us, cumulative_us)}."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith(IMPORTTIME_PREFIX):
+            continue
+        self_us, cumulative_us, module = line[len(IMPORTTIME_PREFIX) :].split('|')
+        try:
+            times[module.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            # the header line
+            continue
+    return times
+
+
+def import_order(stderr: str) -> list[str]:
+    """Modules of -X importtime output in the order their imports started.
+
+    A line is printed when an import finishes, after the lines of the
+    imports it caused, which are indented one level deeper."""
+    # children collected per depth, waiting for the line of their parent
+    pending: dict[int, list] = {}
+    for line in stderr.splitlines():
+        if not line.startswith(IMPORTTIME_PREFIX):
+            continue
+        field = line.rpartition('|')[2]
+        module = field.strip()
+        if module == 'imported package':
+            continue
+        depth = (len(field) - len(field.lstrip()) - 1) // 2
+        children = pending.pop(depth + 1, [])
+        pending.setdefault(depth, []).append((module, children))
+
+    order: list[str] = []
+
+    def visit(nodes: list) -> None:
+        for module, children in nodes:
+            order.append(module)
+            visit(children)
+
+    visit(pending.get(0, []))
+    return order
+
+
+def run_trials(
+    pyz: Path, python: str, args: Sequence[str] = (), trials: int = 5
+) -> tuple[dict[str, tuple[float, float]], list[str]]:
+    """Run pyz trials times.
+
+    Returns:
+        The median times of every module, and the import order of the
+        first run."""
+    runs = []
+    order: list[str] = []
+    for trial in range(trials):
+        logger.info(f'Profiling {pyz} (trial {trial + 1}/{trials})')
+        result = subprocess.run(
+            [python, '-X', 'importtime', str(pyz), *args],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        if result.returncode:
+            logger.warning(f'{pyz} exited with {result.returncode}')
+        runs.append(parse_importtime(result.stderr))
+        if not order:
+            order = import_order(result.stderr)
+    modules = set().union(*runs)
+    # a module missing from some runs was imported conditionally, count it
+    # as 0 there
+    times = {
+        module: (
+            median(run.get(module, (0, 0))[0] for run in runs),
+            median(run.get(module, (0, 0))[1] for run in runs),
+        )
+        for module in modules
+    }
+    return times, order
+
+
+def module_entry(module: str, names: dict[str, zipfile.ZipInfo]) -> str | None:
+    """The archive entry module is imported from, None if it is not in it."""
+    base = module.replace('.', '/')
+    for prefix in (f'{base}/__init__', base):
+        for suffix in MODULE_SUFFIXES:
+            if prefix + suffix in names:
+                return prefix + suffix
+    return None
+
+
+def inflate_time(fd: int, info: zipfile.ZipInfo, repeat: int = 3) -> float:
+    """Best time in microseconds to inflate a deflated entry."""
+    if info.compress_type != zipfile.ZIP_DEFLATED:
+        return 0.0
+    payload = b''.join(iter_raw_payload(fd, info))
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        zlib.decompress(payload, -15)
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1e6, 1)
+
+
+def profile_archive(
+    pyz: Path,
+    python: str | None = None,
+    args: Sequence[str] = (),
+    trials: int = 5,
+) -> dict:
+    """Profile the imports of pyz.
+
+    Args:
+        pyz: The archive.
+        python: The interpreter to run it with, defaults to this one.
+        args: Arguments for the application, e.g. ['--help'] for a quick run.
+        trials: Number of runs, times are the medians.
+
+    Returns:
+        A JSON serializable report, see format_report. Its import_order,
+        the archive entries in the order they were imported, is a trace
+        for create-archive --trace."""
+    python = python or sys.executable
+    times, order = run_trials(pyz, python, args, trials)
+    with zipfile.ZipFile(pyz) as zf:
+        names = {info.filename: info for info in zf.infolist()}
+    modules = []
+    fd = os.open(pyz, os.O_RDONLY)
+    try:
+        for module, (self_us, cumulative_us) in times.items():
+            record = {
+                'module': module,
+                'self_us': self_us,
+                'cumulative_us': cumulative_us,
+                'entry': module_entry(module, names),
+            }
+            if record['entry'] is not None:
+                info = names[record['entry']]
+                record['compressed'] = info.compress_type != zipfile.ZIP_STORED
+                record['compress_size'] = info.compress_size
+                record['file_size'] = info.file_size
+                record['inflate_us'] = inflate_time(fd, info)
+            modules.append(record)
+    finally:
+        os.close(fd)
+    modules.sort(key=lambda record: record['self_us'], reverse=True)
+
+    packages: dict[str, dict] = {}
+    for record in modules:
+        top = record['module'].partition('.')[0]
+        package = packages.setdefault(
+            top,
+            {'package': top, 'self_us': 0, 'modules': 0, 'in_archive': False},
+        )
+        package['self_us'] += record['self_us']
+        package['modules'] += 1
+        package['in_archive'] |= record['entry'] is not None
+
+    archived = [record for record in modules if record['entry'] is not None]
+    # usable as a trace for layout.Layout
+    entries = (module_entry(module, names) for module in order)
+    return {
+        'pyz': str(pyz),
+        'python': python,
+        'trials': trials,
+        'total_us': sum(record['self_us'] for record in modules),
+        'archive_us': sum(record['self_us'] for record in archived),
+        'inflate_us': round(sum(record['inflate_us'] for record in archived), 1),
+        'import_order': [entry for entry in entries if entry is not None],
+        'modules': modules,
+        'packages': sorted(
+            packages.values(), key=lambda package: package['self_us'], reverse=True
+        ),
+    }
+
+
+def format_report(report: dict, top: int = 20, as_json: bool = False) -> str:
+    """Render a report of profile_archive as tables, or as JSON."""
+    if as_json:
+        return json.dumps(report, indent=2)
+
+    def ms(us: float) -> str:
+        return f'{us / 1000:8.2f}'
+
+    lines = [
+        f'{report["pyz"]}: median of {report["trials"]} runs with {report["python"]}',
+        f'total import time {ms(report["total_us"]).strip()} ms, '
+        f'{ms(report["archive_us"]).strip()} ms from the archive, '
+        f'of which inflating {ms(report["inflate_us"]).strip()} ms',
+        '',
+        f'slowest {top} imports:',
+        f'{"self ms":>8} {"cum ms":>8} {"inflate":>8} {"zipped":>9} {"size":>9}  module',
+    ]
+    for record in report['modules'][:top]:
+        if record['entry'] is None:
+            sizes = f'{"-":>8} {"-":>9} {"-":>9}'
+        else:
+            sizes = (
+                f'{ms(record["inflate_us"])} '
+                f'{record["compress_size"]:>9} {record["file_size"]:>9}'
+            )
+        where = f'  {record["entry"]}' if record['entry'] else ''
+        lines.append(
+            f'{ms(record["self_us"])} {ms(record["cumulative_us"])} {sizes}  '
+            f'{record["module"]}{where}'
+        )
+    lines += [
+        '',
+        'time per top-level package:',
+        f'{"self ms":>8} {"modules":>8}  package',
+    ]
+    for package in report['packages'][:top]:
+        mark = '' if package['in_archive'] else ' (not in archive)'
+        lines.append(
+            f'{ms(package["self_us"])} {package["modules"]:>8}  '
+            f'{package["package"]}{mark}'
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Incremental archive builds.
+
+A manifest of (size, mtime_ns, sha256) per entry is kept next to the output
+archive. On the next build the compressed payload of every unchanged file is
+copied straight out of the previous archive, and only changed files are read
+and compressed again. The local headers are rebuilt from the current files,
+so an incremental build is identical to a full one.
+
+The manifest and entry table of the last build of every target are also
+kept in memory, and used instead of the files as long as the archive has
+not changed on disk, so rebuilds in the same process (see watch.py) skip
+reading them. Such a rebuild can also be told which files are known not to
+have changed since, and reuses their entries without looking at them."""
+
+import json
+import os
+import zipfile
+from collections.abc import Callable
+from pathlib import Path
+
+from .archive import (
+    compress_file,
+    iter_raw_payload,
+    raw_payload_offset,
+    write_compressed_entry,
+    write_file,
+)
+from .layout import Layout
+from .utils import hash_stream
+
+MANIFEST_VERSION = 2
+MANIFEST_SUFFIX = '.manifest.json'
+
+# target -> (signature of the archive, layout key, entries, infos) of the
+# builds of this process
+_saved_builds: dict[Path, tuple[tuple, list, dict, dict]] = {}
+
+
+def manifest_path(target: Path) -> Path:
+    return target.with_name(target.name + MANIFEST_SUFFIX)
+
+
+def hash_file(path: Path) -> str:
+    with open(path, 'rb') as f:
+        return hash_stream(f)
+
+
+def file_signature(path: Path) -> tuple:
+    st = path.stat()
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class IncrementalBuild:
+    """Reuses compressed entries of the archive previously built at target.
+
+    unchanged tells the files that did not change since the last build of
+    target in this process, if it is still the archive at target."""
+
+    def __init__(
+        self,
+        target: Path,
+        layout: Layout,
+        unchanged: Callable[[Path], bool] | None = None,
+    ):
+        self.target = target
+        self.layout = layout
+        self._unchanged: Callable[[Path], bool] | None = None
+        self.entries: dict[str, list] = {}
+        # the ZipInfo of every entry written through this build
+        self.infos: dict[str, zipfile.ZipInfo] = {}
+        self._old_entries: dict[str, list] = {}
+        self._old_infos: dict[str, zipfile.ZipInfo] = {}
+        self._fd: int | None = None
+        if self._load_saved():
+            self._unchanged = unchanged
+            return
+        try:
+            manifest = json.loads(manifest_path(target).read_text())
+        except (OSError, ValueError):
+            return
+        if (
+            manifest.get('version') != MANIFEST_VERSION
+            or manifest.get('layout') != layout.key()
+        ):
+            return
+        try:
+            with zipfile.ZipFile(target) as zf:
+                # header offsets are absolute here, the shebang is accounted for
+                self._old_infos = {info.filename: info for info in zf.infolist()}
+            self._fd = os.open(target, os.O_RDONLY)
+        except (OSError, zipfile.BadZipFile):
+            self._old_infos = {}
+            return
+        self._old_entries = manifest['entries']
+
+    def _load_saved(self) -> bool:
+        saved = _saved_builds.get(self.target)
+        if saved is None:
+            return False
+        signature, layout_key, entries, infos = saved
+        try:
+            if signature != file_signature(self.target) or (
+                layout_key != self.layout.key()
+            ):
+                return False
+            self._fd = os.open(self.target, os.O_RDONLY)
+        except OSError:
+            return False
+        self._old_entries, self._old_infos = entries, infos
+        return True
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> 'IncrementalBuild':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def save(self) -> None:
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'layout': self.layout.key(),
+            'entries': self.entries,
+        }
+        manifest_path(self.target).write_text(json.dumps(manifest, sort_keys=True))
+        _saved_builds[self.target] = (
+            file_signature(self.target),
+            self.layout.key(),
+            self.entries,
+            self.infos,
+        )
+
+    def _reusable_info(self, zinfo: zipfile.ZipInfo) -> zipfile.ZipInfo | None:
+        old_info = self._old_infos.get(zinfo.filename)
+        if (
+            old_info is None
+            or not self.layout.reusable(old_info.compress_type, zinfo)
+            or old_info.file_size != zinfo.file_size
+            or old_info.flag_bits & 0x1  # encrypted
+        ):
+            return None
+        return old_info
+
+    def _lookup(self, child: Path, zinfo: zipfile.ZipInfo) -> tuple[list, bool]:
+        """Return the manifest record for child and whether it is unchanged."""
+        old_record = self._old_entries.get(zinfo.filename)
+        if (
+            old_record is not None
+            and self._unchanged is not None
+            and self._unchanged(child)
+        ):
+            return old_record, True
+        st = child.stat()
+        if old_record is not None and old_record[:2] == [st.st_size, st.st_mtime_ns]:
+            return old_record, True
+        record = [st.st_size, st.st_mtime_ns, None]
+        if old_record is not None and old_record[0] == st.st_size:
+            # touched but maybe not modified, compare content
+            record[2] = hash_file(child)
+            return record, record[2] == old_record[2]
+        return record, False
+
+    def build_entry(self, child: Path, zinfo: zipfile.ZipInfo) -> tuple[int, bytes]:
+        """Worker job: reuse the old payload of child or compress it.
+
+        Returns:
+            The CRC32 and the payload, like archive.compress_file."""
+        record, unchanged = self._lookup(child, zinfo)
+        old_info = self._reusable_info(zinfo) if unchanged else None
+        self.infos[zinfo.filename] = zinfo
+        if old_info is not None:
+            self.entries[zinfo.filename] = record
+            zinfo.compress_type = old_info.compress_type
+            payload = os.pread(
+                self._fd, old_info.compress_size, raw_payload_offset(self._fd, old_info)
+            )
+            return old_info.CRC, payload
+        crc, payload = compress_file(child, zinfo, self.layout)
+        if record[2] is None:
+            record[2] = hash_file(child)
+        self.entries[zinfo.filename] = record
+        return crc, payload
+
+    def write_large_entry(
+        self, zf: zipfile.ZipFile, child: Path, zinfo: zipfile.ZipInfo
+    ) -> None:
+        """Write an entry above STREAMING_THRESHOLD without loading it whole."""
+        record, unchanged = self._lookup(child, zinfo)
+        old_info = self._reusable_info(zinfo) if unchanged else None
+        self.infos[zinfo.filename] = zinfo
+        if old_info is None:
+            write_file(zf, child, zinfo, self.layout.compresslevel)
+            if record[2] is None:
+                record[2] = hash_file(child)
+            self.entries[zinfo.filename] = record
+            return
+        self.entries[zinfo.filename] = record
+        zinfo.compress_type = old_info.compress_type
+        write_compressed_entry(
+            zf,
+            zinfo,
+            old_info.CRC,
+            iter_raw_payload(self._fd, old_info),
+            compress_size=old_info.compress_size,
+        )
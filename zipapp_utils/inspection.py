@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""What an archive is made of, from its central directory alone.
+
+The archive is memory-mapped and only the end of central directory record
+and the central directory are parsed, nothing is decompressed and the
+entries' data is never touched, so inspecting an archive of several GB
+reads a few MB at most. Data prepended to the archive (like the shebang of
+a .pyz) is allowed, and ZIP64 archives are supported.
+
+Entries with the same CRC-32 and size are reported as duplicates: the same
+content stored more than once, like a file vendored by two packages."""
+
+import json
+import mmap
+import os
+import re
+import struct
+import zipfile
+from pathlib import Path
+
+# end of central directory record, its ZIP64 locator and record
+EOCD = struct.Struct('<4s4H2IH')
+EOCD_SIGNATURE = b'PK\x05\x06'
+ZIP64_LOCATOR_SIZE = 20
+ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+ZIP64_EOCD = struct.Struct('<4sQ2H2I4Q')
+ZIP64_EOCD_SIGNATURE = b'PK\x06\x06'
+# central directory file header
+CENTRAL_HEADER = struct.Struct('<4s6H3I5HII')
+CENTRAL_HEADER_SIGNATURE = b'PK\x01\x02'
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_LIMIT = 0xFFFFFFFF
+# the archive comment is at most 64 KiB
+MAX_COMMENT = 0xFFFF
+
+METHODS = {0: 'stored', 8: 'deflated', 12: 'bzip2', 14: 'lzma'}
+
+SIZE_SUFFIXES = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3}
+
+
+def parse_size(text: str) -> int:
+    """A size in bytes like 1048576, 512K, 20M or 1.5G (powers of 1024)."""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMG]?)i?B?', text.strip(), re.I)
+    if match is None:
+        raise ValueError(f'invalid size: {text!r}')
+    number, suffix = match.groups()
+    return int(float(number) * SIZE_SUFFIXES[suffix.upper()])
+
+
+def find_end_records(data: mmap.mmap) -> tuple[int, int | None]:
+    """Positions of the end of central directory record and of the ZIP64
+    one, None if the archive has none."""
+    start = max(0, len(data) - EOCD.size - MAX_COMMENT)
+    position = data.rfind(EOCD_SIGNATURE, start)
+    while position >= 0:
+        # the signature could appear in the comment, the record is the one
+        # whose comment ends the file
+        if position + EOCD.size <= len(data):
+            fields = EOCD.unpack_from(data, position)
+            if position + EOCD.size + fields[7] == len(data):
+                break
+        position = data.rfind(EOCD_SIGNATURE, start, position)
+    else:
+        raise zipfile.BadZipFile(
+            'not a zip archive: no end of central directory record'
+        )
+    locator = position - ZIP64_LOCATOR_SIZE
+    if locator >= 0 and data[locator : locator + 4] == ZIP64_LOCATOR_SIGNATURE:
+        # the ZIP64 record comes right before its locator
+        record = locator - ZIP64_EOCD.size
+        if data[record : record + 4] != ZIP64_EOCD_SIGNATURE:
+            raise zipfile.BadZipFile('broken ZIP64 end of central directory record')
+        return position, record
+    return position, None
+
+
+def find_central_directory(data: mmap.mmap) -> tuple[int, int, int, int]:
+    """Locate the central directory.
+
+    Returns:
+        Its position in the file, its size, its number of entries, and the
+        position the offsets of the archive count from. That is 0 if they
+        count from the start of the file, like zipfile writes them, or the
+        length of the data prepended to the archive if they count from the
+        start of the zip. Readers accept both."""
+    position, record = find_end_records(data)
+    if record is None:
+        _, _, _, _, count, size, offset, _ = EOCD.unpack_from(data, position)
+        end = position
+    else:
+        fields = ZIP64_EOCD.unpack_from(data, record)
+        count, size, offset = fields[7], fields[8], fields[9]
+        end = record
+    directory = end - size
+    if directory < 0:
+        raise zipfile.BadZipFile('broken end of central directory record')
+    return directory, size, count, directory - offset
+
+
+def zip64_sizes(extra: bytes, file_size: int, compress_size: int) -> tuple[int, int]:
+    """The sizes of an entry, from its ZIP64 extra field where they
+    overflowed the central header."""
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, length = struct.unpack_from('<HH', extra, position)
+        if field_id == ZIP64_EXTRA_ID:
+            values = iter(struct.unpack_from(f'<{length // 8}Q', extra, position + 4))
+            # only the values that overflowed are there, in this order
+            if file_size == ZIP64_LIMIT:
+                file_size = next(values)
+            if compress_size == ZIP64_LIMIT:
+                compress_size = next(values)
+            break
+        position += 4 + length
+    return file_size, compress_size
+
+
+def iter_central_directory(data: mmap.mmap, directory: int, count: int):
+    """Yield (name, method, crc, compress_size, file_size) of every entry."""
+    position = directory
+    for _ in range(count):
+        fields = CENTRAL_HEADER.unpack_from(data, position)
+        if fields[0] != CENTRAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f'broken central directory at offset {position}')
+        flags, method = fields[3:5]
+        crc, compress_size, file_size = fields[7:10]
+        name_length, extra_length, comment_length = fields[10:13]
+        position += CENTRAL_HEADER.size
+        raw_name = data[position : position + name_length]
+        # bit 11: the name is UTF-8, cp437 otherwise
+        name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437')
+        position += name_length
+        if ZIP64_LIMIT in (file_size, compress_size):
+            file_size, compress_size = zip64_sizes(
+                data[position : position + extra_length], file_size, compress_size
+            )
+        position += extra_length + comment_length
+        yield name, method, crc, compress_size, file_size
+
+
+def top_level(name: str) -> str:
+    """The package (or module) an entry belongs to."""
+    top, sep, _ = name.partition('/')
+    if sep:
+        return top
+    for suffix in ('.py', '.pyc'):
+        if top.endswith(suffix):
+            return top[: -len(suffix)]
+    return top
+
+
+def ratio(compress_size: int, file_size: int) -> float:
+    return round(compress_size / file_size, 3) if file_size else 1.0
+
+
+def inspect_archive(pyz: Path, top: int = 20) -> dict:
+    """Report the entries of an archive, see the module docstring.
+
+    Args:
+        pyz: The archive.
+        top: Number of largest entries (by compressed size) and of
+            duplicate groups to list.
+
+    Returns:
+        A JSON serializable report: the sizes of the archive and of its
+        entries, the sizes per top-level package and per compression
+        method, the largest entries and groups of duplicates."""
+    with open(pyz, 'rb') as f:
+        archive_size = os.fstat(f.fileno()).st_size
+        if archive_size == 0:
+            raise zipfile.BadZipFile('not a zip archive: empty file')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            directory, directory_size, count, _ = find_central_directory(data)
+            entries = list(iter_central_directory(data, directory, count))
+
+    packages: dict[str, dict] = {}
+    methods: dict[str, dict] = {}
+    by_content: dict[tuple[int, int], list[tuple[str, int]]] = {}
+    files = []
+    for name, method, crc, compress_size, file_size in entries:
+        if name.endswith('/'):
+            continue
+        files.append((name, METHODS.get(method, str(method)), compress_size, file_size))
+        package_name = top_level(name)
+        package = packages.setdefault(
+            package_name,
+            {'package': package_name, 'entries': 0, 'compress_size': 0, 'file_size': 0},
+        )
+        method_totals = methods.setdefault(
+            METHODS.get(method, str(method)),
+            {'entries': 0, 'compress_size': 0, 'file_size': 0},
+        )
+        for totals in (package, method_totals):
+            totals['entries'] += 1
+            totals['compress_size'] += compress_size
+            totals['file_size'] += file_size
+        if file_size:
+            by_content.setdefault((crc, file_size), []).append((name, compress_size))
+
+    for package in packages.values():
+        package['ratio'] = ratio(package['compress_size'], package['file_size'])
+    for totals in methods.values():
+        totals['ratio'] = ratio(totals['compress_size'], totals['file_size'])
+    duplicates = []
+    for (crc, file_size), names in by_content.items():
+        if len(names) > 1:
+            duplicates.append(
+                {
+                    'crc': f'{crc:08x}',
+                    'file_size': file_size,
+                    # what leaving all but one of them out would save
+                    'wasted': sum(sorted(size for _, size in names)[:-1]),
+                    'names': [name for name, _ in names],
+                }
+            )
+    duplicates.sort(key=lambda group: group['wasted'], reverse=True)
+    largest = sorted(files, key=lambda file: file[2], reverse=True)[:top]
+    compress_size = sum(file[2] for file in files)
+    file_size = sum(file[3] for file in files)
+    return {
+        'pyz': str(pyz),
+        'archive_size': archive_size,
+        'entries': len(entries),
+        'files': len(files),
+        'directories': len(entries) - len(files),
+        'compress_size': compress_size,
+        'file_size': file_size,
+        'ratio': ratio(compress_size, file_size),
+        'central_directory_size': directory_size,
+        'methods': methods,
+        'packages': sorted(
+            packages.values(),
+            key=lambda package: package['compress_size'],
+            reverse=True,
+        ),
+        'largest': [
+            {
+                'name': name,
+                'method': method,
+                'compress_size': compress,
+                'file_size': size,
+                'ratio': ratio(compress, size),
+            }
+            for name, method, compress, size in largest
+        ],
+        'duplicates': duplicates[:top],
+        'duplicate_groups': len(duplicates),
+        'duplicate_wasted': sum(group['wasted'] for group in duplicates),
+    }
+
+
+def check_max_size(report: dict, max_size: int | None) -> str | None:
+    """Why the archive of report is over max_size bytes, None if it isn't."""
+    if max_size is None or report['archive_size'] <= max_size:
+        return None
+    return (
+        f'{report["pyz"]} is {report["archive_size"]:,} bytes, '
+        f'{report["archive_size"] - max_size:,} over the limit of {max_size:,}'
+    )
+
+
+def format_report(report: dict, top: int = 20, as_json: bool = False) -> str:
+    """Render a report of inspect_archive as tables, or as JSON."""
+    if as_json:
+        return json.dumps(report, indent=2)
+
+    def row(compress_size: int, file_size: int, ratio: float) -> str:
+        return f'{compress_size:>12,} {file_size:>12,} {ratio:>6.3f}'
+
+    header = f'{"compressed":>12} {"size":>12} {"ratio":>6}'
+    lines = [
+        f'{report["pyz"]}: {report["archive_size"]:,} bytes, '
+        f'{report["files"]} files and {report["directories"]} directories',
+        f'{row(report["compress_size"], report["file_size"], report["ratio"])}  '
+        'all files',
+        '',
+        'per method:',
+        f'{header} {"entries":>8}  method',
+    ]
+    for method, totals in report['methods'].items():
+        lines.append(
+            f'{row(totals["compress_size"], totals["file_size"], totals["ratio"])} '
+            f'{totals["entries"]:>8}  {method}'
+        )
+    lines += ['', 'per top-level package:', f'{header} {"entries":>8}  package']
+    for package in report['packages'][:top]:
+        lines.append(
+            f'{row(package["compress_size"], package["file_size"], package["ratio"])} '
+            f'{package["entries"]:>8}  {package["package"]}'
+        )
+    lines += ['', f'largest {top} entries:', f'{header} {"method":>8}  entry']
+    for entry in report['largest'][:top]:
+        lines.append(
+            f'{row(entry["compress_size"], entry["file_size"], entry["ratio"])} '
+            f'{entry["method"]:>8}  {entry["name"]}'
+        )
+    lines += [
+        '',
+        f'{report["duplicate_groups"]} groups of duplicate entries, '
+        f'{report["duplicate_wasted"]:,} bytes could be saved',
+    ]
+    if report['duplicates']:
+        lines.append(f'{"wasted":>12} {"size":>12}  entries')
+    for group in report['duplicates'][:top]:
+        names = ', '.join(group['names'][:3])
+        if len(group['names']) > 3:
+            names += f' and {len(group["names"]) - 3} more'
+        lines.append(f'{group["wasted"]:>12,} {group["file_size"]:>12,}  {names}')
+    return '\n'.join(lines)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Per-entry storage policy and order of archive entries.
+
+By default every entry is compressed the way the archive is, in walk order,
+like zipapp does. A Layout can instead:
+
+- deflate at another level (compresslevel)
+- store incompressible files (store_incompressible): known compressed
+  formats by extension, files whose first block does not deflate well, and
+  anything deflate would not make smaller
+- put the modules of an import trace first, in import order, so startup
+  reads one contiguous region of the file, and store the small ones, so
+  importing them needs no inflate (trace, hot_store_limit)
+- make the output depend on file contents only (deterministic): entries are
+  sorted by name within each directory, timestamps are fixed to
+  SOURCE_DATE_EPOCH (or 1980-01-01) and permissions are normalized to
+  0644/0755
+
+A trace is a list of archive entry names, in a text file (one per line) or
+the JSON report of ``zau profile --json``."""
+
+import json
+import os
+import time
+import zlib
+import zipfile
+from collections.abc import Sequence
+from pathlib import Path
+
+# formats that are compressed already. Shared libraries are not among them,
+# they usually deflate to half their size, the sample test decides for them
+INCOMPRESSIBLE_SUFFIXES = frozenset(
+    [
+        '.7z',
+        '.bz2',
+        '.gif',
+        '.gz',
+        '.jar',
+        '.jpeg',
+        '.jpg',
+        '.pyz',
+        '.png',
+        '.tgz',
+        '.webp',
+        '.whl',
+        '.xz',
+        '.zip',
+        '.zst',
+    ]
+)
+
+# files up to this size are not sampled, they are cheap to deflate anyway
+SAMPLE_SIZE = 64 * 1024
+# a sample deflating to more than this is considered incompressible
+SAMPLE_RATIO = 0.95
+
+HOT_STORE_LIMIT = 32 * 1024
+
+# the earliest time a zip file can represent
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+def load_trace(path: Path) -> list[str]:
+    """Read the entry names of a trace file, see the module docstring."""
+    text = path.read_text()
+    try:
+        report = json.loads(text)
+    except ValueError:
+        return [line.strip() for line in text.splitlines() if line.strip()]
+    return list(report['import_order'])
+
+
+def fixed_date_time() -> tuple[int, int, int, int, int, int]:
+    """The timestamp of deterministic entries, SOURCE_DATE_EPOCH if set, see
+    https://reproducible-builds.org/specs/source-date-epoch/"""
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if not epoch:
+        return ZIP_EPOCH
+    return max(ZIP_EPOCH, time.gmtime(int(epoch))[:6])
+
+
+def looks_incompressible(data: bytes) -> bool:
+    """Quick check on the beginning of a file, with the fastest deflate."""
+    sample = data[:SAMPLE_SIZE]
+    return len(zlib.compress(sample, 1)) > len(sample) * SAMPLE_RATIO
+
+
+class Layout:
+    """Decides how every entry is compressed, and which entries go first."""
+
+    def __init__(
+        self,
+        compression: int = zipfile.ZIP_STORED,
+        compresslevel: int | None = None,
+        store_incompressible: bool = False,
+        trace: Sequence[str] = (),
+        hot_store_limit: int = HOT_STORE_LIMIT,
+        deterministic: bool = False,
+    ):
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.store_incompressible = store_incompressible
+        # first occurrence of every name, in order
+        self.trace = list(dict.fromkeys(trace))
+        self.hot = frozenset(self.trace)
+        self.hot_store_limit = hot_store_limit
+        self.deterministic = deterministic
+        self.date_time = fixed_date_time() if deterministic else None
+
+    def key(self) -> list:
+        """What reused compressed entries depend on, for incremental builds."""
+        return [
+            self.compression,
+            self.compresslevel,
+            self.store_incompressible,
+            self.hot_store_limit if self.hot else None,
+        ]
+
+    def normalize(self, zinfo: zipfile.ZipInfo) -> None:
+        """Drop the metadata of zinfo that a deterministic build can't keep."""
+        if not self.deterministic:
+            return
+        zinfo.date_time = self.date_time
+        mode = zinfo.external_attr >> 16
+        if zinfo.is_dir():
+            zinfo.external_attr = (0o40755 << 16) | 0x10
+        else:
+            perm = 0o755 if mode & 0o111 else 0o644
+            zinfo.external_attr = ((mode & ~0o7777 or 0o100000) | perm) << 16
+
+    def compress_type(self, arcname: str, file_size: int) -> int:
+        """The compression of an entry, decided from its name and size."""
+        if self.compression == zipfile.ZIP_STORED:
+            return zipfile.ZIP_STORED
+        if arcname in self.hot and file_size <= self.hot_store_limit:
+            return zipfile.ZIP_STORED
+        if self.store_incompressible and (
+            Path(arcname).suffix.lower() in INCOMPRESSIBLE_SUFFIXES
+        ):
+            return zipfile.ZIP_STORED
+        return self.compression
+
+    def reusable(self, old_compress_type: int, zinfo: zipfile.ZipInfo) -> bool:
+        """Whether a previously written entry of unchanged content can be
+        reused for zinfo, whose compression has been decided already."""
+        if old_compress_type == zinfo.compress_type:
+            return True
+        # compress would have stored it again
+        return (
+            self.store_incompressible
+            and old_compress_type == zipfile.ZIP_STORED
+            and zinfo.compress_type == zipfile.ZIP_DEFLATED
+        )
+
+    def compress(self, data: bytes, zinfo: zipfile.ZipInfo) -> tuple[int, bytes]:
+        """Compress data as decided for zinfo.
+
+        With store_incompressible, zinfo is switched to stored if deflate
+        does not pay off.
+
+        Returns:
+            The CRC32 of data and the payload."""
+        crc = zlib.crc32(data)
+        if zinfo.compress_type != zipfile.ZIP_DEFLATED:
+            return crc, data
+        if self.store_incompressible and (
+            len(data) > SAMPLE_SIZE and looks_incompressible(data)
+        ):
+            zinfo.compress_type = zipfile.ZIP_STORED
+            return crc, data
+        level = zlib.Z_DEFAULT_COMPRESSION
+        if self.compresslevel is not None:
+            level = self.compresslevel
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        payload = compressor.compress(data) + compressor.flush()
+        if self.store_incompressible and len(payload) >= len(data):
+            zinfo.compress_type = zipfile.ZIP_STORED
+            return crc, data
+        return crc, payload
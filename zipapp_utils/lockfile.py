@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""The dependencies of a poetry project, from its poetry.lock alone.
+
+The versions in poetry.lock are already resolved, so no resolver runs:
+starting from the main dependencies of pyproject.toml, the dependency graph
+recorded in the lock file is walked, leaving out what the markers rule out
+for the running interpreter, and every locked package is matched to a wheel
+by name, version and compatibility tags, in the wheelhouse or in the
+dependency store. Only the packages found nowhere are fetched, by a single
+pip run with --no-deps, so pip has nothing to resolve either. Wheels are
+then checked against the hashes of the lock file on a thread pool.
+
+pyproject.toml may use the [tool.poetry] or the [project] table, and lock
+files of format 1.x (hashes in [metadata.files]) and 2.x (hashes in the
+files of every package) are read."""
+
+import os
+import platform
+import re
+from collections import deque
+from collections.abc import Collection, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import EntryPointNotFoundError, ProjectNameNotFoundError, logger, timings
+from .archive import resolve_jobs
+from .store import DependencyStore
+from .utils import hash_stream
+
+try:
+    from packaging.markers import Marker
+    from packaging.requirements import Requirement
+    from packaging.specifiers import SpecifierSet
+    from packaging.tags import sys_tags
+    from packaging.utils import (
+        InvalidWheelFilename,
+        canonicalize_name,
+        parse_wheel_filename,
+    )
+    from packaging.version import InvalidVersion, Version
+except ImportError:  # pip vendors it
+    from pip._vendor.packaging.markers import Marker  # type: ignore
+    from pip._vendor.packaging.requirements import Requirement  # type: ignore
+    from pip._vendor.packaging.specifiers import SpecifierSet  # type: ignore
+    from pip._vendor.packaging.tags import sys_tags  # type: ignore
+    from pip._vendor.packaging.utils import (  # type: ignore
+        InvalidWheelFilename,
+        canonicalize_name,
+        parse_wheel_filename,
+    )
+    from pip._vendor.packaging.version import InvalidVersion, Version  # type: ignore
+
+# an operator and a version of a poetry constraint, like ^1.2, >= 2 or 3.*
+CONSTRAINT_PART = re.compile(r'(\^|~=|~|==|!=|>=|<=|>|<|=)?\s*([0-9*][\w.*+!-]*)')
+# the name at the start of a requirement of [package.extras], like
+# "PySocks (>=1.5.6,!=1.5.7)"
+REQUIREMENT_NAME = re.compile(r'[A-Za-z0-9][A-Za-z0-9._-]*')
+# left out of the packages of the project, like poetry build does
+PROJECT_EXCLUDE_PATTERNS = ['__pycache__/', '*.py[cod]']
+
+
+def read_toml(path: Path) -> dict:
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        try:
+            import tomli as tomllib  # type: ignore
+        except ImportError:
+            raise SystemExit('Reading poetry projects requires Python 3.11 or tomli')
+    try:
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    except FileNotFoundError:
+        raise SystemExit(f'{path} does not exist')
+    except tomllib.TOMLDecodeError as e:
+        raise SystemExit(f'{path}: {e}')
+
+
+def _release(version: str) -> list[int]:
+    match = re.match(r'\d+(?:\.\d+)*', version)
+    return [int(part) for part in match.group().split('.')] if match else [0]
+
+
+def _upper_bound(release: list[int], index: int) -> str:
+    return '.'.join(map(str, [*release[:index], release[index] + 1]))
+
+
+def poetry_specifiers(constraint: str) -> list[SpecifierSet]:
+    """Translate a poetry version constraint (with ^, ~, wildcards, and
+    alternatives separated by ||) into PEP 440 specifier sets, one of which
+    has to match."""
+    alternatives = []
+    for alternative in re.split(r'\|\|?', constraint):
+        specifiers = []
+        for operator, version in CONSTRAINT_PART.findall(alternative):
+            if version == '*':
+                continue
+            release = _release(version)
+            if operator == '^':
+                # up to the first non-zero part, or the last one
+                index = next(
+                    (i for i, part in enumerate(release) if part), len(release) - 1
+                )
+                specifiers += [f'>={version}', f'<{_upper_bound(release, index)}']
+            elif operator == '~':
+                index = min(1, len(release) - 1)
+                specifiers += [f'>={version}', f'<{_upper_bound(release, index)}']
+            elif operator in ('', '='):
+                specifiers.append(f'=={version}')
+            else:
+                specifiers.append(f'{operator}{version}')
+        alternatives.append(SpecifierSet(','.join(specifiers)))
+    return alternatives
+
+
+def allows(constraint: str, version: str) -> bool:
+    """Whether the poetry constraint allows version, True if either can't be
+    parsed."""
+    try:
+        parsed = Version(version)
+        alternatives = poetry_specifiers(constraint)
+    except (InvalidVersion, ValueError):
+        return True
+    return any(
+        specifiers.contains(parsed, prereleases=True) for specifiers in alternatives
+    )
+
+
+def dependency_specs(spec: str | dict | list) -> list[dict]:
+    """A dependency in poetry's format (a constraint, a table, or a list of
+    tables for different markers) as a list of tables."""
+    if isinstance(spec, str):
+        return [{'version': spec}]
+    if isinstance(spec, dict):
+        return [spec]
+    return list(spec)
+
+
+def applies(spec: dict, extras: Collection[str] = ()) -> bool:
+    """Whether a dependency applies to the running interpreter, for a
+    dependent installed with extras."""
+    if 'python' in spec and not allows(spec['python'], platform.python_version()):
+        return False
+    markers = spec.get('markers')
+    if isinstance(markers, dict):
+        # lock files of poetry 2 have markers per dependency group
+        markers = markers.get('main')
+    if markers:
+        marker = Marker(markers)
+        return any(marker.evaluate({'extra': extra}) for extra in (*extras, ''))
+    return True
+
+
+def requirement_names(requirements: Iterable[str]) -> set[str]:
+    names = set()
+    for requirement in requirements:
+        match = REQUIREMENT_NAME.match(requirement.strip())
+        if match is not None:
+            names.add(canonicalize_name(match.group()))
+    return names
+
+
+def project_config(pyproject: dict, pyproject_path: Path) -> dict:
+    """The name, scripts, packages, extras and main dependencies of a
+    project, from the [tool.poetry] and [project] tables of its
+    pyproject.toml."""
+    poetry = pyproject.get('tool', {}).get('poetry', {})
+    project = pyproject.get('project', {})
+    name = project.get('name') or poetry.get('name')
+    if not name:
+        raise ProjectNameNotFoundError(f'No project name found in {pyproject_path}')
+
+    scripts = {**poetry.get('scripts', {}), **project.get('scripts', {})}
+    dependencies: dict[str, list[dict]] = {}
+    extras: dict[str, set[str]] = {
+        extra: requirement_names(names)
+        for extra, names in poetry.get('extras', {}).items()
+    }
+    for dep_name, spec in poetry.get('dependencies', {}).items():
+        if dep_name.lower() != 'python':
+            dependencies[dep_name] = dependency_specs(spec)
+    optional_dependencies = project.get('optional-dependencies', {})
+    for extra, requirements in [
+        ('', project.get('dependencies', [])),
+        *optional_dependencies.items(),
+    ]:
+        for requirement in map(Requirement, requirements):
+            spec: dict = {'version': str(requirement.specifier) or '*'}
+            if requirement.marker is not None:
+                spec['markers'] = str(requirement.marker)
+            if requirement.extras:
+                spec['extras'] = sorted(requirement.extras)
+            if extra:
+                spec['optional'] = True
+                extras.setdefault(extra, set()).add(canonicalize_name(requirement.name))
+            dependencies.setdefault(requirement.name, []).append(spec)
+    return {
+        'name': name,
+        'scripts': scripts,
+        'packages': poetry.get('packages', []),
+        'dependencies': dependencies,
+        'extras': extras,
+    }
+
+
+def entry_point(config: dict, bin: str | None, pyproject_path: Path) -> str:
+    """The module:function of the script bin, named like the project by
+    default."""
+    if not config['scripts']:
+        raise EntryPointNotFoundError(f'No entry point found in {pyproject_path}')
+    if bin is None:
+        bin = config['name']
+    script = config['scripts'].get(bin)
+    if isinstance(script, dict):
+        # { callable = "module:function", extras = [...] } or, since
+        # poetry 1.2, { reference = "module:function", type = "console" }
+        if script.get('type', 'console') != 'console':
+            raise EntryPointNotFoundError(
+                f'{bin} of {pyproject_path} is not a console script'
+            )
+        script = script.get('callable') or script.get('reference')
+    if not script:
+        raise EntryPointNotFoundError(
+            f'No entry point found in {pyproject_path} for {bin}'
+        )
+    return script.split()[0]
+
+
+def _choose(dep_name: str, candidates: list[dict], spec: dict) -> dict:
+    # lock files can have several versions of a package, for different
+    # markers or constraints
+    constraint = spec.get('version', '*')
+    for package in candidates:
+        if applies(package) and allows(constraint, package['version']):
+            return package
+    versions = ', '.join(package['version'] for package in candidates)
+    raise SystemExit(
+        f'{dep_name} {constraint} does not match poetry.lock ({versions}),'
+        ' run poetry lock to update it'
+    )
+
+
+def locked_packages(
+    lock: dict, config: dict, extras: Collection[str] = ()
+) -> list[dict]:
+    """The packages of the lock file the main dependencies of the project
+    need on the running interpreter, with extras of the project, sorted by
+    name."""
+    unknown = set(extras) - set(config['extras'])
+    if unknown:
+        raise SystemExit(f'Unknown extras: {", ".join(sorted(unknown))}')
+    optional = set().union(*(config['extras'][extra] for extra in extras))
+    by_name: dict[str, list[dict]] = {}
+    for package in lock.get('package', []):
+        by_name.setdefault(canonicalize_name(package['name']), []).append(package)
+
+    selected: dict[str, dict] = {}
+    selected_extras: dict[str, set[str]] = {}
+    # (name, spec, extras of the dependent, optional dependencies it pulls in)
+    pending: deque[tuple[str, dict, Collection[str], set[str]]] = deque(
+        (dep_name, spec, (), optional)
+        for dep_name, specs in config['dependencies'].items()
+        for spec in specs
+    )
+    while pending:
+        dep_name, spec, dependent_extras, pulled = pending.popleft()
+        name = canonicalize_name(dep_name)
+        if spec.get('optional') and name not in pulled:
+            continue
+        if not applies(spec, dependent_extras):
+            continue
+        if name not in by_name:
+            raise SystemExit(
+                f'{dep_name} is not in poetry.lock, run poetry lock to update it'
+            )
+        package = selected.get(name) or _choose(dep_name, by_name[name], spec)
+        known_extras = selected_extras.setdefault(name, set())
+        new_extras = set(spec.get('extras', [])) - known_extras
+        if name in selected and not new_extras:
+            continue
+        selected[name] = package
+        known_extras |= new_extras
+        package_extras = package.get('extras', {})
+        pulled_by_package = set().union(
+            *(
+                requirement_names(package_extras.get(extra, []))
+                for extra in known_extras
+            )
+        )
+        for sub_name, sub_spec in package.get('dependencies', {}).items():
+            for sub in dependency_specs(sub_spec):
+                pending.append((sub_name, sub, sorted(known_extras), pulled_by_package))
+    return [selected[name] for name in sorted(selected)]
+
+
+def locked_hashes(lock: dict, package: dict) -> dict[str, str]:
+    """File name -> hash ('sha256:<hex>') of the distributions of package."""
+    files = package.get('files')
+    if files is None:
+        metadata_files = lock.get('metadata', {}).get('files', {})
+        files = metadata_files.get(package['name']) or metadata_files.get(
+            canonicalize_name(package['name']), []
+        )
+    return {file['file']: file['hash'] for file in files if 'hash' in file}
+
+
+def index_wheels(directories: Iterable[Path]) -> dict[tuple[str, Version], Path]:
+    """The wheels of directories the running interpreter can use, by name
+    and version. Of several wheels of a release, the one with the most
+    specific tags wins, then the one of the first directory."""
+    priority = {tag: i for i, tag in enumerate(sys_tags())}
+    best: dict[tuple[str, Version], tuple[int, Path]] = {}
+    for directory in directories:
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            continue
+        for file_name in names:
+            if not file_name.endswith('.whl'):
+                continue
+            try:
+                name, version, _, tags = parse_wheel_filename(file_name)
+            except (InvalidWheelFilename, InvalidVersion):
+                continue
+            rank = min((priority[tag] for tag in tags if tag in priority), default=None)
+            if rank is None:
+                continue
+            key = (name, version)
+            if key not in best or rank < best[key][0]:
+                best[key] = (rank, directory / file_name)
+    return {key: wheel for key, (_, wheel) in best.items()}
+
+
+def pip_requirement(package: dict, project: Path) -> str:
+    """How to ask pip for exactly the locked package."""
+    source = package.get('source') or {}
+    kind = source.get('type')
+    if kind in ('directory', 'file'):
+        return str((project / source['url']).resolve())
+    if kind == 'git':
+        reference = source.get('resolved_reference') or source.get('reference')
+        return f'git+{source["url"]}@{reference}'
+    if kind == 'url':
+        return source['url']
+    return f'{package["name"]}=={package["version"]}'
+
+
+def check_hash(wheel: Path, hashes: dict[str, str]) -> str | None:
+    """Why wheel doesn't match the hashes of the lock file, None if it does,
+    or if the lock file has no sha256 of it (like a wheel built locally,
+    when only the sdist is locked)."""
+    algorithm, _, expected = hashes.get(wheel.name, '').partition(':')
+    if algorithm != 'sha256':
+        return None
+    with open(wheel, 'rb') as f:
+        actual = hash_stream(f)
+    if actual != expected:
+        return f'{wheel}: sha256 {actual} instead of {expected} in poetry.lock'
+    return None
+
+
+def locked_wheels(
+    lock: dict,
+    packages: list[dict],
+    project: Path,
+    store: DependencyStore,
+    wheelhouse: Path | None = None,
+    offline: bool = False,
+    jobs: int = 1,
+) -> list[Path]:
+    """The wheels of the locked packages, see the module docstring.
+
+    Args:
+        lock: The content of poetry.lock.
+        packages: The packages to find wheels for, see locked_packages.
+        project: The directory of the project, path dependencies are
+            relative to it.
+        store: Where to look for wheels after the wheelhouse, and to keep
+            the wheels that had to be fetched.
+        wheelhouse: A directory of wheels to look into first.
+        offline: Don't use the package index for the wheels found nowhere.
+        jobs: Threads checking hashes (0: one per CPU core).
+
+    Returns:
+        The wheels, in the order of packages."""
+    with timings.span('resolve'):
+        index = index_wheels([*filter(None, [wheelhouse]), store.wheels_dir])
+        wheels: dict[str, Path] = {}
+        missing = []
+        index_urls = set()
+        for package in packages:
+            source = package.get('source') or {}
+            if source.get('type') == 'file' and source['url'].endswith('.whl'):
+                wheels[package['name']] = (project / source['url']).resolve()
+                continue
+            if source.get('type') == 'legacy':
+                index_urls.add(source['url'])
+            if source.get('type') in (None, 'legacy'):
+                key = (canonicalize_name(package['name']), Version(package['version']))
+                if key in index:
+                    wheels[package['name']] = index[key]
+                    continue
+            missing.append(package)
+        if missing:
+            logger.info(f'Fetching {len(missing)} locked packages')
+            fetched = store.fetch(
+                [pip_requirement(package, project) for package in missing],
+                wheelhouse=wheelhouse,
+                offline=offline,
+                index_urls=sorted(index_urls),
+            )
+            by_name = {parse_wheel_filename(wheel.name)[0]: wheel for wheel in fetched}
+            for package in missing:
+                wheel = by_name.get(canonicalize_name(package['name']))
+                if wheel is None:
+                    raise SystemExit(
+                        f'pip built no wheel of {package["name"]} {package["version"]}'
+                    )
+                wheels[package['name']] = wheel
+
+    with timings.span('verify'), ThreadPoolExecutor(resolve_jobs(jobs)) as executor:
+        problems = executor.map(
+            lambda package: check_hash(
+                wheels[package['name']], locked_hashes(lock, package)
+            ),
+            packages,
+        )
+        problems = [problem for problem in problems if problem is not None]
+    if problems:
+        raise SystemExit('\n'.join(problems))
+    return [wheels[package['name']] for package in packages]
+
+
+def project_sources(
+    project: Path, config: dict
+) -> tuple[list[Path], set[str], set[str]]:
+    """Where the packages of the project are.
+
+    Returns:
+        The directories they are in, their top-level names in those
+        directories, and the other top-level names of those directories,
+        to be left out of the archive."""
+    packages = config['packages']
+    if not packages:
+        # like poetry, a package or module named like the project, at the
+        # root of the project or in src
+        module = canonicalize_name(config['name']).replace('-', '_')
+        packages = [
+            {'include': include, 'from': base}
+            for base in ('.', 'src')
+            for include in (module, f'{module}.py')
+            if (project / base / include).exists()
+        ][:1]
+        if not packages:
+            raise SystemExit(
+                f'No package {module} in {project}, list the packages in '
+                '[tool.poetry] packages'
+            )
+    sources: dict[Path, None] = {}
+    names: set[str] = set()
+    for package in packages:
+        formats = package.get('format', ['wheel'])
+        if 'wheel' not in ([formats] if isinstance(formats, str) else formats):
+            continue
+        base = (project / package.get('from', '.')).resolve()
+        matches = list(base.glob(package['include']))
+        if not matches:
+            raise SystemExit(f'{package["include"]} matches nothing in {base}')
+        names.update(match.relative_to(base).parts[0] for match in matches)
+        sources[base] = None
+    left_out = {
+        name for source in sources for name in os.listdir(source) if name not in names
+    }
+    return list(sources), names, left_out
@@ -1,61 +1,264 @@
 #!/usr/bin/env python3
+"""Parsers of the sub commands.
+
+SUB_COMMANDS lists the sub commands without importing anything, a
+create_subparser_* function adds the options of one, importing what they
+need, and its handlers are only imported when it runs. So the command line
+only loads what the sub command it names uses."""
 
 import argparse
 from argparse import ArgumentParser, _SubParsersAction
-from pathlib import Path
-from .config import DEFAULT_PYTHON3_SHEBANG_ZIPAPP
-from .arg_handlers import (
-    main_py2pyz,
-    main_create_shell_script,
-    main_create_archive,
-    main_poetry2pyz,
-    main_pip2pyz,
-)
 
 
-def create_subparser_create_archive(
-    subparsers: _SubParsersAction,
+def add_sub_command(
+    subparsers: _SubParsersAction, name: str, **kwargs
 ) -> ArgumentParser:
-    # --------------------
-    # subparser_create_archive
-    # --------------------
+    """Add the parser of sub command name, with its aliases and help from
+    SUB_COMMANDS and no options."""
+    aliases, help, _ = SUB_COMMANDS[name]
+    kwargs.setdefault('description', help)
+    return subparsers.add_parser(name, aliases=aliases, help=help, **kwargs)
+
 
-    subparser_create_archive = subparsers.add_parser(
-        'create-archive',
-        aliases=['ca', 'zipapp'],
-        help='Create a zipapp archive',
-        description='Create a zipapp archive',
+def size(text: str) -> int:
+    """argparse type of sizes, see inspection.parse_size."""
+    from .inspection import parse_size
+
+    return parse_size(text)
+
+
+def add_max_size_option(parser: ArgumentParser, help: str) -> None:
+    parser.add_argument(
+        '--max-size',
+        type=size,
+        default=None,
+        metavar='SIZE',
+        help=help + " (K, M and G suffixes are powers of 1024), "
+        "to fail builds that bloat.",
     )
 
-    # copied from zipapp.py from cpython source
-    subparser_create_archive.add_argument(
-        '--output',
-        '-o',
+
+def add_timings_option(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        '--timings',
+        nargs='?',
+        const='-',
         default=None,
-        type=Path,
-        help="The name of the output archive. " "Required if SOURCE is an archive.",
+        metavar='FILE',
+        help="Report the time spent in every phase and the files and bytes "
+        "processed, as a table on stderr, or as JSON into FILE.",
     )
-    subparser_create_archive.add_argument(
+
+
+def add_build_options(
+    parser: ArgumentParser,
+    jobs_help: str = "Compress files on N threads (0: one per CPU core).",
+) -> None:
+    """Add the options of every command building an archive: its
+    interpreter, compression, bytecode, size limit and timings."""
+    from .config import DEFAULT_PYTHON3_SHEBANG_ZIPAPP
+
+    parser.add_argument(
         '--python',
         '-p',
-        # default=None,
         default=DEFAULT_PYTHON3_SHEBANG_ZIPAPP,
         help="The name of the Python interpreter to use "
         f"(default: {DEFAULT_PYTHON3_SHEBANG_ZIPAPP!r}).",
     )
-    subparser_create_archive.add_argument(
+    parser.add_argument(
+        '--compress',
+        '-c',
+        action='store_true',
+        help="Compress files with the deflate method. "
+        "Files are stored uncompressed by default.",
+    )
+    parser.add_argument(
+        '--compress-level',
+        type=int,
+        choices=range(10),
+        default=None,
+        metavar='LEVEL',
+        help="Deflate level with --compress, 0 (fastest) to 9 (smallest) "
+        "(default: zlib's default, 6).",
+    )
+    parser.add_argument(
+        '--jobs',
+        '-j',
+        type=int,
+        default=1,
+        metavar='N',
+        help=jobs_help,
+    )
+    parser.add_argument(
+        '--compile',
+        action='store_true',
+        help="Precompile all python sources into the archive, so they are not "
+        "compiled again on every run.",
+    )
+    parser.add_argument(
+        '--compile-python',
+        default=None,
+        metavar='PYTHON',
+        help="The interpreter to compile for, bytecode only works with the "
+        "python version that compiled it (default: the one running zau).",
+    )
+    add_max_size_option(
+        parser,
+        "Exit with status 1 if the archive written is larger than SIZE bytes, "
+        "it is left in place to be inspected",
+    )
+    add_timings_option(parser)
+
+
+def add_archive_options(parser: ArgumentParser) -> None:
+    """Add the options of the commands archiving a source directory
+    (create-archive and py2pyz): entry point, layout, extraction,
+    incremental and sourceless builds."""
+    from pathlib import Path
+    from .layout import HOT_STORE_LIMIT
+
+    parser.add_argument(
         '--main',
         '-m',
         default=None,
         help="The main function of the application "
         "(default: use an existing __main__.py).",
     )
+    parser.add_argument(
+        '--extract-native',
+        action='store_true',
+        help="Extract extension modules and shared libraries into a per-user "
+        "cache on the first run, so they can be loaded.",
+    )
+    parser.add_argument(
+        '--extract',
+        action='append',
+        default=[],
+        metavar='PATTERN',
+        help="Also extract files matching a .gitignore-style pattern, for "
+        "data files that have to be real files. Can be repeated.",
+    )
+    parser.add_argument(
+        '--store-incompressible',
+        action='store_true',
+        help="With --compress, store files that don't get smaller: compressed "
+        "formats like images, zips and shared libraries, and files that fail "
+        "a quick compressibility test.",
+    )
+    parser.add_argument(
+        '--trace',
+        type=Path,
+        default=None,
+        metavar='FILE',
+        help="Put the files of an import trace first, in import order, and "
+        "store the small ones uncompressed. FILE has one archive path per "
+        "line, or is the output of `profile --json`.",
+    )
+    parser.add_argument(
+        '--hot-store-limit',
+        type=int,
+        default=HOT_STORE_LIMIT,
+        metavar='BYTES',
+        help="Files of the trace up to this size are stored uncompressed "
+        f"(default: {HOT_STORE_LIMIT}, 0: compress them all).",
+    )
+    parser.add_argument(
+        '--incremental',
+        '-I',
+        action='store_true',
+        help="Reuse compressed entries of unchanged files from the previous "
+        "output archive, tracked in a manifest next to it.",
+    )
+    parser.add_argument(
+        '--sourceless',
+        action='store_true',
+        help="With --compile, leave out the sources that were compiled. "
+        "Makes the archive smaller, but tracebacks show no source lines.",
+    )
+
+
+def add_skip_unchanged_options(
+    parser: ArgumentParser, deterministic: bool = True
+) -> None:
+    """Add --skip-unchanged, and --deterministic, which it implies, unless
+    the archives of the command are always deterministic."""
+    if deterministic:
+        parser.add_argument(
+            '--deterministic',
+            action='store_true',
+            help="Make the archive depend on file contents only: entries "
+            "sorted by name, timestamps fixed to SOURCE_DATE_EPOCH (or 1980) "
+            "and permissions normalized to 644/755.",
+        )
+    parser.add_argument(
+        '--skip-unchanged',
+        action='store_true',
+        help="Record a hash of the inputs and options of the build in the "
+        "archive and do nothing if it matches the existing output."
+        + (" Implies --deterministic." if deterministic else ""),
+    )
+
+
+def add_store_options(
+    parser: ArgumentParser,
+    store_help: str,
+    wheelhouse_help: str,
+    offline_help: str,
+    refresh_help: str | None = None,
+) -> None:
+    """Add the options of the dependency store, see store.py. Without
+    refresh_help, the command has no --refresh."""
+    from pathlib import Path
+
+    parser.add_argument(
+        '--store',
+        type=Path,
+        default=None,
+        metavar='DIR',
+        help=f"{store_help} (default: ~/.cache/zipapp-utils/store).",
+    )
+    parser.add_argument(
+        '--wheelhouse',
+        type=Path,
+        default=None,
+        metavar='DIR',
+        help=wheelhouse_help,
+    )
+    parser.add_argument('--offline', action='store_true', help=offline_help)
+    if refresh_help is not None:
+        parser.add_argument('--refresh', action='store_true', help=refresh_help)
+
+
+def create_subparser_create_archive(
+    subparsers: _SubParsersAction,
+) -> ArgumentParser:
+    from pathlib import Path
+    from .arg_handlers import build_create_archive, main_create_archive
+
+    # --------------------
+    # subparser_create_archive
+    # --------------------
+
+    subparser_create_archive = add_sub_command(subparsers, 'create-archive')
+
+    # copied from zipapp.py from cpython source
     subparser_create_archive.add_argument(
-        '--compress',
-        '-c',
+        '--output',
+        '-o',
+        default=None,
+        type=Path,
+        help="The name of the output archive. " "Required if SOURCE is an archive.",
+    )
+    add_build_options(subparser_create_archive)
+    add_archive_options(subparser_create_archive)
+    add_skip_unchanged_options(subparser_create_archive)
+    subparser_create_archive.add_argument(
+        '--watch',
+        '-w',
         action='store_true',
-        help="Compress files with the deflate method. "
-        "Files are stored uncompressed by default.",
+        help="Keep running, and rebuild the archive incrementally whenever "
+        "a file it is built from changes (inotify on Linux, polling "
+        "elsewhere). Stop with Ctrl-C.",
     )
     subparser_create_archive.add_argument(
         '--info',
@@ -70,7 +273,8 @@ def create_subparser_create_archive(
 
     subparser_create_archive.add_argument(
         '--include',
-        help="don't exclude files matching PATTERN",
+        help="don't exclude files matching PATTERN (.gitignore syntax, "
+        "applied after all exclude patterns)",
         action='append',
         default=[],
         metavar='PATTERN',
@@ -87,7 +291,8 @@ def create_subparser_create_archive(
 
     subparser_create_archive.add_argument(
         '--exclude',
-        help="exclude files matching PATTERN",
+        help="exclude files matching PATTERN (.gitignore syntax, "
+        "excluded directories are not walked into)",
         action='append',
         default=[],
         metavar='PATTERN',
@@ -112,22 +317,182 @@ def create_subparser_create_archive(
     subparser_create_archive.add_argument(
         '--verbose', '-v', help='increase verbosity', action='store_true'
     )
-    subparser_create_archive.set_defaults(func=main_create_archive)
+
+    subparser_create_archive.set_defaults(
+        func=main_create_archive, build=build_create_archive
+    )
     return subparser_create_archive
 
 
+def create_subparser_profile(
+    subparsers: _SubParsersAction,
+) -> ArgumentParser:
+    from pathlib import Path
+    from .arg_handlers import main_profile
+
+    # --------------------
+    # subparser_profile
+    # --------------------
+
+    subparser_profile = add_sub_command(
+        subparsers,
+        'profile',
+        description='Run a zipapp archive under python -X importtime and '
+        'report the import time of every module with its archive entry. '
+        'Arguments that are not options of profile, and all arguments '
+        'after --, are passed to the application, e.g. -- --help for a '
+        'quick run',
+        usage='%(prog)s [options] PYTHON_APPLICATION_ARCHIVE [-- ARGS ...]',
+    )
+    subparser_profile.add_argument(
+        'pyz',
+        type=Path,
+        help='Path to the pyz file',
+        metavar='PYTHON_APPLICATION_ARCHIVE',
+    )
+    subparser_profile.add_argument(
+        '--python',
+        '-p',
+        default=None,
+        help="The interpreter to run the archive with (default: the one running zau).",
+    )
+    subparser_profile.add_argument(
+        '--trials',
+        '-n',
+        type=int,
+        default=5,
+        help="Number of runs, the reported times are the medians (default: 5).",
+    )
+    subparser_profile.add_argument(
+        '--top',
+        type=int,
+        default=20,
+        help="Number of modules and packages to list (default: 20).",
+    )
+    subparser_profile.add_argument(
+        '--json',
+        action='store_true',
+        help="Print the full report as JSON.",
+    )
+    # what is not an option of profile goes to the application, see
+    # cli.get_args
+    subparser_profile.set_defaults(func=main_profile, app_args=[])
+    return subparser_profile
+
+
+def create_subparser_inspect(
+    subparsers: _SubParsersAction,
+) -> ArgumentParser:
+    from pathlib import Path
+    from .arg_handlers import main_inspect
+
+    # --------------------
+    # subparser_inspect
+    # --------------------
+
+    subparser_inspect = add_sub_command(
+        subparsers,
+        'inspect',
+        description='Report the entries of a zipapp archive from its central '
+        'directory, without decompressing anything: sizes per top-level '
+        'package and per compression method, the largest entries and '
+        'entries with the same content',
+    )
+    subparser_inspect.add_argument(
+        'pyz',
+        type=Path,
+        help='Path to the pyz file',
+        metavar='PYTHON_APPLICATION_ARCHIVE',
+    )
+    subparser_inspect.add_argument(
+        '--top',
+        type=int,
+        default=20,
+        help="Number of packages, entries and duplicates to list (default: 20).",
+    )
+    subparser_inspect.add_argument(
+        '--json',
+        action='store_true',
+        help="Print the full report as JSON.",
+    )
+    add_max_size_option(
+        subparser_inspect,
+        "Exit with status 1 if the archive is larger than SIZE bytes",
+    )
+    subparser_inspect.set_defaults(func=main_inspect)
+    return subparser_inspect
+
+
+def create_subparser_retarget(
+    subparsers: _SubParsersAction,
+) -> ArgumentParser:
+    from pathlib import Path
+    from .arg_handlers import main_retarget
+
+    # --------------------
+    # subparser_retarget
+    # --------------------
+
+    subparser_retarget = add_sub_command(
+        subparsers,
+        'retarget',
+        description='Change the interpreter of existing zipapp archives. A '
+        'shebang line that is not longer than the old one is padded and '
+        'written over it, in place, longer ones have the archive written '
+        'again with copy_file_range.',
+    )
+    subparser_retarget.add_argument(
+        'pyz',
+        nargs='+',
+        type=Path,
+        help='Path to the pyz files',
+        metavar='PYTHON_APPLICATION_ARCHIVE',
+    )
+    subparser_retarget.add_argument(
+        '--python',
+        '-p',
+        required=True,
+        help="The name of the Python interpreter to use, '' to remove the "
+        "shebang line.",
+    )
+    subparser_retarget.add_argument(
+        '--output-dir',
+        '-o',
+        type=Path,
+        default=None,
+        metavar='DIR',
+        help="Write the retargeted archives into DIR instead of changing "
+        "them in place.",
+    )
+    subparser_retarget.add_argument(
+        '--no-pad',
+        dest='pad',
+        action='store_false',
+        help="Don't pad shorter shebang lines with spaces, write the archive "
+        "again instead, the same as zipapp would build it.",
+    )
+    subparser_retarget.add_argument(
+        '--jobs',
+        '-j',
+        type=int,
+        default=1,
+        metavar='N',
+        help="Retarget N archives at once (0: one per CPU core).",
+    )
+    subparser_retarget.set_defaults(func=main_retarget)
+    return subparser_retarget
+
+
 def create_subparser_py2pyz(
     subparsers: _SubParsersAction,
 ) -> ArgumentParser:
+    from pathlib import Path
+    from .arg_handlers import build_py2pyz, main_py2pyz
+
     # --------------------
     # subparser_py2pyz
     # --------------------
-    subparser_py2pyz = subparsers.add_parser(
-        'py2pyz',
-        aliases=['p'],
-        help='Create archive from a python script',
-        description='Create archive from a python script',
-    )
+    subparser_py2pyz = add_sub_command(subparsers, 'py2pyz')
 
     subparser_py2pyz.add_argument(
         'source', help='Python script file', metavar='SCRIPT', type=Path
@@ -138,7 +503,8 @@ def create_subparser_py2pyz(
     subparser_py2pyz.add_argument(
         '-r',
         '--requirement',
-        help='Install dependencies from the given requirements file. Defaults to "requirements.txt"',
+        help='Install dependencies from the given requirements file. '
+        'Defaults to "requirements.txt"',
         type=Path,
         # default=Path('requirements.txt'),
         default=argparse.SUPPRESS,
@@ -152,77 +518,121 @@ def create_subparser_py2pyz(
         # default=argparse.SUPPRESS,
         help="The name of the output archive. " "Required if SOURCE is an archive.",
     )
+    add_build_options(subparser_py2pyz)
+    add_archive_options(subparser_py2pyz)
+    add_skip_unchanged_options(subparser_py2pyz)
+    add_store_options(
+        subparser_py2pyz,
+        "Directory of the dependency store, where resolved dependencies " "are kept",
+        "Directory of wheels to resolve dependencies from.",
+        "Don't use the package index, resolve dependencies from the "
+        "wheelhouse and the store only.",
+        "Resolve dependencies again instead of reusing the previous "
+        "resolution of the same requirements, which unpinned requirements "
+        "keep until then.",
+    )
 
     subparser_py2pyz.add_argument(
-        '--python',
-        '-p',
-        # default=None,
-        default=DEFAULT_PYTHON3_SHEBANG_ZIPAPP,
-        help="The name of the Python interpreter to use " "(default: no shebang line).",
+        '--tree-shake',
+        action='store_true',
+        help="Only bundle the modules the script imports, directly or not, "
+        "found by parsing the sources.",
     )
     subparser_py2pyz.add_argument(
-        '--main',
-        '-m',
-        default=None,
-        help="The main function of the application "
-        "(default: use an existing __main__.py).",
+        '--keep-module',
+        action='append',
+        default=[],
+        metavar='MODULE',
+        help="With --tree-shake, keep a module that is imported dynamically, "
+        "with all its submodules if it is a package. Can be repeated.",
     )
     subparser_py2pyz.add_argument(
-        '--compress',
-        '-c',
-        action='store_true',
-        help="Compress files with the deflate method. "
-        "Files are stored uncompressed by default.",
+        '--keep-data',
+        action='append',
+        default=[],
+        metavar='PATTERN',
+        help="With --tree-shake, keep data files matching a .gitignore-style "
+        "pattern even if their package is not imported. Can be repeated.",
     )
-    subparser_py2pyz.set_defaults(func=main_py2pyz)
+
+    subparser_py2pyz.set_defaults(func=main_py2pyz, build=build_py2pyz)
     return subparser_py2pyz
 
 
 def create_subparser_create_shell_script(
     subparsers: _SubParsersAction,
 ) -> ArgumentParser:
+    from pathlib import Path
+    from .arg_handlers import build_create_shell_script, main_create_shell_script
+    from .payload import CODECS, ENCODINGS, PAYLOAD_STYLES, SHELL_SCRIPT_FORMATS
 
     # --------------------
     # subparser_create_shell_script
     # --------------------
 
-    subparser_create_shell_script = subparsers.add_parser(
-        'create-shell-script',
-        aliases=['sh'],
-        help='Create an ASCII shellscript that runs a zipapp archive',
-        description='Create an ASCII shellscript that runs a zipapp archive',
-    )
+    subparser_create_shell_script = add_sub_command(subparsers, 'create-shell-script')
 
     subparser_create_shell_script.add_argument(
         'pyz',
-        help='Path to the pyz file',
+        help='Path to the pyz file, - to read it from stdin',
         type=Path,
         metavar='PYTHON_APPLICATION_ARCHIVE',
     )
     subparser_create_shell_script.add_argument(
         '-o',
         '--output',
-        help='Path to the output file',
+        help='Path to the output file '
+        '(default: the pyz file with .sh suffix, or stdout when reading stdin)',
         type=Path,
     )
 
-    subparser_create_shell_script.set_defaults(func=main_create_shell_script)
+    subparser_create_shell_script.add_argument(
+        '--format',
+        choices=SHELL_SCRIPT_FORMATS,
+        default='base64',
+        help='base64: embed the archive as text and extract it once on the '
+        'first run. polyglot: append the raw archive to a stub that runs '
+        'itself with python, nothing is extracted (the script is binary)',
+    )
+    subparser_create_shell_script.add_argument(
+        '--codec',
+        choices=CODECS,
+        default='none',
+        help='Compress the archive before encoding it',
+    )
+    subparser_create_shell_script.add_argument(
+        '--encoding',
+        choices=ENCODINGS,
+        default='base64',
+        help='Encoding of the payload, base85 is 7%% smaller than base64 '
+        'and is decoded with python3',
+    )
+    subparser_create_shell_script.add_argument(
+        '--payload',
+        choices=PAYLOAD_STYLES,
+        default='variable',
+        help='Embed the payload in a shell variable or in a heredoc '
+        '(wrapped lines, no line length limits)',
+    )
+
+    add_timings_option(subparser_create_shell_script)
+
+    subparser_create_shell_script.set_defaults(
+        func=main_create_shell_script, build=build_create_shell_script
+    )
     return subparser_create_shell_script
 
 
 def create_subparser_poetry2pyz(
     subparsers: _SubParsersAction,
 ) -> ArgumentParser:
+    from pathlib import Path
+    from .arg_handlers import main_poetry2pyz
 
     # --------------------
     # subparser_poetry2pyz
     # --------------------
-    subparser_poetry2pyz = subparsers.add_parser(
-        'poetry2pyz',
-        aliases=['poe'],
-        help='Create a zipapp archive from a poetry project',
-        description='Create a zipapp archive from a poetry project',
-    )
+    subparser_poetry2pyz = add_sub_command(subparsers, 'poetry2pyz')
 
     subparser_poetry2pyz.add_argument(
         'poetry_project',
@@ -244,6 +654,30 @@ def create_subparser_poetry2pyz(
         help='Entry point name (name of the command)',
         type=str,
     )
+    subparser_poetry2pyz.add_argument(
+        '--extras',
+        '-E',
+        action='append',
+        default=[],
+        metavar='EXTRA',
+        help="Also bundle the optional dependencies of an extra of the "
+        "project. Can be repeated.",
+    )
+    add_build_options(
+        subparser_poetry2pyz,
+        jobs_help="Compress files and check the hashes of wheels on N threads "
+        "(0: one per CPU core).",
+    )
+    # poetry2pyz archives are always deterministic
+    add_skip_unchanged_options(subparser_poetry2pyz, deterministic=False)
+    add_store_options(
+        subparser_poetry2pyz,
+        "Directory of the dependency store, where wheels are looked up "
+        "after the wheelhouse and fetched into",
+        "Directory of wheels to look up the locked versions in first.",
+        "Don't use the package index for locked versions that are "
+        "neither in the wheelhouse nor in the store.",
+    )
 
     subparser_poetry2pyz.set_defaults(func=main_poetry2pyz)
     return subparser_poetry2pyz
@@ -252,21 +686,19 @@ def create_subparser_poetry2pyz(
 def create_subparser_pip2pyz(
     subparsers: _SubParsersAction,
 ) -> ArgumentParser:
+    from pathlib import Path
+    from .arg_handlers import main_pip2pyz
 
     # --------------------
     # subparser_pip2pyz
     # --------------------
-    subparser_pip2pyz = subparsers.add_parser(
-        'pip2pyz',
-        aliases=['pip'],
-        help='Create a zipapp archive from a pip package',
-        description='Create a zipapp archive from a pip package',
-    )
+    subparser_pip2pyz = add_sub_command(subparsers, 'pip2pyz')
 
     subparser_pip2pyz.add_argument(
         'pip_package',
         type=str,
-        help='Name of the pip package',
+        help='Name of the pip package, with a version or extras like a pip '
+        'install argument, or its path or URL',
         metavar='PIP_PACKAGE',
     )
 
@@ -280,18 +712,116 @@ def create_subparser_pip2pyz(
     subparser_pip2pyz.add_argument(
         '-b',
         '--bin',
-        help='Entry point name (name of the command)',
+        help='Console script to run (default: the one named like the package)',
         type=str,
     )
+    add_build_options(subparser_pip2pyz)
+    add_skip_unchanged_options(subparser_pip2pyz)
+    add_store_options(
+        subparser_pip2pyz,
+        "Directory of the dependency store, where the package is "
+        "resolved to wheels and its __main__.py staged",
+        "Directory of wheels to resolve the package from.",
+        "Don't use the package index, resolve the package from the "
+        "wheelhouse and the store only.",
+        "Resolve the package again instead of reusing its previous "
+        "resolution, e.g. to pick up a new release, which is not picked up "
+        "until then.",
+    )
 
     subparser_pip2pyz.set_defaults(func=main_pip2pyz)
     return subparser_pip2pyz
 
 
-create_parser_functions = [
-    create_subparser_create_archive,
-    create_subparser_py2pyz,
-    create_subparser_create_shell_script,
-    create_subparser_poetry2pyz,
-    create_subparser_pip2pyz,
-]
+def create_subparser_batch(
+    subparsers: _SubParsersAction,
+) -> ArgumentParser:
+    from pathlib import Path
+    from .arg_handlers import main_batch
+
+    # --------------------
+    # subparser_batch
+    # --------------------
+    subparser_batch = add_sub_command(
+        subparsers,
+        'batch',
+        description='Run the create-archive, py2pyz and create-shell-script '
+        'builds listed in a TOML or JSON manifest on a process pool, and '
+        'report the time and result of each. Builds take the options of '
+        'their sub command, relative paths are relative to the manifest.',
+    )
+
+    subparser_batch.add_argument(
+        'manifest',
+        help='TOML or JSON file listing the builds',
+        metavar='MANIFEST',
+        type=Path,
+    )
+    subparser_batch.add_argument(
+        '--jobs',
+        '-j',
+        type=int,
+        default=0,
+        metavar='N',
+        help="Run N builds at once (0: one per CPU core).",
+    )
+    subparser_batch.add_argument(
+        '--json',
+        action='store_true',
+        help='Report the results as JSON',
+    )
+
+    subparser_batch.set_defaults(func=main_batch)
+    return subparser_batch
+
+
+# name -> aliases, help and the function adding the parser with all options
+SUB_COMMANDS = {
+    'create-archive': (
+        ['ca', 'zipapp'],
+        'Create a zipapp archive',
+        create_subparser_create_archive,
+    ),
+    'profile': (
+        [],
+        'Show where the startup time of a zipapp archive goes',
+        create_subparser_profile,
+    ),
+    'inspect': (
+        [],
+        'Show what a zipapp archive is made of',
+        create_subparser_inspect,
+    ),
+    'retarget': (
+        [],
+        'Change the interpreter of zipapp archives',
+        create_subparser_retarget,
+    ),
+    'py2pyz': (
+        ['p'],
+        'Create archive from a python script',
+        create_subparser_py2pyz,
+    ),
+    'create-shell-script': (
+        ['sh'],
+        'Create a shellscript that runs a zipapp archive',
+        create_subparser_create_shell_script,
+    ),
+    'poetry2pyz': (
+        ['poe'],
+        'Create a zipapp archive from a poetry project',
+        create_subparser_poetry2pyz,
+    ),
+    'pip2pyz': (
+        ['pip'],
+        'Create a zipapp archive from a pip package',
+        create_subparser_pip2pyz,
+    ),
+    'batch': (
+        [],
+        'Run the builds of a manifest in parallel',
+        create_subparser_batch,
+    ),
+}
+
+create_parser_functions = [create for _, _, create in SUB_COMMANDS.values()]
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Payload codecs for shell scripts that embed an archive.
+
+The archive is optionally compressed (gzip or xz), then encoded as base64 or
+base85, chunk by chunk, so memory use does not depend on the payload size.
+decoder_command returns the shell pipeline that reverses it."""
+
+import lzma
+import zlib
+from base64 import b64encode, b85encode
+from collections.abc import Iterator
+from typing import BinaryIO
+
+SHELL_SCRIPT_FORMATS = ['base64', 'polyglot']
+CODECS = ['none', 'gzip', 'xz']
+ENCODINGS = ['base64', 'base85']
+PAYLOAD_STYLES = ['variable', 'heredoc']
+
+# heredoc payloads are wrapped, base64 like MIME, base85 at 80 columns
+LINE_LENGTHS = {'base64': 76, 'base85': 80}
+
+COPY_BUFSIZE = 1024 * 1024
+
+# neither base64 nor base85 output contains a '.'
+HEREDOC_DELIMITER = 'PYZ.PAYLOAD'
+
+# base85 has no common command line decoder, python3 is there anyway.
+# Lines are encoded independently, so they can be decoded one by one.
+_B85_DECODER = (
+    "python3 -c 'import base64, sys\n"
+    "for line in sys.stdin.buffer:\n"
+    "    line = line.strip()\n"
+    "    if line:\n"
+    "        sys.stdout.buffer.write(base64.b85decode(line))\n'"
+)
+
+
+def iter_compressed(src: BinaryIO, codec: str = 'none') -> Iterator[bytes]:
+    """Read src in chunks and compress it with codec."""
+    if codec == 'none':
+        compressor = None
+    elif codec == 'gzip':
+        # wbits=31 writes a gzip header with mtime 0, so output is reproducible
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    elif codec == 'xz':
+        compressor = lzma.LZMACompressor(preset=6)
+    else:
+        raise ValueError(f'Unknown codec: {codec}')
+    while chunk := src.read(COPY_BUFSIZE):
+        yield compressor.compress(chunk) if compressor is not None else chunk
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def write_payload(
+    src: BinaryIO,
+    dst: BinaryIO,
+    codec: str = 'none',
+    encoding: str = 'base64',
+    wrap: bool = False,
+) -> None:
+    """Compress and encode src into dst.
+
+    Args:
+        src: Binary stream of the archive, can be a pipe.
+        dst: Binary stream the payload is written to.
+        codec: One of CODECS.
+        encoding: One of ENCODINGS.
+        wrap: Break the payload into lines of LINE_LENGTHS[encoding]."""
+    if encoding == 'base64':
+        encode, group, chars = b64encode, 3, 4
+    elif encoding == 'base85':
+        encode, group, chars = b85encode, 4, 5
+    else:
+        raise ValueError(f'Unknown encoding: {encoding}')
+    # encode whole groups (whole lines when wrapping) so the pieces
+    # concatenate to one valid payload
+    block = LINE_LENGTHS[encoding] // chars * group if wrap else group
+    carry = b''
+    for chunk in iter_compressed(src, codec):
+        chunk = carry + chunk
+        cut = len(chunk) - len(chunk) % block
+        carry = chunk[cut:]
+        if wrap:
+            for start in range(0, cut, block):
+                dst.write(encode(chunk[start : start + block]) + b'\n')
+        else:
+            dst.write(encode(chunk[:cut]))
+    if carry:
+        dst.write(encode(carry) + (b'\n' if wrap else b''))
+
+
+def decoder_command(codec: str = 'none', encoding: str = 'base64') -> str:
+    """The shell pipeline turning the payload on stdin back into the archive."""
+    commands = ['base64 -d' if encoding == 'base64' else _B85_DECODER]
+    if codec == 'gzip':
+        commands.append('gzip -dc')
+    elif codec == 'xz':
+        commands.append('xz -dc')
+    return ' | '.join(commands)
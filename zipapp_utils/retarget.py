@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""Change the interpreter (shebang) of existing archives without copying them.
+
+A zipapp archive is a shebang line followed by a zip archive, which readers
+locate from its end, so only the shebang line has to change:
+
+- a new line that is not longer than the old one is padded with spaces to
+  its length (the kernel ignores trailing whitespace in shebang lines) and
+  written over it, in place, whatever the size of the archive
+- otherwise the archive is written again, next to the old one, which it
+  replaces: the new line, then the zip, copied with copy_file_range, so the
+  kernel (or an NFS server) copies it without going through this process,
+  sharing the blocks on filesystems with reflinks where they are aligned
+
+When the zip moves, its offsets (in the central directory and the end
+records) are rewritten to count from the start of the file, shebang
+included, the way zipfile, and so zipapp, writes them."""
+
+import mmap
+import os
+import shutil
+import struct
+import sys
+import zipfile
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import mkstemp
+
+from . import logger
+from .archive import COPY_BUFSIZE, resolve_jobs
+from .inspection import (
+    CENTRAL_HEADER,
+    CENTRAL_HEADER_SIGNATURE,
+    EOCD,
+    EOCD_SIGNATURE,
+    ZIP64_EOCD,
+    ZIP64_EXTRA_ID,
+    ZIP64_LIMIT,
+    ZIP64_LOCATOR_SIZE,
+    find_central_directory,
+    find_end_records,
+)
+
+# offsets of the fields holding offsets, in the end records and central
+# directory headers
+EOCD_OFFSET_FIELD = 16
+ZIP64_EOCD_OFFSET_FIELD = 48
+ZIP64_LOCATOR_OFFSET_FIELD = 8
+HEADER_OFFSET_FIELD = 42
+# what an archive starts with: a local file header, or the end of central
+# directory record if it is empty
+ZIP_START_SIGNATURES = (b'PK\x03\x04', EOCD_SIGNATURE)
+
+
+def shebang(interpreter: str | None) -> bytes:
+    """The shebang line of interpreter, like zipapp writes it, nothing if
+    interpreter is None or empty."""
+    if not interpreter:
+        return b''
+    return b'#!' + interpreter.encode(sys.getfilesystemencoding()) + b'\n'
+
+
+def copy_range(
+    src: int, dst: int, src_offset: int, dst_offset: int, count: int
+) -> None:
+    """Copy count bytes between files, in the kernel where it can."""
+    while count:
+        try:
+            copied = os.copy_file_range(src, dst, count, src_offset, dst_offset)
+        except (AttributeError, OSError):
+            # not Linux, an old kernel, or files on different filesystems
+            break
+        if not copied:
+            raise zipfile.BadZipFile('archive truncated while copying')
+        src_offset += copied
+        dst_offset += copied
+        count -= copied
+    while count:
+        chunk = os.pread(src, min(COPY_BUFSIZE, count), src_offset)
+        if not chunk:
+            raise zipfile.BadZipFile('archive truncated while copying')
+        os.pwrite(dst, chunk, dst_offset)
+        src_offset += len(chunk)
+        dst_offset += len(chunk)
+        count -= len(chunk)
+
+
+def _shift(data: mmap.mmap, fmt: str, position: int, delta: int) -> None:
+    value = struct.unpack_from(fmt, data, position)[0] + delta
+    if fmt == '<I' and value >= ZIP64_LIMIT:
+        raise zipfile.BadZipFile('offsets overflow, the archive would need ZIP64')
+    struct.pack_into(fmt, data, position, value)
+
+
+def shift_offsets(fd: int, delta: int) -> None:
+    """Add delta to all offsets of the archive in fd: the offsets of its
+    entries, of its central directory and of its ZIP64 end record."""
+    with mmap.mmap(fd, 0) as data:
+        position, record = find_end_records(data)
+        fields = EOCD.unpack_from(data, position)
+        count, size, offset = fields[4], fields[5], fields[6]
+        if record is not None:
+            fields = ZIP64_EOCD.unpack_from(data, record)
+            count, size = fields[7], fields[8]
+            _shift(data, '<Q', record + ZIP64_EOCD_OFFSET_FIELD, delta)
+            locator = position - ZIP64_LOCATOR_SIZE
+            _shift(data, '<Q', locator + ZIP64_LOCATOR_OFFSET_FIELD, delta)
+        if offset != ZIP64_LIMIT:
+            _shift(data, '<I', position + EOCD_OFFSET_FIELD, delta)
+
+        header = (position if record is None else record) - size
+        for _ in range(count):
+            fields = CENTRAL_HEADER.unpack_from(data, header)
+            if fields[0] != CENTRAL_HEADER_SIGNATURE:
+                raise zipfile.BadZipFile(f'broken central directory at offset {header}')
+            compress_size, file_size = fields[8], fields[9]
+            name_length, extra_length, comment_length = fields[10:13]
+            extra = header + CENTRAL_HEADER.size + name_length
+            if fields[16] == ZIP64_LIMIT:
+                _shift(
+                    data,
+                    '<Q',
+                    zip64_offset_position(
+                        data, extra, extra_length, file_size, compress_size
+                    ),
+                    delta,
+                )
+            else:
+                _shift(data, '<I', header + HEADER_OFFSET_FIELD, delta)
+            header = extra + extra_length + comment_length
+
+
+def zip64_offset_position(
+    data: mmap.mmap, extra: int, extra_length: int, file_size: int, compress_size: int
+) -> int:
+    """Where the ZIP64 extra field of a central directory header, at extra,
+    keeps the offset of the entry."""
+    position = extra
+    while position + 4 <= extra + extra_length:
+        field_id, length = struct.unpack_from('<HH', data, position)
+        if field_id == ZIP64_EXTRA_ID:
+            # the sizes come first, if they overflowed too
+            skipped = (file_size == ZIP64_LIMIT) + (compress_size == ZIP64_LIMIT)
+            return position + 4 + 8 * skipped
+        position += 4 + length
+    raise zipfile.BadZipFile('ZIP64 extra field missing')
+
+
+def retarget(
+    pyz: Path, interpreter: str | None, output: Path | None = None, pad: bool = True
+) -> str:
+    """Give the archive pyz the shebang line of interpreter, see the module
+    docstring.
+
+    Args:
+        pyz: The archive.
+        interpreter: The new interpreter, None or '' to remove the shebang.
+        output: Where to write the retargeted archive, pyz is changed in
+            place by default.
+        pad: Pad a shorter shebang line with spaces so it is written over
+            the old one. Without it, the archive is written again unless
+            the lines have the same length, and a zipapp archive ends up
+            the same as if it had been built with interpreter.
+
+    Returns:
+        What was done: 'unchanged', 'in place', 'copied' (to output, with
+        the same offsets) or 'rewritten' (with the zip moved)."""
+    new = shebang(interpreter)
+    with open(pyz, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            raise zipfile.BadZipFile('not a zip archive: empty file')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            old = data.readline() if data[:2] == b'#!' else b''
+            origin = find_central_directory(data)[3]
+            if data[len(old) : len(old) + 4] not in ZIP_START_SIGNATURES:
+                raise zipfile.BadZipFile('more than a shebang line before the archive')
+    if pad and new and len(new) < len(old):
+        new = new[:-1] + b' ' * (len(old) - len(new)) + b'\n'
+    delta = len(new) - len(old)
+    if output is not None and output.exists() and output.samefile(pyz):
+        output = None
+
+    if output is None and new == old:
+        return 'unchanged'
+    if output is None and not delta:
+        with open(pyz, 'r+b') as f:
+            os.pwrite(f.fileno(), new, 0)
+        return 'in place'
+
+    target = output or pyz
+    fd, tmp = mkstemp(dir=target.parent, prefix=f'.{target.name}.', suffix='.tmp')
+    try:
+        with open(pyz, 'rb') as src, open(fd, 'r+b') as dst:
+            if delta:
+                os.pwrite(dst.fileno(), new, 0)
+                copy_range(
+                    src.fileno(), dst.fileno(), len(old), len(new), size - len(old)
+                )
+                if origin + delta:
+                    shift_offsets(dst.fileno(), origin + delta)
+            else:
+                # the same offsets in both files, so whole blocks can be shared
+                copy_range(src.fileno(), dst.fileno(), 0, 0, size)
+                os.pwrite(dst.fileno(), new, 0)
+        shutil.copymode(pyz, tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return 'rewritten' if delta else 'copied'
+
+
+def retarget_all(
+    pyzs: Sequence[Path],
+    interpreter: str | None,
+    output_dir: Path | None = None,
+    pad: bool = True,
+    jobs: int = 1,
+) -> list[dict]:
+    """Retarget many archives on jobs threads (0: one per CPU core), into
+    output_dir if given, or in place.
+
+    Returns:
+        For every archive, its output and what was done, or the error that
+        stopped it."""
+
+    def run(pyz: Path) -> dict:
+        output = output_dir / pyz.name if output_dir is not None else pyz
+        try:
+            done = retarget(pyz, interpreter, output=output, pad=pad)
+        except (OSError, zipfile.BadZipFile) as e:
+            return {'pyz': str(pyz), 'output': str(output), 'error': str(e)}
+        logger.info(f'{pyz}: {done}')
+        return {'pyz': str(pyz), 'output': str(output), 'done': done, 'error': None}
+
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(resolve_jobs(jobs)) as executor:
+        return list(executor.map(run, pyzs))
+
+
+def format_results(results: list[dict]) -> str:
+    lines = []
+    for result in results:
+        if result['error'] is None:
+            outcome = result['done']
+            if result['output'] != result['pyz']:
+                outcome += f' -> {result["output"]}'
+        else:
+            outcome = f'FAILED: {result["error"]}'
+        lines.append(f'{result["pyz"]}: {outcome}')
+    return '\n'.join(lines)
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""Store of dependency wheels.
+
+Layout of the store directory:
+
+    wheels/                  every wheel pip built or downloaded, by file
+                             name, used as --find-links on later
+                             resolutions; a wheel rebuilt under the same
+                             name replaces the previous one
+    resolutions/<key>.json   the wheels a set of requirements resolved to,
+                             with their sha256 and size
+    resolutions/<key>.lock   held while the requirements are resolved, so
+                             concurrent builds run pip for them only once
+    staging/<sha256>/        generated files archived next to the wheels,
+                             like the __main__.py of pip2pyz, shared by the
+                             builds that generate the same files, removed
+                             when unused for STAGING_MAX_AGE
+
+pip only runs when a set of requirements has not been resolved before
+from the same wheelhouse content (or when asked to refresh), and then only
+to build or download wheels. So unpinned requirements are cached: they
+resolve to the same versions until --refresh, whatever the index has
+released since. Pinned requirements, like those of a lock file, are
+fetched without resolving anything (see DependencyStore.fetch). Entries of
+the wheels are copied into archives as they are (see archive.copy_wheel),
+so nothing is installed or unpacked, least of all into the source
+directory of the user."""
+
+import json
+import os
+import shutil
+import sys
+import sysconfig
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from hashlib import sha256
+from pathlib import Path
+from tempfile import TemporaryDirectory, mkdtemp, mkstemp
+
+from . import logger, timings
+from .utils import hash_stream
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+STORE_VERSION = 2
+# staged directories no build used for that long are removed
+STAGING_MAX_AGE = 30 * 24 * 3600
+
+
+def wheel_name_version(wheel: Path) -> tuple[str, str]:
+    """Normalized project name and version from a wheel file name."""
+    name, version = wheel.name.split('-')[:2]
+    return name.lower().replace('_', '-').replace('.', '-'), version
+
+
+def console_scripts(wheel: Path) -> dict[str, str]:
+    """The console scripts a wheel declares, name -> module:function."""
+    import zipfile
+    from configparser import ConfigParser
+
+    with zipfile.ZipFile(wheel) as zf:
+        names = [
+            name
+            for name in zf.namelist()
+            if name.count('/') == 1 and name.endswith('.dist-info/entry_points.txt')
+        ]
+        if not names:
+            return {}
+        entry_points = zf.read(names[0]).decode()
+    # names of scripts are case sensitive
+    parser = ConfigParser(delimiters=('=',), interpolation=None)
+    parser.optionxform = str  # type: ignore
+    parser.read_string(entry_points)
+    if not parser.has_section('console_scripts'):
+        return {}
+    # drop extras, like module:function [extra]
+    return {name: value.split()[0] for name, value in parser['console_scripts'].items()}
+
+
+def wheelhouse_listing(wheelhouse: Path) -> list[str]:
+    """Name, size and mtime of every file of wheelhouse, so a resolution
+    from it is redone when wheels are added, removed or replaced."""
+    listing = []
+    try:
+        with os.scandir(wheelhouse) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    st = entry.stat()
+                    listing.append(f'{entry.name}:{st.st_size}:{st.st_mtime_ns}')
+    except FileNotFoundError:  # pip ignores it too
+        pass
+    return sorted(listing)
+
+
+def resolution_key(
+    requirements: Iterable[str],
+    requirement_files: Iterable[Path],
+    wheelhouse: Path | None = None,
+) -> str:
+    """Key of a resolution: requirements, the interpreter wheels are for,
+    and the wheelhouse they are resolved from, with its content."""
+    digest = sha256()
+    for part in [
+        f'v{STORE_VERSION}',
+        sys.implementation.cache_tag or '',
+        sysconfig.get_platform(),
+        *sorted(requirements),
+    ]:
+        digest.update(part.encode() + b'\0')
+    for requirement_file in requirement_files:
+        digest.update(requirement_file.read_bytes() + b'\0')
+    if wheelhouse is not None:
+        for part in [str(wheelhouse.resolve()), *wheelhouse_listing(wheelhouse)]:
+            digest.update(part.encode() + b'\0')
+    return digest.hexdigest()
+
+
+class DependencyStore:
+    """A store directory, see the module docstring for its layout."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.wheels_dir = root / 'wheels'
+        self.resolutions_dir = root / 'resolutions'
+        self.staging_dir = root / 'staging'
+        for directory in (self.wheels_dir, self.resolutions_dir, self.staging_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+    def add_wheel(self, wheel: Path) -> tuple[Path, str]:
+        """Copy wheel into the store unless it is already there.
+
+        Returns:
+            The path of the wheel in the store and its sha256."""
+        with open(wheel, 'rb') as f:
+            wheel_sha256 = hash_stream(f)
+        stored_wheel = self.wheels_dir / wheel.name
+        if stored_wheel.exists():
+            with open(stored_wheel, 'rb') as f:
+                if hash_stream(f) == wheel_sha256:
+                    return stored_wheel, wheel_sha256
+        logger.info(f'Adding {wheel.name} to {str(self.wheels_dir)}')
+        # copy next to the final location and rename, so concurrent builds
+        # never see a partially written wheel
+        fd, tmp_name = mkstemp(dir=self.wheels_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as dst, open(wheel, 'rb') as src:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_name, stored_wheel)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        return stored_wheel, wheel_sha256
+
+    def _has_wheel(self, name: str, wheel_sha256: str, size: int) -> bool:
+        """Whether the store holds the wheel name with that content."""
+        wheel = self.wheels_dir / name
+        try:
+            if wheel.stat().st_size != size:
+                return False
+            with open(wheel, 'rb') as f:
+                return hash_stream(f) == wheel_sha256
+        except FileNotFoundError:
+            return False
+
+    def resolve(
+        self,
+        requirements: list[str],
+        requirement_files: list[Path] = [],
+        wheelhouse: Path | None = None,
+        offline: bool = False,
+        refresh: bool = False,
+    ) -> list[Path]:
+        """Resolve requirements to wheels in the store, running pip on a miss.
+
+        Args:
+            requirements: Requirement specifiers, like pip install arguments.
+            requirement_files: requirements.txt files.
+            wheelhouse: A directory of wheels to resolve from.
+            offline: Don't use the package index, only the wheelhouse and the
+                wheels already in the store.
+            refresh: Resolve again even if these requirements were resolved
+                before. Unpinned requirements keep resolving to the versions
+                they resolved to the first time until then, new releases on
+                the index are not picked up.
+
+        Returns:
+            The wheels of all resolved distributions."""
+        if not requirements and not requirement_files:
+            return []
+        key = resolution_key(requirements, requirement_files, wheelhouse)
+        # builds running at the same time resolve the same requirements once
+        with timings.span('resolve'), self._locked(key):
+            return self._resolve(
+                key, requirements, requirement_files, wheelhouse, offline, refresh
+            )
+
+    @contextmanager
+    def _locked(self, key: str) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        with open(self.resolutions_dir / f'{key}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _resolve(
+        self,
+        key: str,
+        requirements: list[str],
+        requirement_files: list[Path],
+        wheelhouse: Path | None,
+        offline: bool,
+        refresh: bool,
+    ) -> list[Path]:
+        resolution_path = self.resolutions_dir / f'{key}.json'
+        if not refresh and resolution_path.is_file():
+            resolution = json.loads(resolution_path.read_text())
+            # a wheel rebuilt under the same name replaced the resolved one
+            if all(
+                self._has_wheel(name, wheel_sha256, size)
+                for name, wheel_sha256, size in resolution['wheels']
+            ):
+                logger.info(f'Using cached resolution {key}')
+                return [self.wheels_dir / name for name, _, _ in resolution['wheels']]
+
+        pip_args = []
+        for requirement_file in requirement_files:
+            pip_args += ['-r', str(requirement_file)]
+        with TemporaryDirectory() as tmp:
+            if self._pip_wheel(tmp, pip_args + requirements, wheelhouse, offline):
+                raise SystemExit(f'pip failed to resolve {requirements}')
+            stored = [
+                self.add_wheel(wheel) for wheel in sorted(Path(tmp).glob('*.whl'))
+            ]
+
+        resolution = {
+            'wheels': [
+                [wheel.name, wheel_sha256, wheel.stat().st_size]
+                for wheel, wheel_sha256 in stored
+            ]
+        }
+        # written last and atomically, it marks the resolution as complete
+        fd, tmp_name = mkstemp(dir=self.resolutions_dir, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps(resolution))
+        os.replace(tmp_name, resolution_path)
+        return [wheel for wheel, _ in stored]
+
+    def stage(self, files: dict[str, str]) -> Path:
+        """A directory of the store holding files (relative path -> text),
+        made once and shared by every build staging the same files.
+
+        The files are written into a new directory next to it, renamed once
+        complete, so builds never see a partial one, and nothing is left
+        behind by a build that fails. Its mtime records when a build last
+        used it, staging new files prunes the others (see prune_staging)."""
+        digest = sha256()
+        for name in sorted(files):
+            digest.update(name.encode() + b'\0' + files[name].encode() + b'\0')
+        staging = self.staging_dir / digest.hexdigest()
+        if staging.is_dir():
+            os.utime(staging)
+            return staging
+        self.prune_staging()
+        tmp = Path(mkdtemp(dir=self.staging_dir, prefix='.tmp-'))
+        try:
+            for name, content in files.items():
+                (tmp / name).parent.mkdir(parents=True, exist_ok=True)
+                (tmp / name).write_text(content)
+            logger.info(f'Staging {sorted(files)} in {staging}')
+            os.replace(tmp, staging)
+        except OSError:
+            # a concurrent build staged the same files first
+            if not staging.is_dir():
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return staging
+
+    def prune_staging(self, max_age: float = STAGING_MAX_AGE) -> list[Path]:
+        """Remove the staged directories no build used for max_age seconds,
+        and what builds that were killed left behind.
+
+        Returns:
+            The removed directories."""
+        cutoff = time.time() - max_age
+        removed = []
+        with os.scandir(self.staging_dir) as entries:
+            for entry in entries:
+                try:
+                    stale = entry.is_dir() and entry.stat().st_mtime < cutoff
+                except FileNotFoundError:  # pruned by a concurrent build
+                    continue
+                if stale:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed.append(Path(entry.path))
+        if removed:
+            logger.info(f'Removed {len(removed)} unused staging directories')
+        return removed
+
+    def fetch(
+        self,
+        requirements: list[str],
+        wheelhouse: Path | None = None,
+        offline: bool = False,
+        index_urls: list[str] = [],
+    ) -> list[Path]:
+        """Build or download the wheels of pinned requirements into the store,
+        without their dependencies, so pip has nothing to resolve. Used for
+        lock files, see lockfile.py.
+
+        Args:
+            requirements: Requirement specifiers naming one version each, or
+                paths and URLs.
+            wheelhouse: A directory of wheels (and sdists) to look into.
+            offline: Don't use the package index.
+            index_urls: Other package indexes to look into.
+
+        Returns:
+            The wheels, in the store."""
+        pip_args = ['--no-deps']
+        for index_url in index_urls:
+            pip_args += ['--extra-index-url', index_url]
+        with TemporaryDirectory() as tmp:
+            if self._pip_wheel(tmp, pip_args + requirements, wheelhouse, offline):
+                raise SystemExit(f'pip failed to fetch {requirements}')
+            return [
+                self.add_wheel(wheel)[0] for wheel in sorted(Path(tmp).glob('*.whl'))
+            ]
+
+    def _pip_wheel(
+        self, wheel_dir: str, args: list[str], wheelhouse: Path | None, offline: bool
+    ) -> int:
+        """Run pip wheel into wheel_dir, finding wheels in the store and the
+        wheelhouse. Returns its exit status."""
+        from pip._internal.utils.entrypoints import _wrapper
+
+        pip_args = [
+            'wheel',
+            '--wheel-dir',
+            wheel_dir,
+            '--find-links',
+            str(self.wheels_dir),
+        ]
+        if wheelhouse is not None:
+            pip_args += ['--find-links', str(wheelhouse)]
+        if offline:
+            pip_args.append('--no-index')
+        pip_args += args
+        logger.info(f'Running pip with args: {pip_args}')
+        with timings.span('pip'):
+            return _wrapper(pip_args)
+
+
+def default_store_dir() -> Path:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_home) / 'zipapp-utils' / 'store'
@@ -1,6 +1,29 @@
 #!/usr/bin/env bash
 
+# the archive is extracted once per user, and runs after that start it directly
+PYZ_CACHE_DIR="${XDG_CACHE_HOME:-${HOME}/.cache}/zipapp-utils/pyz"
+PYZ_FILE="${PYZ_CACHE_DIR}/{{ pyz_sha256 }}.pyz"
+
+if [ -f "${PYZ_FILE}" ]; then
+    exec python3 "${PYZ_FILE}" "$@"
+fi
+{% if payload == 'heredoc' %}
+set -eo pipefail
+mkdir -p "${PYZ_CACHE_DIR}"
+PYZ_TMP_FILE="$(mktemp "${PYZ_CACHE_DIR}/.{{ pyz_sha256 }}.XXXXXX")"
+trap 'rm -f "${PYZ_TMP_FILE}"' EXIT
+{ {{ decoder }}; } > "${PYZ_TMP_FILE}" <<'{{ heredoc_delimiter }}'
+{{ encoded_pyz_file }}{{ heredoc_delimiter }}
+{% else %}
 ENCODED_PYZ_FILE='{{ encoded_pyz_file }}'
 
-echo -n "${ENCODED_PYZ_FILE}" | base64 -d > /tmp/pyz.pyz
-python3 /tmp/pyz.pyz
+set -eo pipefail
+mkdir -p "${PYZ_CACHE_DIR}"
+PYZ_TMP_FILE="$(mktemp "${PYZ_CACHE_DIR}/.{{ pyz_sha256 }}.XXXXXX")"
+trap 'rm -f "${PYZ_TMP_FILE}"' EXIT
+printf '%s' "${ENCODED_PYZ_FILE}" | {{ decoder }} > "${PYZ_TMP_FILE}"
+{% endif %}
+# rename is atomic, concurrent runs never see a partial archive
+mv -f "${PYZ_TMP_FILE}" "${PYZ_FILE}"
+trap - EXIT
+exec python3 "${PYZ_FILE}" "$@"
@@ -0,0 +1,54 @@
+# Added by zipapp-utils: native extensions and data files can't be used from
+# inside the archive, they are extracted once into a per-user cache.
+def _zipapp_utils_extract():
+    import os
+    import sys
+    from importlib.util import spec_from_file_location
+
+    archive = getattr(__loader__, 'archive', None)
+    if archive is None:
+        # not running from an archive, everything is on disk already
+        return
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache'
+    )
+    cache = os.path.join(cache_home, 'zipapp-utils', 'extracted', '{{ key }}')
+    if not os.path.isdir(cache):
+        import shutil
+        import tempfile
+        import zipfile
+
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(cache), prefix='.tmp-')
+        try:
+            with zipfile.ZipFile(archive) as zf:
+                for name in {{ members }}:
+                    path = zf.extract(name, tmp)
+                    mode = zf.getinfo(name).external_attr >> 16 & 0o777
+                    if mode:
+                        os.chmod(path, mode)
+            # atomic, if another process was faster its copy is used
+            os.rename(tmp, cache)
+        except OSError:
+            if not os.path.isdir(cache):
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    extensions = {{ extensions }}
+
+    class ExtractedExtensionFinder:
+        @staticmethod
+        def find_spec(fullname, path=None, target=None):
+            if fullname in extensions:
+                location = os.path.join(cache, extensions[fullname])
+                return spec_from_file_location(fullname, location)
+            return None
+
+    sys.meta_path.insert(0, ExtractedExtensionFinder)
+    sys.path.append(cache)
+
+
+_zipapp_utils_extract()
+del _zipapp_utils_extract
+
@@ -0,0 +1,2 @@
+#!/bin/sh
+exec {{ interpreter }} "$0" "$@"
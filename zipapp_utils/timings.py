@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Timing spans and counters of the phases of a build.
+
+The phases of a build report how long they took (spans) and how much they
+processed (counters) to the subscribed callbacks, as
+callback(kind, name, value) with kind 'span' and value in seconds, or kind
+'counter'. A phase running once per file, like compressing, reports a span
+for every file, from every worker thread. With no subscriber, nothing is
+measured at all.
+
+Spans: resolve (dependencies, and pip within it), verify (hashes of locked
+wheels), tree shake, compile, walk (directory walk, including the filter),
+filter, compress, write, encode. Counters: files, bytes in, bytes out.
+
+TimingRecorder subscribes for the duration of a with block and sums
+everything up:
+
+    with TimingRecorder() as timings:
+        create_archive_zau(...)
+    print(timings.summary())"""
+
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import TypeVar
+
+Callback = Callable[[str, str, float], object]
+T = TypeVar('T')
+
+# a tuple, replaced on change, so emitting needs no lock
+_subscribers: tuple[Callback, ...] = ()
+_subscribers_lock = threading.Lock()
+
+
+def subscribe(callback: Callback) -> None:
+    """Call callback(kind, name, value) for every span and counter."""
+    global _subscribers
+    with _subscribers_lock:
+        _subscribers = (*_subscribers, callback)
+
+
+def unsubscribe(callback: Callback) -> None:
+    global _subscribers
+    with _subscribers_lock:
+        _subscribers = tuple(other for other in _subscribers if other != callback)
+
+
+def enabled() -> bool:
+    return bool(_subscribers)
+
+
+def emit(kind: str, name: str, value: float) -> None:
+    for callback in _subscribers:
+        callback(kind, name, value)
+
+
+def count(name: str, value: float = 1) -> None:
+    if _subscribers:
+        emit('counter', name, value)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the with block as a span called name."""
+    if not _subscribers:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        emit('span', name, time.perf_counter() - start)
+
+
+def timed(name: str, func: Callable[..., T]) -> Callable[..., T]:
+    """func, reporting a span called name for every call, or func itself if
+    nobody is subscribed."""
+    if not _subscribers:
+        return func
+
+    def timed_func(*args, **kwargs) -> T:
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            emit('span', name, time.perf_counter() - start)
+
+    return timed_func
+
+
+def timed_iter(name: str, iterator: Iterator[T]) -> Iterator[T]:
+    """iterator, reporting the time spent producing every item as a span
+    called name."""
+    if not _subscribers:
+        return iterator
+
+    def timed_iterator() -> Iterator[T]:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                emit('span', name, time.perf_counter() - start)
+            yield item
+
+    return timed_iterator()
+
+
+class TimingRecorder:
+    """Sums up the spans and counters reported while it is subscribed."""
+
+    def __init__(self):
+        # name -> [calls, seconds]
+        self.spans: dict[str, list] = {}
+        self.counters: dict[str, float] = {}
+        # wall time of the with block
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+        self._start = 0.0
+
+    def __call__(self, kind: str, name: str, value: float) -> None:
+        with self._lock:
+            if kind == 'span':
+                record = self.spans.setdefault(name, [0, 0.0])
+                record[0] += 1
+                record[1] += value
+            else:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def __enter__(self) -> 'TimingRecorder':
+        subscribe(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.seconds = time.perf_counter() - self._start
+        unsubscribe(self)
+
+    def to_dict(self) -> dict:
+        return {
+            'seconds': self.seconds,
+            'spans': {
+                name: {'calls': calls, 'seconds': seconds}
+                for name, (calls, seconds) in self.spans.items()
+            },
+            'counters': dict(self.counters),
+        }
+
+    def summary(self) -> str:
+        """The spans and counters as a table. Spans of phases running on
+        several threads add up the time of all threads."""
+        lines = [f'{"phase":<22} {"calls":>8} {"seconds":>9}']
+        for name, (calls, seconds) in self.spans.items():
+            lines.append(f'{name:<22} {calls:>8} {seconds:>9.3f}')
+        lines.append(f'{"total":<22} {"":>8} {self.seconds:>9.3f}')
+        for name, value in self.counters.items():
+            lines.append(f'{name:<22} {value:>18,.0f}')
+        return '\n'.join(lines)
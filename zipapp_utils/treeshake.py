@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""Import-graph tree shaking of archive contents.
+
+The sources and wheels an archive is built from are indexed by module name.
+Starting from the entry modules, the import statements of every reached
+module are parsed (never executed) and followed transitively; imports inside
+functions and try blocks count too, and so do importlib.import_module() and
+__import__() calls with a literal name. Everything else that is dynamic has
+to be declared as a module to keep.
+
+The result is an include set for filters.IncludeSetFilter: of the python
+modules and of the files inside packages (the scope), only the reached
+modules, the data files of reached packages and data files matching keep
+patterns are kept. Files outside of packages, like .dist-info directories,
+are never shaken. An extension module can import anything without it showing
+up in any source, so reaching one keeps its whole package."""
+
+import ast
+import zipfile
+from collections.abc import Callable, Iterable, Sequence
+from pathlib import Path
+
+from . import logger
+from .archive import _accept_and_descend, iter_entries, wheel_arcname
+from .filters import PatternFilter
+
+SOURCE_SUFFIX = '.py'
+EXTENSION_SUFFIXES = ('.so', '.pyd')
+
+# import helpers whose literal first argument is a module name
+IMPORT_FUNCTIONS = {'import_module', '__import__'}
+
+
+def module_name(arcname: str) -> tuple[str, bool] | None:
+    """Module name of an archive entry and whether it is an extension module,
+    None if it is not a module. pkg/__init__.py is the module pkg."""
+    directory, _, filename = arcname.rpartition('/')
+    if filename.endswith(SOURCE_SUFFIX):
+        stem, extension = filename[: -len(SOURCE_SUFFIX)], False
+    elif filename.endswith(EXTENSION_SUFFIXES):
+        # mod.cpython-311-x86_64-linux-gnu.so
+        stem, extension = filename.partition('.')[0], True
+    else:
+        return None
+    parts = directory.split('/') if directory else []
+    if stem != '__init__':
+        parts.append(stem)
+    if not parts or not all(part.isidentifier() for part in parts):
+        return None
+    return '.'.join(parts), extension
+
+
+def imported_names(source: bytes, module: str, is_package: bool) -> set[str]:
+    """Names of the modules source imports, resolved to absolute names.
+
+    `from a import b` yields a and a.b, since b may be a submodule."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        logger.warning(f'Cannot parse {module}, not following its imports')
+        return set()
+    package = module if is_package else module.rpartition('.')[0]
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ''
+            if node.level:
+                parent = package.split('.') if package else []
+                if node.level - 1 > len(parent):
+                    continue
+                parent = parent[: len(parent) - (node.level - 1)]
+                base = '.'.join(parent + ([base] if base else []))
+            if base:
+                names.add(base)
+            names.update(
+                f'{base}.{alias.name}' if base else alias.name
+                for alias in node.names
+                if alias.name != '*'
+            )
+        elif (
+            isinstance(node, ast.Call)
+            and node.args
+            and isinstance(node.args[0], ast.Constant)
+            and isinstance(node.args[0].value, str)
+        ):
+            func = node.func
+            func_name = func.attr if isinstance(func, ast.Attribute) else None
+            if isinstance(func, ast.Name):
+                func_name = func.id
+            if func_name in IMPORT_FUNCTIONS:
+                names.add(node.args[0].value)
+    # importing a.b.c runs a and a.b as well
+    for name in list(names):
+        while '.' in name:
+            name = name.rpartition('.')[0]
+            names.add(name)
+    return names
+
+
+class ModuleIndex:
+    """The modules and files of sources and wheels, by archive name.
+
+    Like write_tree, the sources come before the wheels and the first
+    occurrence of a name wins."""
+
+    def __init__(
+        self,
+        sources: Sequence[Path],
+        wheels: Sequence[Path] = (),
+        filter: Callable[[Path], bool] | None = None,
+    ):
+        # arcname -> (wheel or None, path of the file or name of the member)
+        self.files: dict[str, tuple[Path | None, str]] = {}
+        accept, descend = _accept_and_descend(filter)
+        for child, arcname, is_dir in iter_entries(sources, accept, descend):
+            if not is_dir:
+                self.files.setdefault(arcname.as_posix(), (None, str(child)))
+        for wheel in wheels:
+            with zipfile.ZipFile(wheel) as wheel_zf:
+                for info in wheel_zf.infolist():
+                    name = wheel_arcname(info.filename)
+                    if name is None or info.is_dir():
+                        continue
+                    if accept is not None and not accept(Path(name), is_dir=False):
+                        continue
+                    self.files.setdefault(name, (wheel, info.filename))
+
+        # module -> (arcname, is extension module)
+        self.modules: dict[str, tuple[str, bool]] = {}
+        self.packages: set[str] = set()
+        for arcname in self.files:
+            found = module_name(arcname)
+            if found is None:
+                continue
+            name, extension = found
+            is_package = arcname.endswith('/__init__.py')
+            if is_package:
+                self.packages.add(name)
+            # a package wins over a module of the same name, like importlib
+            if name not in self.modules or is_package:
+                self.modules[name] = (arcname, extension)
+        self._wheel_zfs: dict[Path, zipfile.ZipFile] = {}
+
+    def close(self) -> None:
+        for wheel_zf in self._wheel_zfs.values():
+            wheel_zf.close()
+        self._wheel_zfs.clear()
+
+    def __enter__(self) -> 'ModuleIndex':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def read(self, arcname: str) -> bytes:
+        wheel, name = self.files[arcname]
+        if wheel is None:
+            return Path(name).read_bytes()
+        if wheel not in self._wheel_zfs:
+            self._wheel_zfs[wheel] = zipfile.ZipFile(wheel)
+        return self._wheel_zfs[wheel].read(name)
+
+
+def reachable_modules(index: ModuleIndex, roots: Iterable[str]) -> set[str]:
+    """Follow imports from roots through index."""
+    reached: set[str] = set()
+    pending = [name for name in roots if name in index.modules]
+    while pending:
+        name = pending.pop()
+        if name in reached:
+            continue
+        reached.add(name)
+        arcname, extension = index.modules[name]
+        if extension:
+            # keep everything next to it, see the module docstring
+            package = name.rpartition('.')[0] or name
+            pending.extend(
+                other
+                for other in index.modules
+                if other.startswith(f'{package}.') and other not in reached
+            )
+            continue
+        imported = imported_names(index.read(arcname), name, name in index.packages)
+        imported.add(name.rpartition('.')[0])
+        pending.extend(
+            other
+            for other in imported
+            if other in index.modules and other not in reached
+        )
+    return reached
+
+
+def expand_keep_modules(index: ModuleIndex, keep_modules: Iterable[str]) -> set[str]:
+    """A module to keep, or with all its submodules if it is a package."""
+    roots = set()
+    for name in keep_modules:
+        if name not in index.modules:
+            logger.warning(f'Module {name} to keep is not in the archive')
+            continue
+        roots.add(name)
+        if name in index.packages:
+            roots.update(
+                other for other in index.modules if other.startswith(f'{name}.')
+            )
+    return roots
+
+
+def shake(
+    index: ModuleIndex,
+    roots: Iterable[str],
+    keep_modules: Iterable[str] = (),
+    keep_data: Iterable[str] = (),
+) -> tuple[set[str], set[str]]:
+    """Compute what tree shaking keeps.
+
+    Args:
+        index: The contents of the archive.
+        roots: The modules the application starts from.
+        keep_modules: Modules that are imported dynamically.
+        keep_data: .gitignore-style patterns of data files to keep.
+
+    Returns:
+        (include_set, scope): the archive names of the files and directories
+        to keep, and of all the files and directories that are shaken."""
+    reached = reachable_modules(
+        index, [*roots, *expand_keep_modules(index, keep_modules)]
+    )
+    reached_packages = reached & index.packages
+    package_dirs = {name.replace('.', '/') for name in index.packages}
+    # a pattern filter rejects the paths its patterns match
+    keep_data_filter = PatternFilter(Path(), keep_data)
+
+    include_set: set[str] = set()
+    scope: set[str] = set()
+    for arcname in index.files:
+        parents = arcname.split('/')[:-1]
+        dirs = {'/'.join(parents[: i + 1]) for i in range(len(parents))}
+        found = module_name(arcname)
+        if found is not None:
+            keep = found[0] in reached
+        else:
+            # data files belong to the package of the nearest package directory
+            directory = arcname.rpartition('/')[0]
+            while directory and directory not in package_dirs:
+                directory = directory.rpartition('/')[0]
+            if not directory:
+                include_set.update(dirs)
+                continue
+            keep = directory.replace('/', '.') in reached_packages or not (
+                keep_data_filter(Path(arcname), is_dir=False)
+            )
+        scope.add(arcname)
+        scope.update(dirs)
+        if keep:
+            include_set.add(arcname)
+            include_set.update(dirs)
+    logger.info(f'Tree shaking keeps {len(reached)} of {len(index.modules)} modules')
+    return include_set, scope
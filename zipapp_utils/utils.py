@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from logging import Logger
-from typing import Callable
+from logging import INFO, Logger
+from typing import BinaryIO, Callable
+from collections.abc import Sequence
 
 
 def encode_file(file_path: Path) -> str:
@@ -19,6 +22,22 @@ def encode_file(file_path: Path) -> str:
     return b64encode(file_path.read_bytes()).decode()
 
 
+def hash_stream(src: BinaryIO, dst: BinaryIO | None = None) -> str:
+    """Compute the sha256 of src, optionally copying it to dst on the way.
+
+    Returns:
+        The hex digest."""
+
+    from hashlib import sha256
+
+    digest = sha256()
+    while chunk := src.read(1024 * 1024):
+        digest.update(chunk)
+        if dst is not None:
+            dst.write(chunk)
+    return digest.hexdigest()
+
+
 # --------------------
 # force_text and render are
 # copied from jinja2cli/cli.py (pypi: jinja2-cli) and modified
@@ -34,19 +53,16 @@ def force_text(data: str | bytes) -> str:
     return data
 
 
-def render(
-    template_path: Path,
-    data: dict[str, str],
-    extensions: list[str] = [],
-    strict: bool = False,
-) -> str:
+def _environment(
+    directory: Path, extensions: tuple[str, ...], strict: bool = False, loader=None
+):
     from jinja2 import (
         __version__ as jinja_version,
         Environment,
         FileSystemLoader,
         StrictUndefined,
+        Undefined,
     )
-    import os
 
     # Starting with jinja2 3.1, `with_` and `autoescape` are no longer
     # able to be imported, but since they were default, let's stub them back
@@ -58,25 +74,40 @@ def render(
     #     "do",
     #     "loopcontrols",
     # ] + extensions  # copied from jinja2-cli's main func
+    extensions_list = list(extensions)
     if tuple(jinja_version.split(".", 2)) < ("3", "1"):
         for ext in "with_", "autoescape":
             ext = "jinja2.ext." + ext
-            if ext not in extensions:
-                extensions.append(ext)
+            if ext not in extensions_list:
+                extensions_list.append(ext)
 
-    env = Environment(
-        loader=FileSystemLoader(template_path.parent),
-        extensions=extensions,
+    return Environment(
+        loader=loader or FileSystemLoader(directory),
+        extensions=extensions_list,
         keep_trailing_newline=True,
+        undefined=StrictUndefined if strict else Undefined,
+        # render keeps the compiled templates
+        cache_size=0,
     )
-    if strict:
-        env.undefined = StrictUndefined
 
-    # Add environ global
-    env.globals["environ"] = lambda key: force_text(os.environ.get(key, ''))
-    env.globals["get_context"] = lambda: data
 
-    return env.get_template(template_path.name).render(data)
+def render(
+    template_path: Path,
+    data: dict[str, str],
+    extensions: list[str] = [],
+    strict: bool = False,
+) -> str:
+    import os
+
+    template = _cached_template(template_path, tuple(extensions), strict)
+    return template.render(
+        {
+            # Add environ global
+            'environ': lambda key: force_text(os.environ.get(key, '')),
+            'get_context': lambda: data,
+            **data,
+        }
+    )
 
 
 # --------------------
@@ -84,9 +115,123 @@ def render(
 # --------------------
 
 
-def create_main_py(python_script: Path, entry_point: str | None = None) -> Path:
-    """Create a __main__.py file in the same directory."""
-    main_py = python_script.parent / "__main__.py"
+TEMPLATES_DIR = Path(__file__).parent / 'templates'
+# the templates of TEMPLATES_DIR compiled into python modules, which render
+# loads instead of compiling the templates. Written by precompile_templates
+# when the package is built (make templates). This saves lexing, parsing and
+# generating code, not importing Jinja: the compiled modules import
+# jinja2.runtime, and so the jinja2 package, which imports its compiler.
+COMPILED_TEMPLATES_DIR = TEMPLATES_DIR / 'compiled'
+# compiled templates render keeps, the least recently used ones are dropped
+TEMPLATE_CACHE_SIZE = 64
+
+# (path, mtime_ns, extensions, strict) -> jinja2.Template
+_templates: OrderedDict = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+def _cached_template(template_path: Path, extensions: tuple[str, ...], strict: bool):
+    """The compiled template at template_path, compiled again only when the
+    file changes."""
+    template_path = template_path.absolute()
+    key = (template_path, template_path.stat().st_mtime_ns, extensions, strict)
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is not None:
+            _templates.move_to_end(key)
+            return template
+    template = _load_template(template_path, extensions, strict)
+    with _templates_lock:
+        _templates[key] = template
+        while len(_templates) > TEMPLATE_CACHE_SIZE:
+            _templates.popitem(last=False)
+    return template
+
+
+def _load_template(template_path: Path, extensions: tuple[str, ...], strict: bool):
+    if not extensions and _is_precompiled(template_path):
+        from jinja2 import ModuleLoader
+
+        loader = ModuleLoader(COMPILED_TEMPLATES_DIR)
+    else:
+        loader = None
+    environment = _environment(template_path.parent, extensions, strict, loader)
+    return environment.get_template(template_path.name)
+
+
+def _compiled_templates_manifest() -> dict:
+    import json
+
+    try:
+        return json.loads((COMPILED_TEMPLATES_DIR / 'manifest.json').read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_precompiled(template_path: Path) -> bool:
+    """Whether the compiled module of template_path is there, and up to date
+    with it and the installed jinja2."""
+    if template_path.parent != TEMPLATES_DIR.absolute():
+        return False
+    from hashlib import sha256
+    from jinja2 import __version__ as jinja_version
+
+    manifest = _compiled_templates_manifest()
+    compiled = manifest.get('templates', {}).get(template_path.name)
+    return (
+        manifest.get('jinja2') == jinja_version
+        and compiled == sha256(template_path.read_bytes()).hexdigest()
+    )
+
+
+def precompile_templates(target: Path = COMPILED_TEMPLATES_DIR) -> list[str]:
+    """Compile the templates of the package into python modules in target,
+    replacing its content.
+
+    Returns:
+        The names of the compiled templates."""
+    import json
+    import shutil
+    from hashlib import sha256
+    from jinja2 import __version__ as jinja_version
+
+    names = sorted(path.name for path in TEMPLATES_DIR.glob('*.jinja.*'))
+    shutil.rmtree(target, ignore_errors=True)
+    _environment(TEMPLATES_DIR, ()).compile_templates(
+        target, filter_func=lambda name: name in names, zip=None, ignore_errors=False
+    )
+    manifest = {
+        'jinja2': jinja_version,
+        'templates': {
+            name: sha256((TEMPLATES_DIR / name).read_bytes()).hexdigest()
+            for name in names
+        },
+    }
+    (target / 'manifest.json').write_text(json.dumps(manifest, indent=2) + '\n')
+    return names
+
+
+def render_around(
+    template_path: Path, data: dict[str, str], placeholder: str
+) -> tuple[str, str]:
+    """Render a template and split it at the variable `placeholder`.
+
+    Lets a large value be streamed between the two halves instead of being
+    rendered into the template.
+
+    Returns:
+        The rendered text before and after the placeholder."""
+    marker = '@@zipapp-utils-placeholder@@'
+    content = render(template_path, {**data, placeholder: marker})
+    header, found, footer = content.partition(marker)
+    if not found:
+        raise ValueError(f'{placeholder} is not used in {template_path}')
+    return header, footer
+
+
+def render_main_py(python_script: Path, entry_point: str | None = None) -> str:
+    """Render the content of a __main__.py that runs python_script, or
+    entry_point if given."""
     if entry_point is not None:
         # Check that main has the right format.
         # copied from zipapp.py from cpython source
@@ -97,24 +242,32 @@ def create_main_py(python_script: Path, entry_point: str | None = None) -> Path:
         fn_ok = all(part.isidentifier() for part in fn.split('.'))
         if not (sep == ':' and mod_ok and fn_ok):
             raise ZipAppError("Invalid entry point: " + entry_point)
-        main_py_content = MAIN_TEMPLATE.format(module=mod, fn=fn)
-    else:
-        main_py_content = render(
-            Path(__file__).parent / "templates" / "__main__.jinja.py",
-            {'script_name': python_script.stem},
-        )
-    main_py.write_text(main_py_content)
+        return MAIN_TEMPLATE.format(module=mod, fn=fn)
+    return render(
+        TEMPLATES_DIR / "__main__.jinja.py",
+        {'script_name': python_script.stem},
+    )
+
+
+def create_main_py(python_script: Path, entry_point: str | None = None) -> Path:
+    """Create a __main__.py file in the same directory."""
+    main_py = python_script.parent / "__main__.py"
+    main_py.write_text(render_main_py(python_script, entry_point))
     return main_py
 
 
+def set_executable(path: Path) -> None:
+    st = path.stat()
+    path.chmod(st.st_mode | 0o0100)
+
+
 def print_or_write_content(
     output_content: str, output: Path | None = None, make_executable: bool = False
 ) -> None:
     if output:
         output.write_text(output_content)
         if make_executable:
-            st = output.stat()
-            output.chmod(st.st_mode | 0o0100)
+            set_executable(output)
     else:
         print(output)
 
@@ -127,13 +280,35 @@ def create_archive_with_logging(
     main=None,
     filter: Callable[[Path], bool] | None = None,
     compressed: bool = False,
+    jobs: int = 1,
+    incremental: bool = False,
+    extra_sources: Sequence[Path] = (),
+    wheels: Sequence[Path] = (),
+    main_py: str | None = None,
+    compile_bytecode: bool = False,
+    compile_python: str | None = None,
+    sourceless: bool = False,
+    compresslevel: int | None = None,
+    store_incompressible: bool = False,
+    trace: Sequence[str] = (),
+    hot_store_limit: int | None = None,
+    extract: Sequence[str] = (),
+    deterministic: bool = False,
+    skip_unchanged: bool = False,
+    unchanged: Callable[[Path], bool] | None = None,
 ):
-    """zipapp.create_archive with logging"""
-    from zipapp import create_archive
+    """zipapp.create_archive with logging, compressing on `jobs` threads"""
+    from .archive import create_archive
 
-    logger.info(
-        f'Running create_archive with args: {source=}, {target=}, {interpreter=}, {main=}, {filter=}, {compressed=}'
-    )
+    if hot_store_limit is None:
+        from .layout import HOT_STORE_LIMIT
+
+        hot_store_limit = HOT_STORE_LIMIT
+
+    if logger.isEnabledFor(INFO):
+        logger.info(
+            f'Running create_archive with args: {source=}, {target=}, {interpreter=}, {main=}, {filter=}, {compressed=}, {jobs=}, {incremental=}, {extra_sources=}, {wheels=}, {compile_bytecode=}, {compile_python=}, {sourceless=}, {compresslevel=}, {store_incompressible=}, {len(trace)=}, {hot_store_limit=}, {extract=}, {deterministic=}, {skip_unchanged=}'
+        )
     create_archive(
         source=source,
         target=target,
@@ -141,6 +316,21 @@ def create_archive_with_logging(
         main=main,
         filter=filter,
         compressed=compressed,
+        jobs=jobs,
+        incremental=incremental,
+        extra_sources=extra_sources,
+        wheels=wheels,
+        main_py=main_py,
+        compile_bytecode=compile_bytecode,
+        compile_python=compile_python,
+        sourceless=sourceless,
+        compresslevel=compresslevel,
+        store_incompressible=store_incompressible,
+        trace=trace,
+        hot_store_limit=hot_store_limit,
+        extract=extract,
+        deterministic=deterministic,
+        skip_unchanged=skip_unchanged,
+        unchanged=unchanged,
     )
     logger.info(f'create_archive finished')
-
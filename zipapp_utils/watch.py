@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""Rebuilding an archive whenever its sources change.
+
+The source directories are watched with inotify on Linux (through ctypes,
+with a watch on every directory the filter walks into), and polled for
+changed sizes and modification times elsewhere. Changes to files the filter
+excludes are ignored, and a burst of changes, like a branch switch or an
+editor saving several files, triggers a single rebuild once no change has
+been seen for DEBOUNCE seconds. Rebuilds are incremental, see
+incremental.py, so only changed files are compressed again, and the files
+the watcher saw no change to are not even looked at."""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from collections.abc import Callable, Iterable, Sequence
+from pathlib import Path
+
+from . import logger
+from .archive import _accept_and_descend, iter_entries, iter_tree
+
+DEBOUNCE = 0.1
+POLL_INTERVAL = 1.0
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Reports the paths changed under roots, through inotify."""
+
+    def __init__(
+        self, roots: Sequence[Path], descend: Callable[[Path], bool] | None = None
+    ):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._descend = descend
+        # watch descriptor -> (directory, root, path relative to root)
+        self._watches: dict[int, tuple[Path, Path, Path]] = {}
+        for root in roots:
+            self._watch_tree(root, root, Path())
+
+    def _watch_tree(self, directory: Path, root: Path, reldir: Path) -> None:
+        self._watch(directory, root, reldir)
+
+        def descend(relpath: Path) -> bool:
+            # relpath is relative to directory
+            return self._descend is None or self._descend(reldir / relpath)
+
+        for child, relpath, is_dir in iter_tree(directory, descend):
+            if is_dir and not child.is_symlink() and descend(relpath):
+                self._watch(child, root, reldir / relpath)
+
+    def _watch(self, directory: Path, root: Path, reldir: Path) -> None:
+        wd = self._add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            # gone already, or out of watches (fs.inotify.max_user_watches)
+            logger.warning(
+                f'Cannot watch {directory}: {os.strerror(ctypes.get_errno())}'
+            )
+            return
+        self._watches[wd] = (directory, root, reldir)
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+    def wait(self, timeout: float | None = None) -> set[Path] | None:
+        """Wait for changes.
+
+        Returns:
+            The changed paths, relative to the root they are under, or None if
+            nothing changed within timeout. An empty set means changes were
+            lost, because the kernel queue overflowed."""
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return None
+        changed: set[Path] = set()
+        overflowed = False
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflowed = True
+                continue
+            if wd not in self._watches:
+                continue
+            directory, root, reldir = self._watches[wd]
+            if mask & IN_IGNORED:
+                del self._watches[wd]
+                continue
+            relpath = reldir / name if name else reldir
+            changed.add(relpath)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                if self._descend is None or self._descend(relpath):
+                    self._watch_tree(directory / name, root, relpath)
+        return set() if overflowed else changed
+
+
+class PollingWatcher:
+    """Reports the paths changed under roots, comparing snapshots of their
+    sizes and modification times every interval seconds."""
+
+    def __init__(
+        self,
+        roots: Sequence[Path],
+        descend: Callable[[Path], bool] | None = None,
+        interval: float = POLL_INTERVAL,
+    ):
+        self._roots = roots
+        self._descend = descend
+        self._interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict[Path, tuple[Path, int, int]]:
+        # path -> (path relative to its root, size, mtime)
+        snapshot = {}
+        for child, arcname, _ in iter_entries(self._roots, None, self._descend):
+            try:
+                st = child.stat()
+            except OSError:
+                continue
+            snapshot[child] = (arcname, st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def close(self) -> None:
+        pass
+
+    def wait(self, timeout: float | None = None) -> set[Path] | None:
+        """Like InotifyWatcher.wait."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self._interval
+            if deadline is not None:
+                delay = min(delay, deadline - time.monotonic())
+            if delay > 0:
+                time.sleep(delay)
+            snapshot = self._scan()
+            changed = {
+                (snapshot.get(path) or self._snapshot[path])[0]
+                for path in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(path) != self._snapshot.get(path)
+            }
+            self._snapshot = snapshot
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+
+def make_watcher(
+    roots: Sequence[Path], descend: Callable[[Path], bool] | None = None
+) -> InotifyWatcher | PollingWatcher:
+    """An inotify watcher if the platform has inotify, a polling one if not."""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(roots, descend)
+        except (OSError, AttributeError, TypeError) as e:
+            logger.warning(f'Cannot use inotify ({e}), polling for changes')
+    return PollingWatcher(roots, descend)
+
+
+def unchanged_except(
+    roots: Sequence[Path], changed: set[Path]
+) -> Callable[[Path], bool]:
+    """Whether a path is under roots, and neither one of changed (relative
+    to any of roots) nor under one of them."""
+    changed_paths = {root / path for root in roots for path in changed}
+    root_set = set(roots)
+
+    def unchanged(path: Path) -> bool:
+        for parent in (path, *path.parents):
+            if parent in changed_paths:
+                return False
+            if parent in root_set:
+                return True
+        return False
+
+    return unchanged
+
+
+def watch(
+    roots: Sequence[Path],
+    rebuild: Callable[[Callable[[Path], bool] | None], object],
+    filter: Callable[[Path], bool] | None = None,
+    ignore: Iterable[Path] = (),
+    debounce: float = DEBOUNCE,
+) -> None:
+    """Run rebuild now and after every change of the files under roots that
+    filter accepts, until interrupted. ignore are files that don't trigger
+    rebuilds, like the archive itself if it is built inside a root.
+
+    rebuild is passed None the first time, then a function telling the
+    files that did not change since the last successful rebuild, for an
+    incremental build to reuse without looking at them. A failing rebuild
+    is reported and the next change triggers another one."""
+    roots = [Path(root).resolve() for root in roots]
+    ignored = {Path(path).resolve() for path in ignore}
+    accept, descend = _accept_and_descend(filter)
+
+    def relevant(changed: set[Path] | None) -> set[Path]:
+        if changed is None:
+            return set()
+        if not changed:
+            # lost track of what changed, rebuild everything
+            return {Path()}
+        return {
+            path
+            for path in changed
+            if not any(root / path in ignored for root in roots)
+            and (accept is None or accept(path, is_dir=False))
+        }
+
+    def try_rebuild(unchanged: Callable[[Path], bool] | None) -> bool:
+        try:
+            rebuild(unchanged)
+        except (Exception, SystemExit) as e:
+            print(f'Rebuild failed: {e}', file=sys.stderr)
+            return False
+        return True
+
+    watcher = make_watcher(roots, descend)
+    try:
+        built = try_rebuild(None)
+        # the changes since the last successful rebuild
+        pending: set[Path] = set()
+        print(f'Watching {", ".join(map(str, roots))} for changes', file=sys.stderr)
+        while True:
+            changed = relevant(watcher.wait())
+            if not changed:
+                continue
+            while True:
+                more = watcher.wait(debounce)
+                if more is None:
+                    break
+                changed |= relevant(more)
+            start = time.perf_counter()
+            pending |= changed
+            if not try_rebuild(unchanged_except(roots, pending) if built else None):
+                continue
+            built = True
+            pending = set()
+            print(
+                f'{len(changed)} changed, rebuilt in '
+                f'{(time.perf_counter() - start) * 1000:.0f} ms',
+                file=sys.stderr,
+            )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()